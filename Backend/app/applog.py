@@ -0,0 +1,140 @@
+"""
+Structured logging for the backend.
+
+The handlers used print(): a synchronous write to stdout from the request
+path for every login, created item and read, as free text. setup() sends the
+"jemlo.*" loggers through:
+- RateSampler: past `per_second` records of the same message in one second,
+  records below WARNING are dropped and counted (a polling dashboard or a
+  burst of fountain writes no longer floods the log); warnings and errors
+  always pass
+- a bounded queue: the request thread formats the record (JsonFormatter, one
+  JSON object per line with the `extra=` fields) and enqueues it, a
+  QueueListener thread writes stdout. When the queue is full the record is
+  dropped rather than blocking the request
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT_LOGGER = "jemlo"
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateSampler(logging.Filter):
+    def __init__(self, per_second: int = 20):
+        super().__init__()
+        self.per_second = per_second  # 0 = no sampling
+        self.dropped = 0
+        self._second = None
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.per_second <= 0:
+            return True
+        key = (record.name, record.msg)  # the template, not the formatted text
+        second = int(time.monotonic())
+        with self._lock:
+            if second != self._second:
+                self._second = second
+                self._counts.clear()
+            count = self._counts[key] = self._counts.get(key, 0) + 1
+            if count > self.per_second:
+                self.dropped += 1
+                return False
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout, which test runners replace."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+
+_handler = None
+_listener = None
+_sampler = None
+
+
+def setup(level: str = "INFO", per_second: int = 20, max_queue: int = 10000):
+    """(Re)configure the "jemlo" loggers. Safe to call more than once."""
+    global _handler, _listener, _sampler
+    shutdown()
+
+    _sampler = RateSampler(per_second)
+    _handler = _DroppingQueueHandler(queue.Queue(maxsize=max_queue))
+    _handler.setFormatter(JsonFormatter())
+    _handler.addFilter(_sampler)
+
+    output = _StdoutHandler()
+    output.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level.upper())
+    root.addHandler(_handler)
+    root.propagate = False
+
+
+def shutdown():
+    """Write the queued records and detach the handler."""
+    global _handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _handler = None
+
+
+def stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "sampled_out": _sampler.dropped if _sampler else 0,
+        "dropped_queue_full": _handler.dropped if _handler else 0,
+    }
+
+
+atexit.register(shutdown)
@@ -0,0 +1,159 @@
+"""
+Background writer for the admin logs.
+
+add_log used to push each entry to Firebase inline, so every login waited for
+the log write and a brute-force burst caused one write per failed attempt.
+AuditLogger only appends the entry to a bounded in-memory queue; a background
+thread writes the queue in batches, one multi-path update per batch.
+
+When the queue fills up (Firebase slow or a burst of failed logins):
+- above `sample_above` of max_queue, only 1 entry in `sample_every` is kept
+- once max_queue is reached new entries are dropped
+The next batch then carries a "warning" entry saying how many were lost.
+"""
+import logging
+import threading
+from collections import deque
+
+import logstore
+
+logger = logging.getLogger("jemlo.auditlog")
+
+
+class AuditLogger:
+    def __init__(
+        self,
+        write,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        sample_above: float = 0.5,
+        sample_every: int = 10,
+    ):
+        self._write = write  # write(updates) -> None
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_above = sample_above
+        self.sample_every = sample_every
+
+        self._queue = deque()  # multi-path updates of one entry each
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen_while_sampling = 0
+        self._lost_since_flush = 0
+
+        self.queued = 0
+        self.written = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def log(self, message: str, log_type: str = "info") -> bool:
+        """Queue one entry, never blocks. Returns False if it was not kept."""
+        entry = logstore.log_updates(message, log_type)
+        with self._lock:
+            size = len(self._queue)
+            if size >= self.max_queue:
+                self.dropped += 1
+                self._lost_since_flush += 1
+                return False
+            if size >= self.max_queue * self.sample_above:
+                self._seen_while_sampling += 1
+                if self._seen_while_sampling % self.sample_every:
+                    self.sampled_out += 1
+                    self._lost_since_flush += 1
+                    return False
+            else:
+                self._seen_while_sampling = 0
+            self._queue.append(entry)
+            self.queued += 1
+            size += 1
+
+        if size >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self) -> int:
+        """Write everything queued now. Returns the number of entries written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                    lost, self._lost_since_flush = self._lost_since_flush, 0
+                if lost:
+                    batch.append(logstore.log_updates(
+                        f"Audit log overloaded: {lost} entries not recorded", "warning"
+                    ))
+                if not batch:
+                    return written
+
+                updates = {}
+                for entry in batch:
+                    updates.update(entry)
+                try:
+                    self._write(updates)
+                except Exception:
+                    self.failed_flushes += 1
+                    self._requeue(batch, lost)
+                    raise
+                written += len(batch)
+                self.written += len(batch)
+
+    def _requeue(self, batch, lost):
+        with self._lock:
+            if lost:
+                batch = batch[:-1]
+                self._lost_since_flush += lost
+            room = self.max_queue - len(self._queue)
+            kept = batch[:max(room, 0)]
+            self._queue.extendleft(reversed(kept))
+            self.dropped += len(batch) - len(kept)
+            self._lost_since_flush += len(batch) - len(kept)
+
+    # ---------- background worker ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker and write what is still queued."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error writing logs on shutdown")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error writing logs")
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._queue)
+        return {
+            "queued_now": size,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "written": self.written,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
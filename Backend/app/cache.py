@@ -0,0 +1,90 @@
+"""
+Small in-process cache for the admin endpoints.
+
+The dashboard polls the same aggregates every few seconds from every open tab,
+so the results are kept in memory for a short time and shared between
+requests. Entries expire after `ttl` seconds (or their own ttl), the least
+recently used entry is dropped once `maxsize` is reached, and the writers
+invalidate what they change. The same class caches verified tokens and the
+/users profiles read on every admin request.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING or entry[0] <= now:
+                if entry is not MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        """Store value for `ttl` seconds (default: the cache ttl)."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key) -> bool:
+        with self._lock:
+            if self._data.pop(key, MISSING) is MISSING:
+                return False
+            self.invalidations += 1
+            return True
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only the keys for which predicate(key) is true."""
+        with self._lock:
+            if predicate is None:
+                removed = len(self._data)
+                self._data.clear()
+            else:
+                keys = [key for key in self._data if predicate(key)]
+                for key in keys:
+                    del self._data[key]
+                removed = len(keys)
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        """Empty the cache and reset the counters (tests, admin reset)."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,167 @@
+"""
+Maintenance commands for the backend, and the production server.
+
+Run from Backend/app (or /code/app in the container):
+
+    python cli.py serve --workers 4
+    python cli.py rebuild-rollups
+    python cli.py archive-logs --days 90
+    python cli.py rebuild-alerts
+    python cli.py export-timeseries --out /data/analytics
+    python cli.py backfill-by-org
+    python cli.py seal-days
+"""
+import argparse
+import os
+
+
+def cmd_serve(args):
+    """
+    Production mode: uvicorn worker processes, no reload. Each worker
+    builds the app with main.create_app, initialises Firebase in its lifespan
+    and answers 200 on /ready once warmed up. The caches and buffers are per
+    worker; the spool (INGEST_SPOOL_PATH) and the rate limits
+    (RATE_LIMIT_SQLITE_PATH) are only shared between them when both are
+    files. Without INGEST_SPOOL_PATH the accepted readings would be lost on
+    a restart: the server does not start. Without RATE_LIMIT_SQLITE_PATH it
+    runs one worker and refuses more; with both, WEB_CONCURRENCY (2).
+    """
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()  # comme main.py, avant de vérifier la configuration
+    if not os.getenv("INGEST_SPOOL_PATH"):
+        raise SystemExit("INGEST_SPOOL_PATH is not set: the accepted readings would not survive a restart")
+    shared = bool(os.getenv("RATE_LIMIT_SQLITE_PATH"))
+    workers = args.workers or int(os.getenv("WEB_CONCURRENCY") or (2 if shared else 1))
+    if workers > 1 and not shared:
+        raise SystemExit(
+            f"{workers} workers need RATE_LIMIT_SQLITE_PATH: each one would have its own rate limits"
+        )
+
+    # Les workers héritent de l'environnement: /metrics n'est servi qu'avec METRICS_TOKEN
+    os.environ.setdefault("METRICS_REQUIRE_TOKEN", "true")
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        proxy_headers=True,
+        # Même liste que get_client_ip (main.py); None: 127.0.0.1 seulement
+        forwarded_allow_ips=os.getenv("TRUSTED_PROXIES") or None,
+        # Une ligne par requête sur stdout: /metrics compte déjà les requêtes
+        access_log=args.access_log,
+    )
+
+
+def cmd_rebuild_rollups(args):
+    from main import rebuild_rollups
+
+    rollup = rebuild_rollups()
+    total = rollup["total"]
+    print(
+        f"Rollups rebuilt: {total['fountains']} fountains, "
+        f"{round(total['waterLiters'], 2)} L, "
+        f"{round(total['plasticRecycledGrams'], 2)} g"
+    )
+
+
+def cmd_archive_logs(args):
+    from main import archive_logs
+
+    moved = archive_logs(args.days)
+    print(f"{moved} log entries older than {args.days} days archived")
+
+
+def cmd_rebuild_alerts(args):
+    from main import rebuild_alerts_index
+
+    count = rebuild_alerts_index()
+    print(f"Alerts index rebuilt: {count} entries")
+
+
+def cmd_export_timeseries(args):
+    from main import analytics, day_reader
+
+    analytics.load_tree(day_reader.iter_days("/"))
+    analytics.save(args.out)
+    print(f"{analytics.size} rows over {len(analytics.dates)} days written to {args.out}")
+
+
+def cmd_backfill_by_org(args):
+    from main import backfill_by_org
+
+    days = backfill_by_org(args.days_per_batch)
+    print(f"/by_org index written for {days} days")
+
+
+def cmd_seal_days(args):
+    from main import SNAPSHOT_DIR, seal_days
+
+    if not SNAPSHOT_DIR:
+        raise SystemExit("SNAPSHOT_DIR is not set: the snapshots would not be kept")
+    print(f"{seal_days()} days sealed in {SNAPSHOT_DIR}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Jemlo backend maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the API (production)")
+    serve.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    serve.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    serve.add_argument("--workers", type=int, default=None,
+                       help="Worker processes (WEB_CONCURRENCY; more than one needs RATE_LIMIT_SQLITE_PATH)")
+    serve.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_SECONDS", "5")),
+                       help="Seconds an idle keep-alive connection stays open")
+    serve.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", "2048")),
+                       help="Pending connections queued by the kernel")
+    serve.add_argument("--limit-concurrency", type=int, default=None,
+                       help="Answer 503 above this many connections per worker")
+    serve.add_argument("--access-log", action="store_true", help="Log every request")
+    serve.set_defaults(func=cmd_serve)
+
+    rebuild = commands.add_parser(
+        "rebuild-rollups", help="Recompute /rollups from the raw date tree (once, writers stopped)"
+    )
+    rebuild.set_defaults(func=cmd_rebuild_rollups)
+
+    archive = commands.add_parser(
+        "archive-logs", help="Move old /logs entries to /logs_archive/{YYYY-MM}"
+    )
+    archive.add_argument("--days", type=int, default=90, help="Keep this many days in /logs")
+    archive.set_defaults(func=cmd_archive_logs)
+
+    alerts = commands.add_parser(
+        "rebuild-alerts", help="Rebuild the /alerts index from /logs"
+    )
+    alerts.set_defaults(func=cmd_rebuild_alerts)
+
+    export = commands.add_parser(
+        "export-timeseries", help="Write the date tree as columnar .npy files (ANALYTICS_DIR)"
+    )
+    export.add_argument("--out", required=True, help="Target directory")
+    export.set_defaults(func=cmd_export_timeseries)
+
+    backfill = commands.add_parser(
+        "backfill-by-org", help="Build the /by_org/{org}/{date} index from the date tree"
+    )
+    backfill.add_argument("--days-per-batch", type=int, default=30, help="Days per multi-path update")
+    backfill.set_defaults(func=cmd_backfill_by_org)
+
+    seal = commands.add_parser(
+        "seal-days", help="Write the finished days to SNAPSHOT_DIR for read_item (run daily)"
+    )
+    seal.set_defaults(func=cmd_seal_days)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
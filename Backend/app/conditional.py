@@ -0,0 +1,123 @@
+"""
+Conditional GET for the polled admin endpoints.
+
+The dashboard polls fountain_graph, stats_total and fountains every five
+seconds per open tab, and most polls get the same JSON as the previous one.
+Each response stored in the dashboard cache now has a version: a per-process
+counter bumped only when the value stored under its cache key is a new one
+(a write dropped the entry and the refill read other data). The ETag is that
+version, known without serializing or hashing the response, and a request
+whose If-None-Match holds the ETag of the cached entry gets an empty 304
+(raised as an HTTPException, FastAPI sends it without a body) before
+Firebase is called. The responses are marked `no-cache`, so the
+browser sends If-None-Match by itself on every poll.
+
+A refill after the cache ttl is compared with the previous value (a dict
+comparison, once per ttl, not per poll): when nothing changed the version,
+and the clients' copies, stay valid.
+
+Values read from Firebase carry the shared version instead, /rollups/version,
+bumped by every ingest batch in its multi-path update (ingest.py): main.py
+reads it before and after the data, and when both reads agree the value is
+the database as of that version, on every worker. Its ETag is then that
+version, so a client switching worker still gets a 304. Otherwise (a write
+landed during the read, answers computed from the analytics store) the ETag
+carries a random per-process epoch, so the versions of two workers, or of a
+restarted one, never match by accident.
+"""
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match check, weak comparison (RFC 9110 13.1.2)."""
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def shared_key(key) -> str:
+    """
+    Digest of a cache key, the same in every process: a shared version names
+    a database state, the key says which response of it (another
+    organisation's fountains have the same version).
+    """
+    return hashlib.sha1(json.dumps(key, default=sorted).encode()).hexdigest()[:12]
+
+
+class ResponseVersions:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0  # bumped for every new value
+        self._tags = OrderedDict()  # cache key -> (etag, value)
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.full = 0
+
+    def etag(self, key, value, version: Optional[int] = None) -> str:
+        """
+        ETag of the response `value` for `key`, kept while the value stays
+        equal. `version`: the shared version `value` was read at, if known.
+        """
+        with self._lock:
+            entry = self._tags.get(key)
+            # Same object on a cache hit: no comparison at all. An equal value
+            # keeps its tag, unless it was a per-process one and can be shared
+            if entry is not None and (entry[1] is value or entry[1] == value) \
+                    and (version is None or not entry[0].startswith(self.epoch, 3)):
+                self._tags[key] = (entry[0], value)
+                self._tags.move_to_end(key)
+                return entry[0]
+            if version is None:
+                self.version += 1
+                etag = f'W/"{self.epoch}-{self.version}"'
+            else:
+                etag = f'W/"v{version}-{shared_key(key)}"'
+            self._tags[key] = (etag, value)
+            self._tags.move_to_end(key)
+            while len(self._tags) > self.maxsize:
+                self._tags.popitem(last=False)
+            return etag
+
+    def check(self, key, value, if_none_match: Optional[str] = None, response: Response = None,
+              version: Optional[int] = None):
+        """
+        Return `value`, with its ETag on `response`, or raise a 304
+        HTTPException when If-None-Match already holds this version.
+        """
+        etag = self.etag(key, value, version)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.not_modified += 1
+            raise HTTPException(status_code=304, headers=headers)
+        self.full += 1
+        if response is not None:
+            response.headers.update(headers)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._tags.clear()
+            self.not_modified = self.full = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._tags)
+        answered = self.not_modified + self.full
+        return {
+            "entries": entries,
+            "version": self.version,
+            "not_modified": self.not_modified,
+            "full": self.full,
+            "not_modified_ratio": round(self.not_modified / answered, 3) if answered else 0.0,
+        }
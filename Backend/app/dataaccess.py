@@ -0,0 +1,185 @@
+"""
+Run the blocking Firebase Admin SDK and HTTP calls outside the asyncio loop.
+
+The async endpoints used to call db.reference(...).get() and friends directly,
+so one slow Firebase read froze every other request of the uvicorn worker.
+BlockingPool sends these calls to a bounded thread pool instead:
+
+    data = await firebase_pool.run(db.reference("/logs").get)
+
+- max_workers: how many blocking calls run at the same time
+- max_pending: calls running + waiting before new ones are refused (503)
+- timeout:     seconds an endpoint waits for one call before giving up (504)
+
+With `key=`, concurrent calls for the same key share one execution (single
+flight): when ten dashboards open at 9 a.m. the stats are read once and the
+ten requests await that read. The key names what is read (path, query,
+organisation); a waiter that goes away does not cancel the read for the
+others, and an error is shared like a result.
+
+DayReader reads the /{date} children of a node for the analytics load, the
+fountains of an organisation and the offline commands, which used to get
+the whole node (or the root, with /users, /logs...) as one dict.
+"""
+import asyncio
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+import rollups
+
+
+class BackendBusyError(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Serveur surchargé, réessayez plus tard")
+
+
+class BackendTimeoutError(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=504, detail="La base de données ne répond pas")
+
+
+class BlockingPool:
+    def __init__(self, max_workers: int = 16, max_pending: int = 256,
+                 timeout: float = 10.0, name: str = "firebase"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = {}  # key -> asyncio.Task
+        self.calls = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.coalesced = 0
+
+    async def run(self, func, *args, call_timeout: float = None, key=None, **kwargs):
+        """
+        Call func(*args, **kwargs) in the pool and await its result. With a
+        key, join the call already running for that key if there is one.
+        """
+        if key is None:
+            return await self._run(func, args, kwargs, call_timeout)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(func, args, kwargs, call_timeout))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._landed, key))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _landed(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every waiter went away
+
+    async def _run(self, func, args, kwargs, call_timeout):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise BackendBusyError()
+            self._pending += 1
+            self.calls += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            return await asyncio.wait_for(future, call_timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # The thread keeps running until the SDK's own HTTP timeout
+            with self._lock:
+                self.timeouts += 1
+            raise BackendTimeoutError() from None
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "coalesced": self.coalesced,
+                "in_flight_keys": len(self._in_flight),
+            }
+
+
+class DayReader:
+    """
+    The date keys come from one shallow read (`true` per child, the other
+    top-level nodes are not downloaded), then the days are read by key range,
+    `days_per_read` at a time, at most `max_workers` reads in flight, and
+    handed out in date order as they arrive. Memory is bounded by the reads
+    in flight, not by the window or the database size.
+
+        read_keys(path) -> {key: True}
+        read_range(path, first, last) -> {date: node}
+    """
+
+    def __init__(self, read_keys, read_range, max_workers: int = 4, days_per_read: int = 7):
+        self.read_keys = read_keys
+        self.read_range = read_range
+        self.max_workers = max_workers
+        self.days_per_read = days_per_read
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="day-reader")
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.days = 0
+
+    def keys(self, path: str = "/", start: Optional[str] = None, end: Optional[str] = None) -> list:
+        """Sorted date keys under path, between start and end (inclusive)."""
+        return sorted(
+            key for key in (self.read_keys(path) or {})
+            if rollups.is_date_key(key) and (start is None or key >= start) and (end is None or key <= end)
+        )
+
+    def iter_days(self, path: str = "/", start: Optional[str] = None, end: Optional[str] = None):
+        """Yield (date, node) for the days under path between start and end, in date order."""
+        keys = self.keys(path, start, end)
+        chunks = [keys[i:i + self.days_per_read] for i in range(0, len(keys), self.days_per_read)]
+        in_flight = deque()
+        try:
+            for chunk in chunks:
+                in_flight.append(self._executor.submit(self._read, path, chunk[0], chunk[-1]))
+                if len(in_flight) >= self.max_workers:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+        finally:
+            for future in in_flight:  # the caller stopped early
+                future.cancel()
+
+    def _read(self, path: str, first: str, last: str) -> list:
+        tree = self.read_range(path, first, last) or {}
+        days = [(key, tree[key]) for key in sorted(tree) if rollups.is_date_key(key)]
+        with self._lock:
+            self.reads += 1
+            self.days += len(days)
+        return days
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "days_per_read": self.days_per_read,
+                "reads": self.reads,
+                "days": self.days,
+            }
@@ -0,0 +1,86 @@
+"""
+Long-lived HTTP client for the Firebase Identity Toolkit password check.
+
+admin_login used to `import requests` and open a new TCP+TLS connection to
+identitytoolkit.googleapis.com for every login. This client is created once
+(app lifespan), keeps its connections alive between logins and retries the
+transient failures (network errors, 429, 5xx) with exponential backoff.
+
+IDENTITY_TOOLKIT_URL can point it at a local stub server for tests and
+benchmarks. `observe(outcome, seconds, response_bytes)` is called after each
+HTTP attempt (outcome: the status code, or "error"), for the metrics.
+"""
+import asyncio
+import time
+
+import httpx
+
+DEFAULT_BASE_URL = "https://identitytoolkit.googleapis.com"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class IdentityToolkitClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = 5.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        retries: int = 2,
+        backoff: float = 0.2,
+        transport: httpx.AsyncBaseTransport = None,
+        observe=None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self._transport = transport
+        self._observe = observe
+        self._client = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self._transport,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def sign_in_with_password(self, email: str, password: str) -> httpx.Response:
+        """POST accounts:signInWithPassword, a 200 means the password is right."""
+        await self.start()
+        payload = {"email": email, "password": password, "returnSecureToken": True}
+
+        for attempt in range(self.retries + 1):
+            last_try = attempt == self.retries
+            started = time.perf_counter()
+            try:
+                response = await self._client.post(
+                    "/v1/accounts:signInWithPassword",
+                    params={"key": self.api_key},
+                    json=payload,
+                )
+            except httpx.TransportError:
+                if self._observe:
+                    self._observe("error", time.perf_counter() - started, 0)
+                if last_try:
+                    raise
+            else:
+                if self._observe:
+                    self._observe(str(response.status_code), time.perf_counter() - started, len(response.content))
+                if response.status_code not in RETRY_STATUS or last_try:
+                    return response
+            await asyncio.sleep(self.backoff * (2 ** attempt))
@@ -0,0 +1,351 @@
+"""
+Write buffer for the fountain readings.
+
+Readings are cumulative per (date, organisation, machine), so when a fountain
+sends several readings before the next flush only the last one matters. The
+buffer keeps one pending value per key and a background thread writes them all
+in a single multi-path update (raw node + rollup increments) every
+`flush_interval` seconds, or sooner once `flush_size` keys are waiting.
+
+Fountains in delta mode send increments instead (add_deltas): the deltas of a
+key are summed and written as server-side increments, one per counter and
+flush, so the write volume does not grow with the event rate.
+
+The previous value of each machine is needed to move the rollups by the right
+amount. The buffer remembers what it wrote for the current day and only reads
+/{date}/{org} from Firebase the first time it sees an organisation that day.
+Those values are only right while this buffer is the one writing (in main.py
+the spool lease makes one replayer the writer): each batch also sets
+/ingest_batches/latest to its id, and a flush that finds another id there
+forgets what it remembered and reads the values again. One small read per
+flush, and the whole batch still goes out as one multi-path update.
+
+A multi-path update is atomic, and each one also writes a marker,
+/ingest_batches/{date}/{batch id}. After a failed write (a timeout may come
+after Firebase applied it) the next flush reads the marker: the batch is
+re-sent only if it was not applied, so increments are never added twice.
+Markers older than yesterday are deleted on the first flush of a day. The
+same update increments /rollups/version, the shared version the dashboard
+ETags are built from (conditional.py).
+
+In main.py the readings reach the buffer through the spool (spool.py), whose
+replayer calls flush() itself.
+"""
+import logging
+import threading
+import uuid
+from datetime import date as Date, timedelta
+
+import rollups
+
+BATCH_ROOT = "ingest_batches"
+LATEST_BATCH = f"{BATCH_ROOT}/latest"  # id of the last batch written, by any writer
+
+logger = logging.getLogger("jemlo.ingest")
+
+
+class BufferFullError(Exception):
+    """Raised when accepting the readings would exceed max_pending keys."""
+
+
+class WriteBuffer:
+    def __init__(
+        self,
+        read,
+        write,
+        on_flush=None,
+        max_pending: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 2.0,
+    ):
+        # read(path, shallow) -> value, write(updates) -> None,
+        # on_flush({(date, org, machine): values written})
+        self._read = read
+        self._write = write
+        self._on_flush = on_flush
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._pending = {}        # (date, org, machine) -> values
+        self._pending_deltas = {} # (date, org, machine) -> summed increments
+        self._unconfirmed = None  # (marker path, updates, written) of a failed write
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # What is stored in Firebase, so flushes do not re-read it
+        self._day = None
+        self._last = {}           # (date, org, machine) -> values
+        self._loaded_orgs = set() # (date, org) whose machines are in _last
+        self._known_machines = {} # org -> set of machines with a rollup entry
+        self._latest = None       # LATEST_BATCH as this buffer last left it
+
+        self.accepted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    # ---------- producer side ----------
+
+    def add_many(self, readings):
+        """
+        Queue (date, org, machine, values) readings. Either all of them are
+        accepted or BufferFullError is raised and none are. A reading replaces
+        the deltas pending for its machine: it is the machine's own total.
+        """
+        with self._lock:
+            self._check_room(readings)
+            for date, org, machine, values in readings:
+                key = (date, org, machine)
+                if key in self._pending or self._pending_deltas.pop(key, None) is not None:
+                    self.coalesced += 1
+                self._pending[key] = values
+            self.accepted += len(readings)
+            pending = len(self._pending) + len(self._pending_deltas)
+
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def add(self, date: str, org: str, machine: str, values: dict):
+        self.add_many([(date, org, machine, values)])
+
+    def add_deltas(self, deltas):
+        """
+        Queue (date, org, machine, increments) deltas, all or none like
+        add_many. Deltas of a machine are summed; a delta for a machine with
+        a pending reading is added to that reading.
+        """
+        with self._lock:
+            self._check_room(deltas)
+            for date, org, machine, delta in deltas:
+                key = (date, org, machine)
+                if key in self._pending:
+                    self._pending[key] = rollups.add_values(self._pending[key], delta)
+                    self.coalesced += 1
+                elif key in self._pending_deltas:
+                    self._pending_deltas[key] = rollups.add_values(self._pending_deltas[key], delta)
+                    self.coalesced += 1
+                else:
+                    self._pending_deltas[key] = rollups.machine_values(delta)
+            self.accepted += len(deltas)
+            pending = len(self._pending) + len(self._pending_deltas)
+
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def _check_room(self, rows):
+        pending = len(self._pending) + len(self._pending_deltas)
+        new_keys = {(d, o, m) for d, o, m, _ in rows} - self._pending.keys() - self._pending_deltas.keys()
+        if pending + len(new_keys) > self.max_pending:
+            self.rejected += len(rows)
+            raise BufferFullError(f"{pending} readings waiting for Firebase")
+
+    # ---------- flush ----------
+
+    def flush(self, checkpoint=None, guard=None) -> int:
+        """
+        Write every pending reading and delta now. Returns the number of keys written.
+
+        checkpoint: (path, value) also set by the batch's update, for the
+        caller to tell later whether it was applied (SpoolReplayer writes the
+        last spool seq there). guard(): called right before each write, an
+        exception from it stops the flush with nothing sent.
+        """
+        flushed = []
+        try:
+            with self._flush_lock:
+                if self._unconfirmed:
+                    flushed.append(self._retry_unconfirmed(guard))
+
+                with self._lock:
+                    batch, self._pending = self._pending, {}
+                    deltas, self._pending_deltas = self._pending_deltas, {}
+                if not batch and not deltas:
+                    return sum(len(written) for written in flushed)
+
+                try:
+                    self._unconfirmed = self._build_updates(batch, deltas)
+                except Exception:
+                    # Nothing was sent (a read failed): queue the rows again
+                    self.failed_flushes += 1
+                    self._requeue(batch, deltas)
+                    raise
+                if checkpoint is not None:
+                    path, value = checkpoint
+                    self._unconfirmed[1][path.strip("/")] = value
+                flushed.append(self._send(guard))
+        finally:
+            if self._on_flush:
+                for written in flushed:
+                    self._on_flush(written)
+        return sum(len(written) for written in flushed)
+
+    def _send(self, guard=None) -> dict:
+        _, updates, _ = self._unconfirmed
+        if guard is not None:
+            guard()
+        try:
+            self._write(updates)
+        except Exception:
+            self.failed_flushes += 1
+            raise
+        return self._confirmed()
+
+    def _retry_unconfirmed(self, guard=None) -> dict:
+        marker, _, _ = self._unconfirmed
+        if self._read(marker, True) is not None:
+            return self._confirmed()  # applied, only the answer was lost
+        return self._send(guard)
+
+    def read_marker(self, path: str):
+        """Value of a marker or checkpoint written by a batch (None if absent)."""
+        return self._read(path, True)
+
+    def reset(self):
+        """
+        Drop everything pending, the unconfirmed batch and the remembered
+        values: another writer took over the rows (see SpoolReplayer).
+        """
+        with self._flush_lock, self._lock:
+            self._pending, self._pending_deltas, self._unconfirmed = {}, {}, None
+            self._last, self._loaded_orgs, self._known_machines = {}, set(), {}
+            self._latest = None
+
+    def _confirmed(self) -> dict:
+        marker, _, written = self._unconfirmed
+        self._unconfirmed = None
+        self._latest = marker.rsplit("/", 1)[1]
+        self._last.update(written)
+        for date, org, machine in written:
+            self._known_machines.setdefault(org, set()).add(machine)
+        self.flushes += 1
+        return written
+
+    def _requeue(self, batch: dict, deltas: dict):
+        with self._lock:
+            # Keep the readings that arrived since, they are newer
+            for key, values in batch.items():
+                self._pending.setdefault(key, values)
+            for key, delta in deltas.items():
+                if key in self._pending:
+                    continue
+                self._pending_deltas[key] = rollups.add_values(self._pending_deltas.get(key), delta)
+
+    def _build_updates(self, batch: dict, deltas: dict):
+        latest_day = max(date for date, _, _ in list(batch) + list(deltas))
+        updates, written, seen = {}, {}, set()
+        self._check_latest()
+        if self._day is None or latest_day > self._day:
+            # New day: yesterday's values will not be needed anymore
+            self._day = latest_day
+            self._last = {k: v for k, v in self._last.items() if k[0] >= latest_day}
+            self._loaded_orgs = {k for k in self._loaded_orgs if k[0] >= latest_day}
+            keep_from = (Date.fromisoformat(latest_day) - timedelta(days=1)).isoformat()
+            for day in self._read(f"/{BATCH_ROOT}", True) or {}:
+                if rollups.is_date_key(day) and day < keep_from:
+                    updates[f"{BATCH_ROOT}/{day}"] = None
+
+        for (date, org, machine), values in sorted(batch.items()):
+            previous = self._previous(date, org, machine)
+            known = machine in self._machines_of(org) or (org, machine) in seen
+            machine_updates = rollups.event_updates(
+                date, org, machine, values, previous=previous, machine_known=known
+            )
+            rollups.merge_updates(updates, machine_updates)
+            written[(date, org, machine)] = machine_updates[f"{date}/{org}/{machine}"]
+            seen.add((org, machine))
+
+        for (date, org, machine), delta in sorted(deltas.items()):
+            previous = self._previous(date, org, machine)
+            known = machine in self._machines_of(org) or (org, machine) in seen
+            machine_updates = rollups.delta_updates(
+                date, org, machine, delta, first_of_day=previous is None, machine_known=known
+            )
+            if not machine_updates:
+                continue
+            rollups.merge_updates(updates, machine_updates)
+            # What this worker knows of the total; other writers' deltas come
+            # back through the live feed and the analytics refresh
+            written[(date, org, machine)] = rollups.add_values(previous, delta)
+            seen.add((org, machine))
+
+        batch_id = uuid.uuid4().hex
+        marker = f"{BATCH_ROOT}/{latest_day}/{batch_id}"
+        updates[marker] = {".sv": "timestamp"}
+        updates[LATEST_BATCH] = batch_id
+        updates[rollups.VERSION_PATH] = rollups.increment(1)
+        return f"/{marker}", updates, written
+
+    def _check_latest(self):
+        """Forget the remembered values if another writer wrote since this buffer's last batch."""
+        latest = self._read(f"/{LATEST_BATCH}", True)
+        if latest != self._latest:
+            self._last, self._loaded_orgs, self._known_machines = {}, set(), {}
+            self._latest = latest
+
+    def _previous(self, date, org, machine):
+        key = (date, org, machine)
+        if key in self._last:
+            return self._last[key]
+        if (date, org) in self._loaded_orgs:
+            return None
+        stored = self._read(f"/{date}/{org}", False) or {}
+        if date >= (self._day or date):
+            for machine_id, node in stored.items():
+                if isinstance(node, dict):
+                    self._last[(date, org, machine_id)] = rollups.machine_values(node)
+            self._loaded_orgs.add((date, org))
+        node = stored.get(machine)
+        return node if isinstance(node, dict) else None
+
+    def _machines_of(self, org):
+        if org not in self._known_machines:
+            keys = self._read(f"/{rollups.ROLLUP_ROOT}/machines/{org}", True) or {}
+            self._known_machines[org] = set(keys)
+        return self._known_machines[org]
+
+    # ---------- background worker ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker and write what is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error flushing readings")
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending) + len(self._pending_deltas)
+        if self._unconfirmed:
+            pending += len(self._unconfirmed[2])
+        return {
+            "pending": pending,
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
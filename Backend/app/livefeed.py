@@ -0,0 +1,244 @@
+"""
+Live dashboard updates over Server-Sent Events.
+
+Every open admin tab used to poll /api/admin/fountain_graph every 5 seconds,
+so the load on the backend and on Firebase grew with the number of tabs.
+LiveFeed holds a single Firebase listener on today's /{date} node for the
+whole process, while at least one dashboard is connected. Each change is
+turned into per-machine deltas (what bottles / water / plastic moved by) and
+pushed to the asyncio queue of every subscriber allowed to see that
+organisation.
+
+Ordering: publish() runs under `lock` and numbers its batches; a subscriber
+takes its snapshot under the same lock and ignores batches numbered at or
+below the snapshot, so nothing is counted twice or missed. A subscriber that
+does not keep up gets `overflowed` set and is sent a fresh snapshot.
+
+With keep_open (replica mode, see replica.py) the listener stays open without
+subscribers, and the copy of today's node it maintains answers read_item.
+"""
+import asyncio
+import copy
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+
+def _set(tree: dict, segments: list, value):
+    node = tree
+    for segment in segments[:-1]:
+        child = node.get(segment)
+        if not isinstance(child, dict):
+            if value is None:
+                return
+            child = node[segment] = {}
+        node = child
+    if value is None:
+        node.pop(segments[-1], None)
+    else:
+        node[segments[-1]] = value
+
+
+def _machines_under(tree: dict, segments: list) -> set:
+    """(org, machine) pairs at or below `segments` (0 or 1 segment long)."""
+    orgs = tree if not segments else {segments[0]: tree.get(segments[0])}
+    return {
+        (org, machine)
+        for org, machines in orgs.items() if isinstance(machines, dict)
+        for machine in machines
+    }
+
+
+def apply_event(tree: dict, event_type: str, path: str, data) -> set:
+    """
+    Apply one Firebase 'put' / 'patch' event (path relative to the day node)
+    to `tree` in place. Returns the (org, machine) pairs it touched.
+    """
+    base = [segment for segment in path.split("/") if segment]
+    if event_type == "patch" and isinstance(data, dict):
+        writes = [(base + [s for s in key.split("/") if s], value) for key, value in data.items()]
+    else:
+        writes = [(base, data)]
+
+    touched = set()
+    for segments, value in writes:
+        if len(segments) >= 2:
+            touched.add((segments[0], segments[1]))
+        else:
+            touched |= _machines_under(tree, segments)
+        if segments:
+            _set(tree, segments, value)
+        else:
+            tree.clear()
+            tree.update(value if isinstance(value, dict) else {})
+        if len(segments) < 2:
+            touched |= _machines_under(tree, segments)
+    return touched
+
+
+class Subscription:
+    def __init__(self, org, loop, snapshot, max_queue: int):
+        self.org = org  # None: every organisation (super admin)
+        self.loop = loop
+        self.snapshot = snapshot  # snapshot() -> dict, called under LiveFeed.lock
+        self.queue = asyncio.Queue(max_queue)
+        self.seen = 0  # last batch number included in the snapshot sent
+        self.overflowed = False
+
+    def _put(self, item):
+        # Runs in the subscriber's event loop
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class LiveFeed:
+    def __init__(self, listen, on_change, today=None, max_queue: int = 100, keep_open: bool = False):
+        self._listen = listen  # listen(path, callback) -> registration with close()
+        self._on_change = on_change  # on_change([(date, org, machine, values)])
+        self._today = today or (lambda: str(datetime.today())[:10])
+        self.max_queue = max_queue
+        self.keep_open = keep_open  # listen even when no dashboard is connected
+        self.lock = threading.RLock()
+        self._listener_lock = threading.Lock()
+
+        self._subscribers = set()
+        self._registration = None
+        self._day = None
+        self._tree = {}
+        self._primed = False  # the first event (the whole day node) was received
+        self._seq = 0
+        self.last_event_at = None  # time.monotonic() of the last event
+
+        self.events = 0
+        self.published = 0
+        self.overflows = 0
+        self.listener_starts = 0
+
+    # ---------- subscribers ----------
+
+    def subscribe(self, org, loop, snapshot):
+        """Register a dashboard. Blocking (may open the listener): run it in the pool."""
+        subscription = Subscription(org, loop, snapshot, self.max_queue)
+        with self.lock:
+            self._subscribers.add(subscription)
+        self.ensure_listener()
+        return subscription, self.resync(subscription)
+
+    def resync(self, subscription) -> dict:
+        """Fresh snapshot for `subscription`; older queued batches will be skipped."""
+        with self.lock:
+            if subscription.overflowed:
+                self.overflows += 1
+            subscription.overflowed = False
+            subscription.seen = self._seq
+            return subscription.snapshot()
+
+    def unsubscribe(self, subscription):
+        """Never blocks: the last one out closes the listener in the background."""
+        with self.lock:
+            self._subscribers.discard(subscription)
+            if self._subscribers or self.keep_open or self._registration is None:
+                return
+            registration, self._registration, self._day = self._registration, None, None
+        threading.Thread(target=registration.close, name="live-feed-close", daemon=True).start()
+
+    def publish(self, changes: list):
+        """Queue [(date, org, machine, delta)] for the subscribers that may see them."""
+        if not changes:
+            return
+        with self.lock:
+            self._seq += 1
+            self.published += 1
+            entries = [{"date": date, "org": org, "machine": machine, **delta}
+                       for date, org, machine, delta in changes]
+            for subscription in list(self._subscribers):
+                items = [e for e in entries if subscription.org in (None, e["org"])]
+                if not items:
+                    continue
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._put, (self._seq, items))
+                except RuntimeError:  # loop closed, the client is gone
+                    self._subscribers.discard(subscription)
+
+    # ---------- Firebase listener ----------
+
+    def today(self) -> str:
+        return self._today()
+
+    @property
+    def listening_to(self) -> Optional[str]:
+        """Day of the open listener, None when closed."""
+        with self.lock:
+            return self._day if self._registration is not None else None
+
+    def ensure_listener(self):
+        """Open the listener on today's node if dashboards are connected (call it periodically)."""
+        with self._listener_lock:  # the HTTP connection is opened outside self.lock
+            with self.lock:
+                day = self._today()
+                wanted = self._subscribers or self.keep_open
+                if not wanted or (self._registration is not None and self._day == day):
+                    return
+                old, self._registration = self._registration, None
+                self._day, self._tree, self._primed = day, {}, False
+            registration = self._listen(f"/{day}", lambda event: self._on_event(day, event))
+            with self.lock:
+                self.listener_starts += 1
+                if self._subscribers or self.keep_open:
+                    self._registration, registration = registration, None
+                else:  # the last dashboard left while connecting
+                    self._day = None
+            for stale in (old, registration):
+                if stale is not None:
+                    stale.close()
+
+    def _on_event(self, day, event):
+        # Runs in the listener thread
+        with self.lock:
+            if day != self._day:
+                return
+            self.events += 1
+            self.last_event_at = time.monotonic()
+            self._primed = True
+            touched = apply_event(self._tree, event.event_type, event.path, event.data)
+            rows = []
+            for org, machine in sorted(touched):
+                machines = self._tree.get(org)
+                values = machines.get(machine) if isinstance(machines, dict) else None
+                rows.append((day, org, machine, values if isinstance(values, dict) else {}))
+        if rows:
+            self._on_change(rows)
+
+    def day_node(self, day: str):
+        """
+        Copy of the /{day} node as the listener last saw it: None when the
+        listener is not on that day or has not received the node yet.
+        """
+        with self.lock:
+            if day != self._day or self._registration is None or not self._primed:
+                return None
+            return copy.deepcopy(self._tree)
+
+    def close(self):
+        with self.lock:
+            self._subscribers.clear()
+            registration, self._registration, self._day = self._registration, None, None
+        if registration is not None:
+            registration.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "listening_to": self._day,
+                "listener_starts": self.listener_starts,
+                "events": self.events,
+                "published": self.published,
+                "overflows": self.overflows,
+                "last_event_age_seconds": (
+                    round(time.monotonic() - self.last_event_at, 3) if self.last_event_at is not None else None
+                ),
+            }
@@ -0,0 +1,121 @@
+"""
+Time-ordered storage of the admin logs.
+
+    /logs/{push_id}                 -> every entry (login, failed_login, ...)
+    /alerts/{push_id}               -> copy of the failed_login entries only
+    /logs_archive/{YYYY-MM}/{push_id} -> entries moved out by archive_logs
+
+Firebase push ids start with the creation time, so ordering by key is ordering
+by time and needs no index rule: the latest entries are
+order_by_key().limit_to_last(n), and a push id is also a stable pagination
+cursor (`before` / `after`). The ids are generated here so that an entry and
+its alert copy are written in one multi-path update.
+"""
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+LOGS_PATH = "logs"
+ALERTS_PATH = "alerts"
+ARCHIVE_PATH = "logs_archive"
+ALERT_TYPES = {"failed_login"}
+ALERTS_MIGRATION = "alerts"  # /migrations/alerts, set by rebuild-alerts
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_random = [0] * 12
+
+
+def _encode_time(ms: int) -> str:
+    chars = []
+    for _ in range(8):
+        chars.append(PUSH_CHARS[ms % 64])
+        ms //= 64
+    return "".join(reversed(chars))
+
+
+def push_id(now_ms: Optional[int] = None) -> str:
+    """Same format as the ids Firebase push() creates (time-ordered, 20 chars)."""
+    global _last_push_time
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    with _push_lock:
+        if now_ms == _last_push_time:
+            # Same millisecond: increment the random part to keep the order
+            for i in range(11, -1, -1):
+                if _last_random[i] != 63:
+                    _last_random[i] += 1
+                    break
+                _last_random[i] = 0
+        else:
+            _last_push_time = now_ms
+            for i in range(12):
+                _last_random[i] = random.randrange(64)
+        suffix = "".join(PUSH_CHARS[i] for i in _last_random)
+    return _encode_time(now_ms) + suffix
+
+
+def key_prefix(when: datetime) -> str:
+    """Smallest key created at `when`: end_at(prefix) returns only older entries."""
+    return _encode_time(int(when.timestamp() * 1000))
+
+
+def log_updates(message: str, log_type: str = "info", key: Optional[str] = None,
+                now: Optional[datetime] = None) -> dict:
+    """Multi-path update writing one log entry (and its alert copy)."""
+    now = now or datetime.now()
+    key = key or push_id(int(now.timestamp() * 1000))
+    entry = {
+        "timestamp": now.isoformat(),
+        "message": message,
+        "type": log_type,
+    }
+    updates = {f"{LOGS_PATH}/{key}": entry}
+    if log_type in ALERT_TYPES:
+        updates[f"{ALERTS_PATH}/{key}"] = entry
+    return updates
+
+
+def page(data: Optional[dict], limit: int, cursor: Optional[str] = None,
+         newer: bool = False) -> list:
+    """
+    Turn a key-ordered query result into the API response: newest first, at
+    most `limit` entries, the cursor entry itself left out. Each entry gets
+    its key as "id" so the client can ask for the next page.
+
+    The query asks for one entry more than `limit`, in case the cursor is
+    among them. When it is not (deleted or archived meanwhile) the extra
+    entry is dropped from the side away from the cursor: the oldest for a
+    page before it, the newest for a page `newer` than it.
+    """
+    keys = [
+        key for key in sorted((data or {}).keys())
+        if key != cursor and isinstance(data[key], dict)
+    ]
+    keys = keys[:limit] if newer else keys[-limit:]
+    return [dict(data[key], id=key) for key in reversed(keys)]
+
+
+def archive_month(key: str, entry: dict) -> str:
+    """YYYY-MM bucket of an entry, from its timestamp or else from its key."""
+    timestamp = entry.get("timestamp") if isinstance(entry, dict) else None
+    if isinstance(timestamp, str) and len(timestamp) >= 7:
+        return timestamp[:7]
+    ms = 0
+    for char in key[:8]:
+        ms = ms * 64 + PUSH_CHARS.index(char)
+    return datetime.fromtimestamp(ms / 1000).strftime("%Y-%m")
+
+
+def archive_updates(entries: dict) -> dict:
+    """Multi-path update moving entries from /logs (and /alerts) to the archive."""
+    updates = {}
+    for key, entry in entries.items():
+        updates[f"{ARCHIVE_PATH}/{archive_month(key, entry)}/{key}"] = entry
+        updates[f"{LOGS_PATH}/{key}"] = None
+        if isinstance(entry, dict) and entry.get("type") in ALERT_TYPES:
+            updates[f"{ALERTS_PATH}/{key}"] = None
+    return updates
@@ -1,32 +1,156 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+import time
+IMPORT_STARTED = time.perf_counter()  # temps de démarrage mesuré depuis ici
+
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Header, Query, status
 import firebase_admin
-from firebase_admin import credentials, db, auth
+from firebase_admin import credentials, auth
+from firebase_admin import db as firebase_db
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from fastapi import Response, Request
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import jwt
+import asyncio
+import hashlib
+import json
+import math
 import os
+import threading
 from datetime import datetime
-from typing import List, Optional
+from typing import Annotated, Any, List, Literal, Optional
+from contextlib import asynccontextmanager
+import rollups
+from cache import MISSING, TTLCache
+from conditional import ResponseVersions
+import snapshots
+from snapshots import DaySnapshots
+from ingest import WriteBuffer
+from spool import DELTA, READING, Spool, SpoolFullError, SpoolReplayer
+from dataaccess import BlockingPool, DayReader
+from identity import IdentityToolkitClient, DEFAULT_BASE_URL
+import logstore
+from auditlog import AuditLogger
+from ratelimit import Limiter, MemoryBackend, SQLiteBackend
+from timeseries import TimeSeriesStore, bucket
+from livefeed import LiveFeed
+from replica import Replica
+from storage import LocalDatabase
+from metrics import InstrumentedDatabase, MetricsMiddleware, Registry
+import applog
+import logging
+
+#apperentlu I need to do this
+# (avant de lire la configuration: le .env doit pouvoir la fournir)
+load_dotenv()
 
 # Rate‑limit / block config
 ADMIN_PROTECTED_DOMAINS = ["@jemlo.com", "@jemlo.be"]  # add both if needed
 MAX_ATTEMPTS = 5          # attempts before block
 BLOCK_HOURS = 2           # how long to block IP
-# In‑memory store (reset on server restart; for persistent, use Firebase)
-failed_attempts = {}
+# Compteurs partagés entre workers si RATE_LIMIT_SQLITE_PATH est défini,
+# sinon en mémoire (par process, remis à zéro au redémarrage)
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH")
+rate_limit_backend = (
+    SQLiteBackend(RATE_LIMIT_SQLITE_PATH) if RATE_LIMIT_SQLITE_PATH else MemoryBackend()
+)
+login_limiter = Limiter(
+    rate_limit_backend,
+    limit=MAX_ATTEMPTS,
+    window=BLOCK_HOURS * 3600,
+    block_seconds=BLOCK_HOURS * 3600,
+    namespace="login",
+)
+# Requêtes par IP et par minute sur les endpoints des fontaines (0 = pas de
+# limite, le défaut: derrière un NAT toutes les fontaines d'un site ont la même IP)
+FOUNTAIN_WRITES_PER_MINUTE = int(os.getenv("FOUNTAIN_WRITES_PER_MINUTE", "0"))
+FOUNTAIN_READS_PER_MINUTE = int(os.getenv("FOUNTAIN_READS_PER_MINUTE", "0"))
+# Proxys (IP séparées par des virgules) dont on croit l'en-tête X-Forwarded-For;
+# vide: l'en-tête est ignoré, sinon n'importe quel client choisit son IP
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+write_limiter = Limiter(rate_limit_backend, limit=FOUNTAIN_WRITES_PER_MINUTE, window=60, namespace="write")
+read_limiter = Limiter(rate_limit_backend, limit=FOUNTAIN_READS_PER_MINUTE, window=60, namespace="read")
+
+# Base de données: Firebase RTDB, ou la copie locale de storage.py pour
+# travailler hors ligne et mesurer l'API sur de gros jeux de données
+# ("memory", ou "sqlite" avec STORAGE_SQLITE_PATH). L'auth reste sur Firebase.
+# Firebase est initialisé au démarrage de l'app (lifespan) ou au premier
+# accès, pas à l'import: importer main ne demande pas de credentials.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")
+FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH", "/etc/secrets/firebase-adminsdk.json")
+FIREBASE_DATABASE_URL = os.getenv(
+    "FIREBASE_DATABASE_URL",
+    "https://fontaine-intelligente-default-rtdb.europe-west1.firebasedatabase.app/",
+)
+firebase_init_lock = threading.Lock()
+firebase_initialized = False
+
+
+def init_firebase():
+    """Initialise the Firebase Admin app, once per process."""
+    global firebase_initialized
+    with firebase_init_lock:
+        if firebase_initialized:
+            return
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred, {
+            "databaseURL": FIREBASE_DATABASE_URL,
+            "httpTimeout": float(os.getenv("FIREBASE_HTTP_TIMEOUT_SECONDS", "10"))
+        })
+        firebase_initialized = True
 
-cred = credentials.Certificate("/etc/secrets/firebase-adminsdk.json")
-firebase_admin.initialize_app(cred, {
-    "databaseURL": "https://fontaine-intelligente-default-rtdb.europe-west1.firebasedatabase.app/"
-})
+
+class FirebaseDatabase:
+    """firebase_admin.db, the Firebase app being initialised on first use"""
+
+    def reference(self, path: str = "/"):
+        if not firebase_initialized:
+            init_firebase()
+        return firebase_db.reference(path)
+
+
+if STORAGE_BACKEND == "firebase":
+    db = FirebaseDatabase()
+elif STORAGE_BACKEND in ("memory", "sqlite"):
+    db = LocalDatabase(os.getenv("STORAGE_SQLITE_PATH") if STORAGE_BACKEND == "sqlite" else None)
+else:
+    raise RuntimeError(f"STORAGE_BACKEND inconnu: {STORAGE_BACKEND}")
+
+# Logs JSON sur stdout écrits par un thread, échantillonnés (voir applog.py)
+applog.setup(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    per_second=int(os.getenv("LOG_SAMPLE_PER_SECOND", "20")),
+)
+logger = logging.getLogger("jemlo.main")
+
+# Métriques Prometheus sur /metrics (voir metrics.py)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # Bearer exigé sur /metrics si défini
+# Sans token, /metrics est fermé si demandé (python cli.py serve le demande)
+METRICS_REQUIRE_TOKEN = os.getenv("METRICS_REQUIRE_TOKEN", "false").lower() == "true"
+# Taille JSON des échanges avec la base: resérialise chaque réponse, coûteux sur les gros nœuds
+METRICS_PAYLOAD_BYTES = os.getenv("METRICS_PAYLOAD_BYTES", "false").lower() == "true"
+metrics = Registry()
+http_requests = metrics.counter(
+    "jemlo_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = metrics.histogram(
+    "jemlo_http_request_seconds", "HTTP request latency by route", ("method", "route"))
+db_calls = metrics.counter(
+    "jemlo_db_calls_total", "Database calls by operation and outcome", ("op", "outcome"))
+db_latency = metrics.histogram("jemlo_db_call_seconds", "Database call latency", ("op",))
+db_payload = metrics.counter(
+    "jemlo_db_payload_bytes_total", "JSON bytes sent to or received from the database", ("op", "direction"))
+identity_calls = metrics.counter(
+    "jemlo_identity_calls_total", "Identity Toolkit signInWithPassword calls by outcome", ("outcome",))
+identity_latency = metrics.histogram("jemlo_identity_call_seconds", "Identity Toolkit call latency")
+identity_payload = metrics.counter(
+    "jemlo_identity_payload_bytes_total", "Bytes received from the Identity Toolkit")
+db = InstrumentedDatabase(db, db_calls, db_latency, db_payload, measure_payload=METRICS_PAYLOAD_BYTES)
 
 
-load_dotenv()
-#apperentlu I need to do this
 ADMIN_EMAIL = os.getenv("Admin_Email")
 ADMIN_PASSWORD = os.getenv("Admin_Password")
 
@@ -40,52 +164,682 @@ JWT_Domain = os.getenv("JWT_Domain", "localhost")
 JWT_SECURE_ENV = os.getenv("JWT_Secure", "false").lower() == "true"
 JWT_SAMESITE_ENV = os.getenv("JWT_SAMESITE", "lax")
 
-app = FastAPI(title="FastAPI Docker Template")
-
-#Cors Security MiddleWare that will eventually need to be configured but i am lazy
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:8080",   # For test enviroments
-        "https://jemlofontaine.onrender.com",
-        "https://tvalcke.github.io/Jemlo"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Cache des endpoints du dashboard (polling toutes les 5s par onglet ouvert)
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+dashboard_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+# Totaux recalculés depuis les jours bruts tant que rebuild-rollups n'a pas
+# tourné (lecture complète de l'historique: gardés plus longtemps)
+RAW_TOTALS_TTL_SECONDS = float(os.getenv("RAW_TOTALS_TTL_SECONDS", "300"))
+raw_totals_cache = TTLCache(maxsize=1, ttl=RAW_TOTALS_TTL_SECONDS)
+# Réponses du mode replica, sous la version du store analytics: recalculées
+# seulement quand une écriture (listener, flush, resync) l'a changé
+replica_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+# ETag des réponses en cache (304 si rien n'a changé, voir conditional.py)
+response_versions = ResponseVersions(maxsize=CACHE_MAX_ENTRIES)
+# Réponses compressées en gzip au-delà de cette taille (octets)
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+# Tokens déjà vérifiés (jusqu'à leur exp) et profils /users des admins
+token_cache = TTLCache(maxsize=int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "1024")), ttl=JWT_EXPIRY_MINUTES * 60)
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "300")),
+)
+
+# Buffer d'écriture des relevés des fontaines (voir ingest.py)
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "10000"))
+INGEST_FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL_SECONDS = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "2"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "1000"))
+ingest_buffer = WriteBuffer(
+    read=lambda path, shallow: db.reference(path).get(shallow=shallow),
+    write=lambda updates: db.reference('/').update(updates),
+    on_flush=lambda written: on_readings_written(written),
+    max_pending=INGEST_MAX_PENDING,
+    flush_size=INGEST_FLUSH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL_SECONDS,
+)
+# Relevés acceptés d'abord dans un spool local, rejoués vers Firebase en
+# arrière-plan (voir spool.py). Sans INGEST_SPOOL_PATH le spool est en mémoire
+# et perdu au redémarrage: `python cli.py serve` refuse de démarrer sans lui.
+INGEST_SPOOL_PATH = os.getenv("INGEST_SPOOL_PATH")
+INGEST_SPOOL_MAX_EVENTS = int(os.getenv("INGEST_SPOOL_MAX_EVENTS", "1000000"))
+INGEST_REPLAY_MAX_BACKOFF_SECONDS = float(os.getenv("INGEST_REPLAY_MAX_BACKOFF_SECONDS", "30"))
+spool = Spool(INGEST_SPOOL_PATH, max_events=INGEST_SPOOL_MAX_EVENTS)
+spool_replayer = SpoolReplayer(
+    spool,
+    ingest_buffer,
+    batch_size=min(INGEST_FLUSH_SIZE, INGEST_MAX_PENDING),
+    interval=INGEST_FLUSH_INTERVAL_SECONDS,
+    max_backoff=INGEST_REPLAY_MAX_BACKOFF_SECONDS,
+)
+
+# Jours passés figés sur disque pour read_item (voir snapshots.py): un jour est
+# scellé SEAL_AFTER_DAYS jours après sa fin. Sans SNAPSHOT_DIR, en mémoire.
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+SEAL_AFTER_DAYS = int(os.getenv("SEAL_AFTER_DAYS", "2"))
+day_snapshots = DaySnapshots(SNAPSHOT_DIR, max_entries=int(os.getenv("SNAPSHOT_CACHE_DAYS", "64")))
+# Jour courant de read_item gardé quelques secondes (démarrage des fontaines)
+READ_ITEM_TTL_SECONDS = float(os.getenv("READ_ITEM_TTL_SECONDS", "5"))
+
+
+# Copie en colonnes de l'arbre des dates pour les graphiques (voir timeseries.py)
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR")  # snapshot sur disque, optionnel
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "5"))
+DATE_KEY_MIN, DATE_KEY_MAX = "2000-01-01", "2999-12-31"
+analytics = TimeSeriesStore()
+analytics_refresh_lock = threading.Lock()
+
+# Mode réplique (voir replica.py): tout l'historique en mémoire, tenu à jour
+# par le listener, les lectures du dashboard ne vont plus à Firebase
+REPLICA_MODE = os.getenv("REPLICA_MODE", "false").lower() == "true"
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "5"))
+REPLICA_SAVE_SECONDS = float(os.getenv("REPLICA_SAVE_SECONDS", "300"))  # snapshot dans ANALYTICS_DIR
+REPLICA_MAX_STALENESS_SECONDS = float(os.getenv("REPLICA_MAX_STALENESS_SECONDS", "30"))
+
+# Dashboards connectés en SSE: un seul listener Firebase pour tout le process
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_MAX_QUEUE = int(os.getenv("LIVE_MAX_QUEUE", "100"))
+live_feed = LiveFeed(
+    listen=lambda path, callback: db.reference(path).listen(callback),
+    on_change=lambda rows: on_live_change(rows),
+    max_queue=LIVE_MAX_QUEUE,
+    keep_open=REPLICA_MODE,
+)
+replica = Replica(
+    analytics,
+    live_feed,
+    sync=lambda start: sync_replica(start),
+    save=(lambda: analytics.save(ANALYTICS_DIR)) if ANALYTICS_DIR else None,
+    interval=REPLICA_CHECK_SECONDS,
+    save_interval=REPLICA_SAVE_SECONDS,
+    max_staleness=REPLICA_MAX_STALENESS_SECONDS,
+)
+
+# Appels bloquants (Firebase, HTTP) exécutés hors de la boucle asyncio
+FIREBASE_MAX_WORKERS = int(os.getenv("FIREBASE_MAX_WORKERS", "16"))
+FIREBASE_MAX_PENDING = int(os.getenv("FIREBASE_MAX_PENDING", "256"))
+FIREBASE_CALL_TIMEOUT_SECONDS = float(os.getenv("FIREBASE_CALL_TIMEOUT_SECONDS", "10"))
+firebase_pool = BlockingPool(
+    max_workers=FIREBASE_MAX_WORKERS,
+    max_pending=FIREBASE_MAX_PENDING,
+    timeout=FIREBASE_CALL_TIMEOUT_SECONDS,
+)
+# Historique lu par plages de jours en parallèle, jamais en un seul dict
+# (chargement de l'analytics, fontaines d'une organisation, commandes cli)
+DAY_READ_WORKERS = int(os.getenv("DAY_READ_WORKERS", "4"))
+DAYS_PER_READ = int(os.getenv("DAYS_PER_READ", "7"))
+day_reader = DayReader(
+    read_keys=lambda path: db.reference(path).get(shallow=True),
+    read_range=lambda path, first, last: db.reference(path).order_by_key().start_at(first).end_at(last).get(),
+    max_workers=DAY_READ_WORKERS,
+    days_per_read=DAYS_PER_READ,
+)
+
+# Vérification du mot de passe (Identity Toolkit), connexions gardées ouvertes
+identity_client = IdentityToolkitClient(
+    api_key=os.getenv("FIREBASE_API_KEY"),
+    base_url=os.getenv("IDENTITY_TOOLKIT_URL", DEFAULT_BASE_URL),
+    timeout=float(os.getenv("IDENTITY_TOOLKIT_TIMEOUT_SECONDS", "5")),
+    max_connections=int(os.getenv("IDENTITY_TOOLKIT_MAX_CONNECTIONS", "20")),
+    retries=int(os.getenv("IDENTITY_TOOLKIT_RETRIES", "2")),
+    observe=lambda outcome, seconds, size: observe_identity_call(outcome, seconds, size),
+)
+
+
+def observe_identity_call(outcome: str, seconds: float, size: int):
+    identity_calls.inc(outcome)
+    identity_latency.observe(seconds)
+    identity_payload.inc(amount=size)
+
+
+# Logs admin écrits en arrière-plan, par lots (voir auditlog.py)
+audit_log = AuditLogger(
+    write=lambda updates: db.reference('/').update(updates),
+    max_queue=int(os.getenv("AUDIT_LOG_MAX_QUEUE", "10000")),
+    batch_size=int(os.getenv("AUDIT_LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL_SECONDS", "1")),
+    sample_every=int(os.getenv("AUDIT_LOG_SAMPLE_EVERY", "10")),
 )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if STORAGE_BACKEND == "firebase":
+        await firebase_pool.run(init_firebase)
+    if ANALYTICS_DIR and os.path.exists(ANALYTICS_DIR):
+        analytics.load(ANALYTICS_DIR)
+    spool_replayer.start()
+    audit_log.start()
+    await identity_client.start()
+    # Le serveur répond pendant le warm-up, /ready passe à 200 ensuite
+    threading.Thread(target=warm_up, args=(started,), name="warm-up", daemon=True).start()
+    yield
+    startup["ready"] = False
+    replica.stop()
+    # Ne pas perdre les relevés et les logs encore en mémoire à l'arrêt
+    spool_replayer.stop()
+    audit_log.stop()
+    if ANALYTICS_DIR and analytics.loaded:
+        analytics.save(ANALYTICS_DIR)
+    await identity_client.close()
+    live_feed.close()
+    firebase_pool.shutdown()
+    day_reader.shutdown()
+
+
+# Warm-up au démarrage: jours du graphique chargés avant que /ready réponde
+# 200 (0 = pas de warm-up)
+WARMUP_DAYS = int(os.getenv("WARMUP_DAYS", "90"))
+startup = {"import_seconds": None, "startup_seconds": None, "ready": False}
+
+
+def warm_up(started: float):
+    """
+    Fill what the first dashboard requests need: the analytics store for the
+    last WARMUP_DAYS days and the global totals, or in replica mode the whole
+    history and the listener. A failure only means cold first requests, the
+    worker is marked ready anyway.
+    """
+    try:
+        if REPLICA_MODE:
+            replica.check()
+        elif WARMUP_DAYS:
+            refresh_analytics((datetime.today() - timedelta(days=WARMUP_DAYS)).strftime("%Y-%m-%d"))
+            if migration_done(rollups.ROLLUPS_MIGRATION):
+                stats, version = read_versioned(read_dashboard_stats)
+                dashboard_cache.set(("stats_total",), stats)
+                response_versions.etag(("stats_total",), stats, version)
+    except Exception:
+        logger.exception("Warm-up failed")
+    if REPLICA_MODE:
+        replica.start()  # retries what the warm-up could not do
+    startup["startup_seconds"] = round(time.perf_counter() - started, 3)
+    startup["ready"] = True
+    logger.info("Worker ready", extra={"startup_seconds": startup["startup_seconds"]})
+
+
+def process_stats() -> dict:
+    stats = {
+        "import_seconds": startup["import_seconds"],
+        "startup_seconds": startup["startup_seconds"],
+        "ready": int(startup["ready"]),
+    }
+    try:
+        import resource  # Unix only
+        stats["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux: KiB
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return {key: value for key, value in stats.items() if value is not None}
+
+
+router = APIRouter()
 security = HTTPBearer()
 
 
+def get_client_ip(request: Request) -> str:
+    peer = request.client.host if request.client else ""
+    xff = request.headers.get("X-Forwarded-For")
+    if xff and peer in TRUSTED_PROXIES:
+        # "client, proxy1, proxy2": each proxy appends the address it saw, so
+        # the first address from the right that is not one of ours is the client
+        for ip in reversed([ip.strip() for ip in xff.split(",") if ip.strip()]):
+            if ip not in TRUSTED_PROXIES:
+                return ip
+    return peer
+
+
+def rate_limited(limiter: Limiter):
+    """Dependency refusing the request with 429 once the client IP is over the limit."""
+    def dependency(request: Request):
+        if not limiter.limit:
+            return
+        retry_after = limiter.allow(get_client_ip(request))
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Trop de requêtes, réessayez plus tard",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    return dependency
+
+
 class BottleEvent(BaseModel):
     bottleNumber: int
     waterLiters: float
     plasticRecycledGrams: float
+    # Fontaines installées: la donnée va dans /{date}/{organisation}/{machine}
+    organisation: Optional[str] = None
+    machine: Optional[str] = None
 
-@app.get("/")
+
+class BottleDelta(BaseModel):
+    """Mode delta: ce que la fontaine a compté depuis son envoi précédent"""
+    organisation: str = Field(min_length=1)
+    machine: str = Field(min_length=1)
+    bottleNumber: int = Field(0, ge=0)
+    waterLiters: float = Field(0, ge=0)
+    plasticRecycledGrams: float = Field(0, ge=0)
+
+@router.get("/")
 def read_root():
     return {"message": "Hello from FastAPI running in Docker!"}
 
-@app.post("/api/create-item/")
-def create_item(data: BottleEvent):
+@router.post("/api/create-item/", dependencies=[Depends(rate_limited(write_limiter))])
+def create_item(
+    data: BottleEvent,
+    request: Request,
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key")] = None,
+):
+    current_day = str(datetime.today())[:10]
+    logger.debug("create_item", extra={"day": current_day})
+    if data.organisation and data.machine:
+        return record_machine_event(current_day, data, idempotency_key, idempotency_scope(request))
     try:
-        current_day = str(datetime.today())[:10]
-        print(current_day)
         ref = db.reference(f'/{current_day}')
-        new_ref = ref.update(data.model_dump())
-        return {"id": new_ref.key, "message": "Donnée créée avec succès"}
-    except Exception as e:
-        print(e)
+        ref.update(data.model_dump(exclude={"organisation", "machine"}))
+        return {"id": ref.key, "message": "Donnée créée avec succès"}
+    except Exception:
+        # Sans organisation/machine la donnée ne passe pas par le spool:
+        # le client doit réessayer
+        logger.exception("create_item failed")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de données indisponible, réessayez plus tard"
+        )
 
-@app.get("/api/read-item/{item_id}")
-def read_item(item_id: str):
+def machine_reading(current_day: str, data: BottleEvent):
+    """(date, org, machine, values) tuple as queued in the ingest buffer"""
+    return (
+        current_day,
+        data.organisation.upper(),
+        data.machine,
+        data.model_dump(exclude={"organisation", "machine"}),
+    )
+
+
+def idempotency_scope(request: Request) -> str:
+    """Where an Idempotency-Key is unique: the endpoint and the client calling it."""
+    return f"{request.url.path} {get_client_ip(request)}"
+
+
+def spool_readings(readings: list, idempotency_key: Optional[str] = None, kind: str = READING,
+                   scope: str = "") -> int:
+    """
+    Append readings (or deltas) to the spool and wake the replayer, which
+    writes them through the ingest buffer. Answers 503 when the spool is full.
+    """
     try:
-        print(item_id)
-        ref = db.reference(f'/{item_id}')
-        item = ref.get()
-        return item
-    except Exception as e:
-        print(e)
+        appended = spool.append_many(readings, idempotency_key, kind, scope)
+    except SpoolFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de relevés en attente, réessayez plus tard",
+            headers={"Retry-After": str(max(1, int(INGEST_FLUSH_INTERVAL_SECONDS)))}
+        )
+    spool_replayer.notify()
+    return appended
+
+
+def record_machine_event(current_day: str, data: BottleEvent, idempotency_key: Optional[str] = None,
+                         scope: str = ""):
+    """
+    Accept a machine reading once it is in the spool. The replayer writes it
+    right after, in a single multi-path update shared with whatever else was
+    waiting, moving the rollups by the difference with the previous reading.
+    """
+    reading = machine_reading(current_day, data)
+    spool_readings([reading], idempotency_key, scope=scope)
+    _, org, machine, _ = reading
+    return {"id": f"{current_day}/{org}/{machine}", "message": "Donnée créée avec succès"}
+
+
+def apply_readings(rows) -> list:
+    """
+    Upsert (date, org, machine, values) rows into the analytics store and push
+    what changed to the live dashboards. Every path that learns about a
+    reading (ingest flush, refresh, listener) goes through here, so a change
+    is published once whichever path sees it first.
+    """
+    with live_feed.lock:
+        changes = []
+        for day, org, machine, values in rows:
+            delta = analytics.upsert(day, org, machine, values)
+            if delta:
+                changes.append((day, org, machine, delta))
+        live_feed.publish(changes)
+    return changes
+
+
+def on_readings_written(written: dict):
+    """Called by the ingest buffer after each flush."""
+    apply_readings([(day, org, machine, values) for (day, org, machine), values in written.items()])
+    for day, org in {(day, org) for day, org, _ in written}:
+        invalidate_dashboard_cache(day, org)
+
+
+def on_live_change(rows):
+    """Called by the live feed listener when today's node changes (any worker)."""
+    changes = apply_readings(rows)
+    for day, org in {(day, org) for day, org, _, _ in changes}:
+        invalidate_dashboard_cache(day, org)
+
+
+def read_days(start: Optional[str] = None, end: Optional[str] = None) -> dict:
+    """
+    /{date} nodes between start and end (inclusive), by key range: /users,
+    /logs... are not read. One query, for the latest days; longer windows
+    go through day_reader.
+    """
+    query = db.reference('/').order_by_key()
+    return query.start_at(start or DATE_KEY_MIN).end_at(end or DATE_KEY_MAX).get() or {}
+
+
+# Plus ancien jour qui attendait dans le spool au refresh précédent: rejoué
+# depuis, il doit encore être relu une fois
+spooled_since = None
+
+
+def refresh_start() -> Optional[str]:
+    """
+    First day re-read by refresh_analytics: the day before the latest one
+    held, since after midnight the spool may still be replaying yesterday's
+    readings, or an older day that was waiting in the spool at this refresh
+    or the previous one.
+    """
+    global spooled_since
+    latest = analytics.latest_date
+    oldest = spool.oldest_date()
+    days = [day for day in (oldest, spooled_since) if day]
+    if latest:
+        days.append((datetime.strptime(latest, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d"))
+    spooled_since = oldest
+    if not days:
+        return None
+    # Pas plus tôt que les jours tenus par le store
+    return max(min(days), analytics.since) if analytics.since else min(days)
+
+
+def refresh_analytics(start: Optional[str] = None):
+    """
+    Keep the analytics store in line with Firebase. The days from `start` on
+    (all of them if None) are read the first time they are needed, unless a
+    snapshot was loaded at startup; afterwards only the latest days
+    (refresh_start) are re-read, at most every ANALYTICS_REFRESH_SECONDS, to
+    pick up writes made by other workers.
+    """
+    with analytics_refresh_lock:
+        now = time.monotonic()
+        if not analytics.loaded:
+            analytics.load_tree(day_reader.iter_days("/", start), since=start)
+            analytics.refreshed_at = now
+            return
+        if not analytics.covers(start):
+            # Older days than those held: not changes, nothing to publish
+            analytics.merge_days(day_reader.iter_days("/", start, analytics.since))
+            analytics.since = start
+        if analytics.refreshed_at and now - analytics.refreshed_at < ANALYTICS_REFRESH_SECONDS:
+            return
+        if replica.fresh():
+            return  # the listener brings the changes
+        with live_feed.lock:
+            live_feed.publish(analytics.merge_days(read_days(refresh_start())))
+        analytics.refreshed_at = now
+
+
+def sync_replica(start: Optional[str] = None):
+    """
+    Replica check before the listener is (re)opened: the whole history the
+    first time, then the days from `start` (the day listened to before, or
+    the latest one held) on.
+    """
+    if not analytics.covers(None):
+        refresh_analytics()
+        return
+    with analytics_refresh_lock:
+        with live_feed.lock:
+            live_feed.publish(analytics.merge_days(read_days(start or analytics.latest_date)))
+        analytics.refreshed_at = time.monotonic()
+
+
+def invalidate_dashboard_cache(day: str, org: str):
+    """
+    Forget the cached aggregates a write to /{day}/{org} can change: the
+    global ones, and the fountains lists and graphs of that organisation or
+    of all orgs.
+    """
+    def affected(key):
+        if key[0] == "read_item":
+            return key[1] == day
+        if key[0] == "fountain_graph":
+            return key[1] in (None, org)
+        if key[0] != "fountains":
+            return True
+        cached_org, cached_date = key[1], key[2]
+        return cached_org in (None, org) and cached_date in (None, day)
+
+    dashboard_cache.invalidate(affected)
+
+
+# Migrations hors ligne (cli.py) déjà faites: un marqueur vu reste acquis
+migrations_done = set()
+
+
+def migration_done(name: str) -> bool:
+    """Whether /migrations/{name} is set. Read until it is, then remembered."""
+    if name not in migrations_done:
+        if db.reference(f'/{rollups.MIGRATIONS_ROOT}/{name}').get() is None:
+            return False
+        migrations_done.add(name)
+    return True
+
+
+def mark_migration(name: str):
+    db.reference(f'/{rollups.MIGRATIONS_ROOT}/{name}').set({".sv": "timestamp"})
+    migrations_done.add(name)
+
+
+def rebuild_rollups() -> dict:
+    """
+    Recompute /rollups from the raw date tree, then mark them initialised.
+    Every day is read and /rollups overwritten: run it with the writers
+    stopped, never from a request.
+    """
+    rollup = rollups.build_rollups(day_reader.iter_days("/"))
+    # Les ETag déjà donnés ne valent plus
+    rollup["version"] = (shared_version() or 0) + 1
+    db.reference(f'/{rollups.ROLLUP_ROOT}').set(rollup)
+    mark_migration(rollups.ROLLUPS_MIGRATION)
+    raw_totals_cache.clear()
+    dashboard_cache.invalidate()
+    return rollup
+
+
+def backfill_by_org(days_per_batch: int = 30) -> int:
+    """
+    Copy the existing /{date} nodes to /by_org (offline, can be re-run).
+    Days are read by key range and written `days_per_batch` at a time.
+    """
+    count, batch = 0, {}
+    for day, node in day_reader.iter_days("/"):
+        count += 1
+        batch[day] = node
+        if len(batch) >= days_per_batch:
+            updates = rollups.by_org_updates(batch)
+            if updates:
+                db.reference('/').update(updates)
+            batch = {}
+    updates = rollups.by_org_updates(batch)
+    if updates:
+        db.reference('/').update(updates)
+    mark_migration(rollups.BY_ORG_MIGRATION)
+    dashboard_cache.invalidate()
+    return count
+
+@router.post(
+    "/api/create-items",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(rate_limited(write_limiter))],
+)
+def create_items(
+    events: List[BottleEvent],
+    request: Request,
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key")] = None,
+):
+    """
+    Bulk ingestion: the readings are spooled, then written by the ingest
+    buffer in one multi-path update. Answers 503 when the spool is full.
+    """
+    if len(events) > INGEST_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Maximum {INGEST_MAX_BATCH} relevés par requête"
+        )
+    if any(not (event.organisation and event.machine) for event in events):
+        raise HTTPException(
+            status_code=422,
+            detail="Chaque relevé doit avoir une organisation et une machine"
+        )
+
+    current_day = str(datetime.today())[:10]
+    spool_readings([machine_reading(current_day, event) for event in events], idempotency_key,
+                   scope=idempotency_scope(request))
+    return {"accepted": len(events), "message": "Relevés acceptés"}
+
+@router.post(
+    "/api/create-deltas",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(rate_limited(write_limiter))],
+)
+def create_deltas(
+    events: List[BottleDelta],
+    request: Request,
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key")] = None,
+):
+    """
+    Delta-mode ingestion: each event carries what a machine counted since its
+    previous one, so the fountain keeps no daily total. The deltas of a
+    machine are summed and written as server-side increments, one per counter
+    and flush, so concurrent fountains and workers add up without overwriting.
+    """
+    if len(events) > INGEST_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Maximum {INGEST_MAX_BATCH} relevés par requête"
+        )
+
+    current_day = str(datetime.today())[:10]
+    deltas = [
+        (current_day, event.organisation.upper(), event.machine,
+         event.model_dump(exclude={"organisation", "machine"}))
+        for event in events
+    ]
+    spool_readings(deltas, idempotency_key, kind=DELTA, scope=idempotency_scope(request))
+    return {"accepted": len(events), "message": "Incréments acceptés"}
+
+def is_final(day: str) -> bool:
+    """A day that can be sealed: SEAL_AFTER_DAYS old, and none of its readings left in the spool."""
+    cutoff = (datetime.today() - timedelta(days=SEAL_AFTER_DAYS)).strftime("%Y-%m-%d")
+    if not snapshots.is_day(day) or day > cutoff:
+        return False
+    oldest = spool.oldest_date()
+    return oldest is None or day < oldest
+
+
+def seal_days() -> int:
+    """Seal the final days that are not sealed yet (seal-days command). Returns how many."""
+    cutoff = (datetime.today() - timedelta(days=SEAL_AFTER_DAYS)).strftime("%Y-%m-%d")
+    missing = [day for day in day_reader.keys("/", end=cutoff) if not day_snapshots.is_sealed(day)]
+    count = 0
+    if missing:
+        for day, node in day_reader.iter_days("/", missing[0], cutoff):
+            if node is not None and not day_snapshots.is_sealed(day) and is_final(day):
+                day_snapshots.seal(day, node)
+                count += 1
+    return count
+
+
+SNAPSHOT_HEADERS = {"Cache-Control": snapshots.IMMUTABLE, "Vary": "Accept-Encoding"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[frozenset]:
+    """`fields=a,b` -> {"a", "b"}; None (or empty) keeps every field."""
+    names = frozenset(name.strip() for name in (fields or "").split(",") if name.strip())
+    return names or None
+
+
+def project(node, fields: Optional[frozenset]):
+    """
+    Keep only `fields` among the values of node and of its sub-nodes:
+    fields=waterLiters on a day keeps {org: {machine: {"waterLiters": ...}}}.
+    """
+    if fields is None or not isinstance(node, dict):
+        return node
+    result = {}
+    for key, value in node.items():
+        if isinstance(value, dict):
+            value = project(value, fields)
+            if value:
+                result[key] = value
+        elif key in fields:
+            result[key] = value
+    return result
+
+
+@router.get(
+    "/api/read-item/{item_id}",
+    response_model=Any,
+    dependencies=[Depends(rate_limited(read_limiter))],
+)
+def read_item(
+    item_id: str,
+    fields: Optional[str] = None,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
+):
+    """
+    Un nœud de la base, réduit aux champs de `fields` (ex: waterLiters).
+    Les jours scellés viennent des snapshots (immutable), le jour courant
+    d'un cache de READ_ITEM_TTL_SECONDS vidé à chaque écriture (en mode
+    réplique, de la copie tenue par le listener).
+    """
+    try:
+        logger.debug("read_item", extra={"item_id": item_id})
+        projection = parse_fields(fields)
+        if not snapshots.is_day(item_id):
+            return project(db.reference(f'/{item_id}').get(), projection)
+
+        body = day_snapshots.get(item_id)
+        if body is None:
+            # Mode réplique: le jour écouté vient de la copie du listener
+            item = live_feed.day_node(item_id) if replica.fresh() else None
+            if item is not None:
+                return project(item or None, projection)
+            item = dashboard_cache.get(("read_item", item_id), MISSING)
+            if item is MISSING:
+                item = db.reference(f'/{item_id}').get()
+                if item is not None and is_final(item_id):
+                    body = day_snapshots.seal(item_id, item)
+                else:
+                    dashboard_cache.set(("read_item", item_id), item, ttl=READ_ITEM_TTL_SECONDS)
+            if body is None:
+                return project(item, projection)
+
+        if projection is None and "gzip" in (accept_encoding or ""):
+            # Déjà compressé: GZipMiddleware laisse passer
+            return Response(body, media_type="application/json",
+                            headers=dict(SNAPSHOT_HEADERS, **{"Content-Encoding": "gzip"}))
+        if response is not None:
+            response.headers.update(SNAPSHOT_HEADERS)
+        return project(snapshots.decode(body), projection)
+    except Exception:
+        logger.exception("read_item failed", extra={"item_id": item_id})
 
 # For Jwt admin login US Thomas
 class AdminLogin(BaseModel):
@@ -117,6 +871,12 @@ def verify_token(request: Request):
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    # Le dashboard renvoie le même cookie toutes les 5s: pas besoin de refaire le HMAC
+    token_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(token_key)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(
             token,
@@ -125,6 +885,8 @@ def verify_token(request: Request):
             audience=JWT_AUDIENCE,
             issuer=JWT_ISSUER
         )
+        # Entry expires with the token, an expired token is never served from cache
+        token_cache.set(token_key, payload, ttl=payload["exp"] - time.time())
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -147,24 +909,90 @@ def verify_admin_role(payload: dict = Depends(verify_token)):
     return payload
 def add_log(message: str, log_type: str = "info"):
     """
-    Store a log entry in Firebase under /logs.
+    Queue a log entry for /logs (and /alerts for failed logins). The audit
+    logger writes it in the background, the caller never waits for Firebase.
     """
-    try:
-        log_ref = db.reference("/logs").push()
-        log_ref.set({
-            "timestamp": datetime.now().isoformat(),
-            "message": message,
-            "type": log_type,
-        })
-    except Exception as e:
-        print(f"Error writing log: {e}")
-def get_client_ip(request: Request) -> str:
-    # If you are behind nginx / proxy, use X‑Forwarded‑For
-    xff = request.headers.get("X-Forwarded-For")
-    if xff:
-        # "ip1, ip2, ..." → take first
-        return xff.split(",")[0].strip()
-    return request.client.host
+    audit_log.log(message, log_type)
+
+
+LOG_PAGE_MAX = 500
+# Avant rebuild-alerts: alertes cherchées parmi ce nombre d'entrées de /logs
+ALERTS_FALLBACK_SCAN = int(os.getenv("ALERTS_FALLBACK_SCAN", "1000"))
+
+
+def read_log_page(path: str, limit: int, before: Optional[str] = None,
+                  after: Optional[str] = None, types: Optional[set] = None) -> list:
+    """
+    One page of /logs or /alerts, newest first. Keys are time-ordered push
+    ids, so only the requested entries are downloaded. types: only those
+    entries, among the ALERTS_FALLBACK_SCAN next to the cursor.
+    """
+    limit = max(1, min(limit, LOG_PAGE_MAX))
+    count = ALERTS_FALLBACK_SCAN if types else limit
+    query = db.reference(f"/{path}").order_by_key()
+    if after:
+        query = query.start_at(after).limit_to_first(count + 1)
+    elif before:
+        query = query.end_at(before).limit_to_last(count + 1)
+    else:
+        query = query.limit_to_last(count)
+    data = query.get()
+    if types:
+        data = {key: entry for key, entry in (data or {}).items()
+                if isinstance(entry, dict) and entry.get("type") in types}
+    return logstore.page(data, limit, cursor=after or before, newer=bool(after))
+
+
+def read_alerts_page(limit: int, before: Optional[str] = None, after: Optional[str] = None) -> list:
+    # /alerts ne contient que les nouvelles alertes avant rebuild-alerts:
+    # jusque-là, les alertes d'une page bornée de /logs
+    if migration_done(logstore.ALERTS_MIGRATION):
+        return read_log_page(logstore.ALERTS_PATH, limit, before=before, after=after)
+    return read_log_page(logstore.LOGS_PATH, limit, before=before, after=after, types=logstore.ALERT_TYPES)
+
+
+def archive_logs(days: int, batch_size: int = 500) -> int:
+    """
+    Move the logs older than `days` days to /logs_archive/{YYYY-MM}.
+    Returns the number of entries moved.
+    """
+    cutoff = logstore.key_prefix(datetime.now() - timedelta(days=days))
+    moved = 0
+    while True:
+        query = db.reference(f"/{logstore.LOGS_PATH}").order_by_key()
+        old = query.end_at(cutoff).limit_to_first(batch_size).get() or {}
+        if not old:
+            return moved
+        db.reference("/").update(logstore.archive_updates(old))
+        moved += len(old)
+
+
+def rebuild_alerts_index(batch_size: int = 500) -> int:
+    """
+    Fill /alerts from the failed_login entries already in /logs, reading
+    /logs one page of `batch_size` keys at a time, then mark it initialised.
+    """
+    db.reference(f"/{logstore.ALERTS_PATH}").delete()
+    indexed = 0
+    start = None
+    while True:
+        query = db.reference(f"/{logstore.LOGS_PATH}").order_by_key()
+        if start is not None:
+            query = query.start_at(start)
+        logs = query.limit_to_first(batch_size + 1).get() or {}
+        keys = sorted(logs)
+        more = len(keys) > batch_size
+        alerts = {
+            f"{logstore.ALERTS_PATH}/{key}": logs[key] for key in keys[:batch_size]
+            if isinstance(logs[key], dict) and logs[key].get("type") in logstore.ALERT_TYPES
+        }
+        if alerts:
+            db.reference("/").update(alerts)
+            indexed += len(alerts)
+        if not more:
+            mark_migration(logstore.ALERTS_MIGRATION)
+            return indexed
+        start = keys[batch_size]
 
 
 def is_protected_admin_email(email: str) -> bool:
@@ -182,15 +1010,9 @@ def check_block(request: Request, email: str):
         return  # Only protect admin domains
 
     ip = get_client_ip(request)
-    now = datetime.utcnow()
-
-    data = failed_attempts.get(ip)
-    if not data:
-        return
-
-    blocked_until = data.get("blocked_until")
-    if blocked_until and now < blocked_until:
-        remaining = int((blocked_until - now).total_seconds() // 60)
+    retry_after = login_limiter.check(ip)
+    if retry_after:
+        remaining = int(retry_after // 60)
         # Optional: log to Firebase
         add_log(
             f"Blocked login attempt from IP {ip} for email {email}, remaining {remaining} minutes",
@@ -201,10 +1023,6 @@ def check_block(request: Request, email: str):
             detail=f"Trop de tentatives. Réessayez dans {remaining} minutes."
         )
 
-    # If block expired, reset
-    if blocked_until and now >= blocked_until:
-        failed_attempts.pop(ip, None)
-
 
 def register_failed_attempt(request: Request, email: str):
     """
@@ -215,150 +1033,24 @@ def register_failed_attempt(request: Request, email: str):
         return
 
     ip = get_client_ip(request)
-    now = datetime.utcnow()
-
-    data = failed_attempts.get(ip, {
-        "count": 0,
-        "first_time": now,
-        "blocked_until": None
-    })
-
-    # Reset window if older than BLOCK_HOURS
-    window_end = data["first_time"] + timedelta(hours=BLOCK_HOURS)
-    if now > window_end:
-        data = {
-            "count": 0,
-            "first_time": now,
-            "blocked_until": None
-        }
-
-    data["count"] += 1
-
-    # Block if too many attempts
-    if data["count"] >= MAX_ATTEMPTS:
-        data["blocked_until"] = now + timedelta(hours=BLOCK_HOURS)
+    if login_limiter.hit(ip):
         add_log(
-            f"IP {ip} blocked for {BLOCK_HOURS}h after {data['count']} failed admin attempts ({email})",
+            f"IP {ip} blocked for {BLOCK_HOURS}h after {MAX_ATTEMPTS} failed admin attempts ({email})",
             log_type="failed_login"
         )
 
-    failed_attempts[ip] = data
-
-@app.post("/api/admin/login", response_model=Token)
-async def admin_login(login_data: AdminLogin, response: Response):
-    print(f"🔍 Login attempt for: {login_data.email}")
-
-    # ========== SUPER ADMIN ==========
-    if login_data.email == ADMIN_EMAIL and login_data.password == ADMIN_PASSWORD:
-        print("✅ Super admin login successful")
-        # log des admin
-        add_log(f"Super admin login: {login_data.email}", log_type="login")
-        access_token = create_access_token({
-            "sub": login_data.email,
-            "email": login_data.email,
-            "role": "super_admin"
-        })
-
-        response.set_cookie(
-            key="access_token",
-            value=access_token,
-            httponly=True,
-            secure=JWT_SECURE_ENV,
-            samesite=JWT_SAMESITE_ENV,
-            max_age=JWT_EXPIRY_MINUTES * 60,
-            domain=JWT_Domain,
-            path="/"
-        )
-
-        return {
-            "Name": "SuperAdminSession",
-            "access_token": "stored_in_cookie",
-            "token_type": "cookie",
-            "expires_in": JWT_EXPIRY_MINUTES * 60,
-            "role": "super_admin"
-        }
-
-    # ========== FIREBASE USERS ==========
-    is_jemlo_domain = login_data.email.lower().endswith("@jemlo.be")
-    user_role = "admin" if is_jemlo_domain else "client"
-
-    try:
-        print(f"🔍 Firebase login: {login_data.email}")
-
-        user = auth.get_user_by_email(login_data.email)
-
-        import requests
-        firebase_api_key = os.getenv("FIREBASE_API_KEY")
-
-        url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={firebase_api_key}"
-        fb_response = requests.post(url, json={
-            "email": login_data.email,
-            "password": login_data.password,
-            "returnSecureToken": True
-        })
-
-        if fb_response.status_code != 200:
-            # NEW: log failed admin login dans les alerts
-            if is_jemlo_domain:
-                add_log(
-                    f"Failed admin login (bad password): {login_data.email}",
-                    log_type="failed_login"
-                )
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-
-        # Save / update role
-        user_ref = db.reference(f"/users/{user.uid}")
-        user_ref.update({
-            "email": login_data.email,
-            "role": user_role,
-            "updatedAt": datetime.now().isoformat()
-        })
-        # log
-        add_log(f"User login: {login_data.email} ({user_role})", log_type="login")
-        access_token = create_access_token({
-            "sub": login_data.email,
-            "email": login_data.email,
-            "uid": user.uid,
-            "role": user_role
-        })
 
-        response.set_cookie(
-            key="access_token",
-            value=access_token,
-            httponly=True,
-            secure=JWT_SECURE_ENV,
-            samesite=JWT_SAMESITE_ENV,
-            max_age=JWT_EXPIRY_MINUTES * 60,
-            domain=JWT_Domain,
-            path="/"
-        )
-
-        return {
-            "Name": "UserSession",
-            "access_token": "stored_in_cookie",
-            "token_type": "cookie",
-            "expires_in": JWT_EXPIRY_MINUTES * 60,
-            "role": user_role
-        }
-
-    except auth.UserNotFoundError:
-        # new: ici log admin rate pour compte pas connu de admin (random@jemlo.com)
-        if is_jemlo_domain:
-            add_log(
-                f"Failed admin login (unknown user): {login_data.email}",
-                log_type="failed_login"
-            )
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-@app.post("/api/admin/login", response_model=Token)
+@router.post("/api/admin/login", response_model=Token)
 async def admin_login(login_data: AdminLogin, response: Response, request: Request):
-    print(f"🔍 Login attempt for: {login_data.email}")
+    logger.info("Login attempt", extra={"email": login_data.email})
 
     # 1) Check if IP is blocked for this email
-    check_block(request, login_data.email)
+    # (the limiter may be SQLite: kept off the event loop like Firebase calls)
+    await run_in_threadpool(check_block, request, login_data.email)
 
     # ========== SUPER ADMIN ==========
     if login_data.email == ADMIN_EMAIL and login_data.password == ADMIN_PASSWORD:
-        print("✅ Super admin login successful")
+        logger.info("Super admin login successful")
         add_log(f"Super admin login: {login_data.email}", log_type="login")
         access_token = create_access_token({
             "sub": login_data.email,
@@ -388,16 +1080,11 @@ async def admin_login(login_data: AdminLogin, response: Response, request: Reque
     user_role = "admin" if is_jemlo_domain else "client"
 
     try:
-        print(f"🔍 Firebase login: {login_data.email}")
-        user = auth.get_user_by_email(login_data.email)
-        import requests
-        firebase_api_key = os.getenv("FIREBASE_API_KEY")
-        url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={firebase_api_key}"
-        fb_response = requests.post(url, json={
-            "email": login_data.email,
-            "password": login_data.password,
-            "returnSecureToken": True
-        })
+        logger.debug("Firebase login", extra={"email": login_data.email})
+        user = await firebase_pool.run(auth.get_user_by_email, login_data.email)
+        fb_response = await identity_client.sign_in_with_password(
+            login_data.email, login_data.password
+        )
 
         if fb_response.status_code != 200:
             # log failed admin login
@@ -407,18 +1094,19 @@ async def admin_login(login_data: AdminLogin, response: Response, request: Reque
                     log_type="failed_login"
                 )
             # 2) Register failed attempt (for protected domains)
-            register_failed_attempt(request, login_data.email)
+            await run_in_threadpool(register_failed_attempt, request, login_data.email)
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         # success path unchanged...
         # (no need to call register_failed_attempt here)
 
         user_ref = db.reference(f"/users/{user.uid}")
-        user_ref.update({
+        await firebase_pool.run(user_ref.update, {
             "email": login_data.email,
             "role": user_role,
             "updatedAt": datetime.now().isoformat()
         })
+        user_cache.delete(user.uid)
         add_log(f"User login: {login_data.email} ({user_role})", log_type="login")
 
         access_token = create_access_token({
@@ -453,11 +1141,11 @@ async def admin_login(login_data: AdminLogin, response: Response, request: Reque
                 log_type="failed_login"
             )
         # 3) Also count this as failed for IP when protected domain
-        register_failed_attempt(request, login_data.email)
+        await run_in_threadpool(register_failed_attempt, request, login_data.email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
 
-@app.get("/api/admin/verify")
+@router.get("/api/admin/verify")
 async def verify_admin_token(admin: dict = Depends(verify_token)):
     """Verify admin token is valid - returns simple success"""
     return {
@@ -468,33 +1156,37 @@ async def verify_admin_token(admin: dict = Depends(verify_token)):
     }
 
 # Endpoints protégés pour les admins uniquement (@jemlo.be)
-@app.get("/api/admin/contact-requests")
+@router.get("/api/admin/contact-requests")
 async def get_contact_requests(admin: dict = Depends(verify_admin_role)):
     """Récupérer les demandes de contact - Accès réservé aux admins @jemlo.be"""
     try:
         ref = db.reference('/contact_requests')
-        requests = ref.get()
+        requests = await firebase_pool.run(ref.get)
         return {"success": True, "data": requests or {}}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur: {str(e)}"
         )
 
-@app.get("/api/admin/content")
+@router.get("/api/admin/content")
 async def get_content(admin: dict = Depends(verify_admin_role)):
     """Récupérer le contenu - Accès réservé aux admins @jemlo.be"""
     try:
         ref = db.reference('/content')
-        content = ref.get()
+        content = await firebase_pool.run(ref.get)
         return {"success": True, "data": content or {}}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur: {str(e)}"
         )
 
-@app.post("/api/admin/logout")
+@router.post("/api/admin/logout")
 async def logout(response: Response):
     response.set_cookie(
         key="access_token",
@@ -508,7 +1200,7 @@ async def logout(response: Response):
     )
     return {"message": "Logged out successfully"}
 
-@app.post("/api/admin/create-user")
+@router.post("/api/admin/create-user")
 async def create_user(
     user_data: CreateUserRequest,
     admin: dict = Depends(verify_admin_role),
@@ -520,7 +1212,8 @@ async def create_user(
         user_role = "admin" if is_jemlo_domain else "client"
 
         # Créer le nouvel utilisateur dans Firebase Authentication
-        user = auth.create_user(
+        user = await firebase_pool.run(
+            auth.create_user,
             email=user_data.email,
             password=user_data.password,
             email_verified=False
@@ -528,13 +1221,14 @@ async def create_user(
 
         # Stocker des infos supplémentaires dans Realtime Database
         user_ref = db.reference(f'/users/{user.uid}')
-        user_ref.set({
+        await firebase_pool.run(user_ref.set, {
             'email': user_data.email,
             'createdAt': datetime.now().isoformat(),
             'createdBy': admin.get('email'),
             'role': user_role,
             'organisation': user_data.organisation
         })
+        user_cache.delete(user.uid)
 
         return {
             "success": True,
@@ -549,168 +1243,283 @@ async def create_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cet email existe déjà"
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error creating user: {e}")
+        logger.exception("Error creating user")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors de la création de l'utilisateur: {str(e)}"
         )
 
-@app.get("/api/admin/logs")
+@router.get("/api/admin/logs")
 async def get_logs(
     admin: dict = Depends(verify_admin_role),
-    limit: int = 50
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None
 ):
     """
-    Return the latest 'limit' log entries.
+    Return the latest 'limit' log entries, newest first.
+    Pass the "id" of the last entry as `before` for the next (older) page,
+    or the "id" of the first one as `after` for newer entries.
     """
     try:
-        ref = db.reference("/logs")
-        data = ref.get() or {}
-
-        # Firebase va push {push_id: {timestamp, message, type}}
-        logs = list(data.values())
-
-        # sort by time
-        logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-
-        return logs[:limit]
-    except Exception as e:
-        print(f"Error get_logs: {e}")
+        return await firebase_pool.run(
+            read_log_page, logstore.LOGS_PATH, limit, before=before, after=after
+        )
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error get_logs")
         raise HTTPException(
             status_code=500,
             detail="Limité aux admins"
         )
 #ici les alerts admin vers la db
-@app.get("/api/admin/alerts")
+@router.get("/api/admin/alerts")
 async def get_alerts(
     admin: dict = Depends(verify_admin_role),
-    limit: int = 20
+    limit: int = 20,
+    before: Optional[str] = None,
+    after: Optional[str] = None
 ):
     """
-    Return the latest 'limit' failed admin login alerts.
+    Return the latest 'limit' failed admin login alerts, from the /alerts
+    index written by add_log (before rebuild-alerts, from the latest /logs
+    entries). Same cursors as /api/admin/logs.
     """
     try:
-        ref = db.reference("/logs")
-        data = ref.get() or {}
-
-        logs = list(data.values())
-
-        # Keep only failed_login type
-        alerts = [log for log in logs if log.get("type") == "failed_login"]
-
-        alerts.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-
-        return alerts[:limit]
-    except Exception as e:
-        print(f"Error get_alerts: {e}")
+        return await firebase_pool.run(read_alerts_page, limit, before=before, after=after)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error get_alerts")
         raise HTTPException(
             status_code=500,
             detail="Erreur lors de la récupération des alertes"
         )
 
-@app.get("/api/admin/stats_total")
-async def get_dashboard_stats(admin: dict = Depends(verify_token)):
-    """
-    Récupère les statistiques globales pour le dashboard admin.
-    Nécessite un token admin valide.
-    """
-    try:
-        # Récupérer toutes les données à la racine
-        ref = db.reference('/')
-        all_data = ref.get()
-
-        if not all_data:
-            return {
-                "active_fountains": 0,
-                "total_water": 0,
-                "total_plastic": 0,
-                "growth": 0  # Valeur fictive pour l'instant
-            }
-
-        total_water = 0.0
-        total_plastic = 0.0
-        unique_fountains = set()  # Pour compter réellement les machines uniques
-
-        # 1. Niveau 1 : Les Dates (ex: "2025-12-10")
-        for date_key, date_content in all_data.items():
-            if not isinstance(date_key, str) or len(date_key) != 10 or not date_key.startswith('20'):
-                continue
+def shared_version() -> Optional[int]:
+    """/rollups/version, bumped by every ingest batch (see conditional.py)."""
+    return db.reference(f'/{rollups.VERSION_PATH}').get()
 
-            if isinstance(date_content, dict):
-                # 2. Niveau 2 : Les Lieux (ex: "EPHEC01")
-                for location_key, location_content in date_content.items():
-                    if isinstance(location_content, dict):
 
-                        # 3. Niveau 3 : Les Machines (ex: "M01", "M02")
-                        for machine_key, machine_data in location_content.items():
-                            if isinstance(machine_data, dict):
-                                # Récupération des données finales
-                                # On utilise float() pour éviter les erreurs si c'est un int ou string
-                                total_water += float(machine_data.get('waterLiters', 0))
-                                total_plastic += float(machine_data.get('plasticRecycledGrams', 0))
-
-                                # On ajoute l'ID unique de la machine (Lieu + Nom) au set
-                                # Cela permet de calculer "active_fountains" dynamiquement
-                                unique_fountains.add(f"{location_key}_{machine_key}")
+def read_versioned(read, *args):
+    """
+    (read(*args), the shared version it was read at), or None as the version
+    when a batch was written during the read.
+    """
+    before = shared_version()
+    value = read(*args)
+    return value, (before or 0) if shared_version() == before else None
 
-        return {
-            "active_fountains": len(unique_fountains),  # Maintenant dynamique !
-            "total_water": round(total_water, 2),
-            "total_plastic": round(total_plastic, 2),
-            "bottles_saved": int(total_plastic / 42)
-        }
 
-    except Exception as e:
-        print(f"Error stats: {e}")
+async def replica_answer(key: tuple, compute, *args):
+    """
+    compute(*args) on the analytics store, cached until the store changes.
+    Misses run in firebase_pool: the whole-history aggregations of the super
+    admin would otherwise hold the event loop on every poll.
+    """
+    key = key + (analytics.version,)
+    result = replica_cache.get(key)
+    if result is None:
+        result = await firebase_pool.run(compute, *args, key=("replica",) + key)
+        replica_cache.set(key, result)
+    return result
+
+
+def read_dashboard_stats() -> dict:
+    # Les totaux sont maintenus à chaque écriture, une fois construits par
+    # rebuild-rollups: avant, /rollups/total ne compte que les nouveaux relevés
+    # et le total est recalculé jour par jour depuis l'arbre brut
+    if not migration_done(rollups.ROLLUPS_MIGRATION):
+        total = raw_totals_cache.get("total")
+        if total is None:
+            total = rollups.build_rollups(day_reader.iter_days("/"))["total"]
+            raw_totals_cache.set("total", total)
+        return rollups.dashboard_stats(total)
+    total = db.reference(f'/{rollups.ROLLUP_ROOT}/total').get()
+    return rollups.dashboard_stats(total)
+
+
+@router.get("/api/admin/stats_total")
+async def get_dashboard_stats(
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
+    admin: dict = Depends(verify_token),
+):
+    """
+    Récupère les statistiques globales pour le dashboard admin.
+    Nécessite un token admin valide. 304 si If-None-Match est à jour.
+    """
+    try:
+        if replica.fresh():
+            stats = await replica_answer(("stats_total",), lambda: rollups.dashboard_stats(analytics.totals()))
+            return response_versions.check(("stats_total",), stats, if_none_match, response)
+
+        cached = dashboard_cache.get(("stats_total",))
+        if cached is not None:
+            return response_versions.check(("stats_total",), cached, if_none_match, response)
+
+        # Requêtes simultanées: une seule lecture, partagée (voir dataaccess.py)
+        stats, version = await firebase_pool.run(read_versioned, read_dashboard_stats, key=("stats_total",))
+        dashboard_cache.set(("stats_total",), stats)
+        return response_versions.check(("stats_total",), stats, if_none_match, response, version)
+
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error stats")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erreur lors de la récupération des statistiques"
         )
 
-@app.get("/api/admin/fountain_graph")
-async def get_graph_stat(admin: dict = Depends(verify_token)):
+def format_graph_date(date_str: str, granularity: str = "day") -> str:
+    """"2025-12-01" -> "1 Dec", a week by its Monday, "2025-12" -> "Dec 2025" """
+    if granularity == "month":
+        return datetime.strptime(date_str, "%Y-%m").strftime("%b %Y")
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    return date_obj.strftime("%d %b").lstrip("0")
+
+
+def parse_date_param(value: Optional[str], name: str) -> Optional[str]:
+    if value is None:
+        return None
     try:
-        ref = db.reference('/')
-        all_data = ref.get()
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Paramètre '{name}' invalide (format YYYY-MM-DD)")
 
-        if not all_data:
-            return {"dates": [], "water_consumed": []}
 
-        dates = []
-        water_daily = []
+def live_snapshot(organisation: Optional[str], start: Optional[str] = None) -> dict:
+    """Graph data sent when a live dashboard connects (or falls behind)"""
+    date_keys, water_daily = analytics.daily_water(organisation, start)
+    return {
+        "days": date_keys,
+        "dates": [format_graph_date(date_str) for date_str in date_keys],
+        "water_consumed": water_daily,
+    }
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def live_events(request: Request, subscription, snapshot: dict):
+    try:
+        yield sse_event("snapshot", snapshot)
+        while True:
+            try:
+                seq, items = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Rouvre le listener après minuit ou s'il a été fermé
+                await firebase_pool.run(live_feed.ensure_listener)
+                yield ": ping\n\n"
+                continue
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                yield sse_event("snapshot", live_feed.resync(subscription))
+            elif seq > subscription.seen:
+                yield sse_event("delta", items)
+    finally:
+        live_feed.unsubscribe(subscription)
+
+
+@router.get("/api/admin/live")
+async def live_dashboard(
+    request: Request,
+    date_from: Annotated[Optional[str], Query(alias="from")] = None,
+    admin: dict = Depends(verify_token),
+):
+    """
+    Server-Sent Events: a "snapshot" event with the graph data (days from
+    `from` on), then "delta" events with what each machine of today moved by.
+    Filtered on the organisation of the admin, all organisations for a super
+    admin.
+    """
+    date_from = parse_date_param(date_from, "from")
+    try:
+        if admin.get("role") == "super_admin":
+            organisation = None
+        else:
+            organisation = (await firebase_pool.run(get_admin_organisation, admin=admin)).upper()
 
-        sorted_keys = sorted(
-            [k for k in all_data.keys() if k != "users" and len(k) == 10]
+        await firebase_pool.run(refresh_analytics, date_from)
+        subscription, snapshot = await firebase_pool.run(
+            live_feed.subscribe, organisation, asyncio.get_running_loop(),
+            lambda: live_snapshot(organisation, date_from),
         )
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error live dashboard")
+        raise HTTPException(status_code=500, detail="Erreur flux temps réel")
+
+    return StreamingResponse(
+        live_events(request, subscription, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        for date_str in sorted_keys:
-            day_total_water = 0.0
-            day_data = all_data[date_str]
 
-            # EPHEC01, EPHEC02, ...
-            for fountain in day_data.values():
-                if not isinstance(fountain, dict):
-                    continue
+def compute_graph(organisation: Optional[str], date_from: Optional[str], date_to: Optional[str],
+                  granularity: str) -> dict:
+    refresh_analytics(date_from)
+    date_keys, water_daily = analytics.daily_water(organisation, start=date_from, end=date_to)
+    if not date_keys:
+        return {"dates": [], "water_consumed": []}
 
-                # M01, M02, ...
-                for machine in fountain.values():
-                    day_total_water += float(machine.get("waterLiters", 0))
+    periods, water = bucket(date_keys, water_daily, granularity)
+    return {
+        "dates": [format_graph_date(period, granularity) for period in periods],
+        "water_consumed": water
+    }
 
-            # Format date
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            formatted_date = date_obj.strftime("%d %b").lstrip("0")
 
-            dates.append(formatted_date)
-            water_daily.append(round(day_total_water, 2))
+@router.get("/api/admin/fountain_graph", response_model=dict)
+async def get_graph_stat(
+    date_from: Annotated[Optional[str], Query(alias="from")] = None,
+    date_to: Annotated[Optional[str], Query(alias="to")] = None,
+    granularity: Literal["day", "week", "month"] = "day",
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
+    admin: dict = Depends(verify_token),
+):
+    """
+    Water consumed per day, week or month, between `from` and `to`
+    (YYYY-MM-DD, inclusive). Only the days of that window are read from
+    Firebase the first time they are needed. Filtered on the organisation of
+    the admin like the live snapshot, all organisations for a super admin.
+    """
+    date_from = parse_date_param(date_from, "from")
+    date_to = parse_date_param(date_to, "to")
+    try:
+        if admin.get("role") == "super_admin":
+            organisation = None
+        else:
+            organisation = (await firebase_pool.run(get_admin_organisation, admin=admin)).upper()
 
-        return {
-            "dates": dates,
-            "water_consumed": water_daily
-        }
+        cache_key = ("fountain_graph", organisation, date_from, date_to, granularity)
+        cached = dashboard_cache.get(cache_key)
+        if cached is not None:
+            return response_versions.check(cache_key, cached, if_none_match, response)
 
-    except Exception as e:
-        print(f"Error graph data: {e}")
+        graph = await firebase_pool.run(
+            compute_graph, organisation, date_from, date_to, granularity, key=cache_key
+        )
+        if graph["dates"]:
+            dashboard_cache.set(cache_key, graph)
+        return response_versions.check(cache_key, graph, if_none_match, response)
+
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error graph data")
         raise HTTPException(status_code=500, detail="Erreur graphique")
 
 class MachineStats(BaseModel):
@@ -724,6 +1533,59 @@ class FountainStats(BaseModel):
     machines: List[MachineStats]
 
 
+@router.get("/api/admin/cache-stats")
+async def get_cache_stats(admin: dict = Depends(verify_admin_role)):
+    """Compteurs hit/miss du cache des endpoints du dashboard"""
+    return dashboard_cache.stats()
+
+
+for name, component in (("dashboard", dashboard_cache), ("token", token_cache), ("user", user_cache)):
+    metrics.gauges("jemlo_cache", "TTL cache counters (see cache.py)", component.stats, {"cache": name})
+metrics.gauges("jemlo_conditional", "ETag revalidations of the polled endpoints", response_versions.stats)
+metrics.gauges("jemlo_day_reader", "Day range reads (see dataaccess.py)", day_reader.stats)
+metrics.gauges("jemlo_snapshots", "Sealed days of read_item (see snapshots.py)", day_snapshots.stats)
+metrics.gauges("jemlo_ingest", "Readings write buffer (see ingest.py)", ingest_buffer.stats)
+metrics.gauges("jemlo_spool", "Readings spool (see spool.py)", spool.stats)
+metrics.gauges("jemlo_spool_replay", "Spool replayer (see spool.py)", spool_replayer.stats)
+metrics.gauges("jemlo_audit_log", "Admin log writer (see auditlog.py)", audit_log.stats)
+metrics.gauges("jemlo_firebase_pool", "Blocking Firebase call pool (see dataaccess.py)", firebase_pool.stats)
+metrics.gauges("jemlo_live", "Live dashboard feed (see livefeed.py)", live_feed.stats)
+metrics.gauges("jemlo_replica", "Date tree replica (see replica.py)", replica.stats)
+metrics.gauges("jemlo_log", "Structured log records (see applog.py)", applog.stats)
+metrics.gauges("jemlo_process", "Worker startup and memory", process_stats)
+
+
+@router.get("/ready")
+def readiness():
+    """200 une fois le warm-up terminé (load balancer, rolling deploy)"""
+    if not startup["ready"]:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Démarrage en cours")
+    return {"status": "ready", **process_stats()}
+
+
+@router.get("/metrics")
+def get_metrics(request: Request):
+    """Métriques au format texte Prometheus"""
+    if not METRICS_TOKEN and METRICS_REQUIRE_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Métriques désactivées (METRICS_TOKEN)")
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalide")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def get_user_profile(uid: str) -> Optional[dict]:
+    """
+    /users/{uid}, cached for USER_CACHE_TTL_SECONDS. create_user and the
+    login path drop the entry when they write the profile.
+    """
+    user_data = user_cache.get(uid)
+    if user_data is None:
+        user_data = db.reference(f"/users/{uid}").get()
+        if user_data is not None:
+            user_cache.set(uid, user_data)
+    return user_data
+
+
 def get_admin_organisation(admin: dict = Depends(verify_admin_role)) -> str:
     """
     Retourne l'organisation liée à l'utilisateur courant (admin).
@@ -737,8 +1599,7 @@ def get_admin_organisation(admin: dict = Depends(verify_admin_role)) -> str:
             detail="UID manquant dans le token"
         )
 
-    user_ref = db.reference(f"/users/{uid}")
-    user_data = user_ref.get()
+    user_data = get_user_profile(uid)
     if not user_data or "organisation" not in user_data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -747,82 +1608,191 @@ def get_admin_organisation(admin: dict = Depends(verify_admin_role)) -> str:
 
     return user_data["organisation"]
 
-@app.get("/api/admin/fountains", response_model=dict)
+def read_fountains(organisation: Optional[str], date: Optional[str], compact: bool = False) -> dict:
+    """
+    Reads only what the caller can see: /by_org/{org} for an organisation,
+    one /{date} node, or /rollups/machines for a super admin over all dates.
+    compact: first/last day and a day count instead of every date, read
+    from /rollups/machines/{org} for an organisation over all dates. A super
+    admin asking for every date of every machine (no date, not compact) gets
+    the whole date tree streamed: the rollups have no dates.
+
+    /by_org and /rollups are partial until backfill-by-org and
+    rebuild-rollups have run: until their marker is set the raw date tree
+    is read instead (raw_fountains).
+    """
+    if organisation and (date or not compact):
+        needed = rollups.BY_ORG_MIGRATION
+    elif not date and compact:
+        needed = rollups.ROLLUPS_MIGRATION
+    else:
+        needed = None  # one raw /{date} node, or all of them
+    if needed and not migration_done(needed):
+        logger.warning("Fountains read from the date tree, migration not done", extra={"migration": needed})
+        return raw_fountains(organisation, date, compact)
+
+    if organisation and compact and not date:
+        machines_rollup = db.reference(f"/{rollups.ROLLUP_ROOT}/machines/{organisation}").get()
+        days = db.reference(f"/{rollups.ROLLUP_ROOT}/orgs/{organisation}/days").get(shallow=True) or {}
+        return {
+            "organisation": organisation,
+            "total_dates": len(days),
+            "machines": rollups.rollup_machines({organisation: machines_rollup} if machines_rollup else None),
+        }
+
+    if organisation:
+        path = f"/{rollups.BY_ORG_ROOT}/{organisation}"
+        if date:
+            days = [(date, db.reference(f"{path}/{date}").get() or {})]
+        else:
+            days = day_reader.iter_days(path)
+        dates = []
+
+        def org_days():
+            for day, machines in days:
+                dates.append(day)
+                yield day, {organisation: machines}
+
+        machines = rollups.fountain_machines(org_days())
+        if compact:
+            machines = rollups.compact_machines(machines)
+        return {"organisation": organisation, "total_dates": len(dates), "machines": machines}
+
+    if date:
+        machines = rollups.fountain_machines({date: db.reference(f"/{date}").get() or {}})
+        return {
+            "organisation": "ALL_ORGS (Super Admin)",
+            "total_dates": 1,
+            "machines": rollups.compact_machines(machines) if compact else machines,
+        }
+
+    if not compact:
+        return raw_fountains(None, None)
+
+    machines_rollup = db.reference(f"/{rollups.ROLLUP_ROOT}/machines").get()
+    days = db.reference(f"/{rollups.ROLLUP_ROOT}/days").get(shallow=True) or {}
+    return {
+        "organisation": "ALL_ORGS (Super Admin)",
+        "total_dates": len(days),
+        "machines": rollups.rollup_machines(machines_rollup),
+    }
+
+
+def raw_fountains(organisation: Optional[str], date: Optional[str], compact: bool = False) -> dict:
+    """read_fountains from the raw date tree (before the migrations), same shapes."""
+    days = [(date, db.reference(f"/{date}").get() or {})] if date else day_reader.iter_days("/")
+    dates = []
+
+    def visible_days():
+        for day, node in days:
+            if organisation:
+                node = {organisation: node[organisation]} if isinstance(node, dict) and organisation in node else {}
+            if node:
+                dates.append(day)
+                yield day, node
+
+    machines = rollups.fountain_machines(visible_days())
+    if compact:
+        machines = rollups.compact_machines(machines)
+    return {
+        "organisation": organisation or "ALL_ORGS (Super Admin)",
+        "total_dates": 1 if date else len(dates),
+        "machines": machines,
+    }
+
+
+def replica_fountains(organisation: Optional[str], date: Optional[str], compact: bool = False) -> dict:
+    """read_fountains answered from the analytics store (replica mode), same shapes."""
+    machines, total_dates = analytics.machine_totals(organisation, date, compact=compact)
+    return {
+        "organisation": organisation or "ALL_ORGS (Super Admin)",
+        "total_dates": 1 if date else total_dates,
+        "machines": machines,
+    }
+
+
+# Champs des machines de /api/admin/fountains, pour `fields=`
+FOUNTAIN_FIELDS = frozenset({
+    "machine_id", "water_liters", "plastic_grams", "organisations",
+    "dates_seen", "first_seen", "last_seen", "days_seen",
+})
+
+
+@router.get("/api/admin/fountains", response_model=dict)
 async def get_fountains_for_org(
     date: Optional[str] = None,
+    compact: bool = False,
+    fields: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
     admin: dict = Depends(verify_token),
 ):
     try:
         # FIXED: Super admin bypasses organisation check
         if admin.get("role") == "super_admin":
             organisation = None  # All orgs
-            print("🔥 SUPER ADMIN: Showing ALL organisations")
+            logger.debug("Fountains for all organisations")
         else:
-            organisation = get_admin_organisation(admin=admin).upper()
-            print(f"Admin org: {organisation}")
+            organisation = (await firebase_pool.run(get_admin_organisation, admin=admin)).upper()
+            logger.debug("Fountains for organisation", extra={"organisation": organisation})
+
+        projection = parse_fields(fields)
+        if projection and not projection <= FOUNTAIN_FIELDS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Champs inconnus: {', '.join(sorted(projection - FOUNTAIN_FIELDS))}",
+            )
 
-        # Rest of your aggregation logic stays EXACTLY the same...
-        if date:
-            if organisation:
-                date_ref = db.reference(f"/{date}/{organisation}")
-                all_data = {date: date_ref.get() or {}}
-            else:  # Super admin
-                date_ref = db.reference(f"/{date}")
-                all_data = {date: date_ref.get() or {}}
+        cache_key = ("fountains", organisation, date, compact)
+        if replica.fresh():
+            result = await replica_answer(cache_key, replica_fountains, organisation, date, compact)
         else:
-            root_ref = db.reference("/")
-            all_data = root_ref.get() or {}
-            date_data = {}
-            for date_key in all_data:
-                if len(date_key) == 10 and isinstance(all_data[date_key], dict):
-                    date_dict = all_data[date_key]
-                    if organisation:
-                        if organisation in date_dict:
-                            date_data[date_key] = {organisation: date_dict[organisation]}
-                    else:  # Super admin - all orgs
-                        org_data = {k: v for k, v in date_dict.items() if isinstance(v, dict)}
-                        if org_data:
-                            date_data[date_key] = org_data
-            all_data = date_data
-
-        # FIXED: Track organisations PER MACHINE
-        machines = {}
-        for date_key, date_org_data in all_data.items():
-            for org_key, org_data in (date_org_data.items() if isinstance(date_org_data, dict) else {}.items()):
-                if not isinstance(org_data, dict):
-                    continue
-                for machine_id, machine_data in org_data.items():
-                    if not isinstance(machine_data, dict):
-                        continue
-                    water = float(machine_data.get("waterLiters", 0) or 0)
-                    plastic = float(machine_data.get("plasticRecycledGrams", 0) or 0)
-
-                    if machine_id not in machines:
-                        machines[machine_id] = {
-                            "water_liters": 0,
-                            "plastic_grams": 0,
-                            "dates": [],
-                            "organisations": []  # ← NEW: Track orgs
-                        }
-
-                    machines[machine_id]["water_liters"] += water
-                    machines[machine_id]["plastic_grams"] += plastic
-                    machines[machine_id]["dates"].append(date_key)
-                    machines[machine_id]["organisations"].append(org_key)  # ← NEW
-
-        machines_list = [{
-            "machine_id": mid,
-            "water_liters": round(s["water_liters"], 2),
-            "plastic_grams": round(s["plastic_grams"], 2),
-            "dates_seen": s["dates"],
-            "organisations": list(set(s["organisations"]))  # ← NEW: Unique orgs
-        } for mid, s in machines.items()]
-
-        return {
-            "organisation": organisation or "ALL_ORGS (Super Admin)",
-            "total_dates": len(all_data),
-            "machines": machines_list
-        }
-    except Exception as e:
-        print(f"Error get_fountains_for_org: {e}")
+            result = dashboard_cache.get(cache_key)
+        version = None
+        if result is None:
+            result, version = await firebase_pool.run(
+                read_versioned, read_fountains, organisation, date, compact, key=cache_key
+            )
+            dashboard_cache.set(cache_key, result)
+        # Une version par projection: deux `fields` n'ont pas le même contenu
+        result = response_versions.check(cache_key + (projection,), result, if_none_match, response, version)
+        if projection:
+            result = dict(result, machines=[project(machine, projection) for machine in result["machines"]])
+        return result
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error get_fountains_for_org")
         raise HTTPException(500, "Erreur lors de la récupération des fontaines")
+
+
+def create_app() -> FastAPI:
+    """
+    App factory: `uvicorn main:create_app --factory`, or `python cli.py serve`
+    for the production mode. The state (caches, buffers, Firebase) stays at
+    module level, one copy per worker process.
+    """
+    application = FastAPI(title="FastAPI Docker Template", lifespan=lifespan)
+
+    #Cors Security MiddleWare that will eventually need to be configured but i am lazy
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:8080",   # For test enviroments
+            "https://jemlofontaine.onrender.com",
+            "https://tvalcke.github.io/Jemlo"
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # gzip (pas de brotli dans les dépendances): les dates_seen des fontaines
+    # et les longues séries du graphique; text/event-stream n'est pas compressé
+    application.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=6)
+    application.add_middleware(MetricsMiddleware, requests=http_requests, latency=http_latency)
+    application.include_router(router)
+    return application
+
+
+app = create_app()
+startup["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
@@ -0,0 +1,285 @@
+"""
+Prometheus metrics for the backend, exposed on /metrics.
+
+Written here rather than with prometheus_client: the backend only needs
+counters and histograms with a few labels, and the stats() of the caches,
+buffers and pools are read when /metrics is scraped (collectors) instead of
+being duplicated into metric objects.
+
+- MetricsMiddleware: latency histogram and status counts per route template
+  (/api/read-item/{item_id}, not the raw path, to keep the label set small)
+- InstrumentedDatabase wraps anything with the `db.reference(path)` API
+  (firebase_admin.db, storage.LocalDatabase) and, with the
+  IdentityToolkitClient(observe=...) hook, feeds the backend call metrics
+"""
+import json
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            state = self._values.get(labels)
+            return state[-1] if state else 0
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labels, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(self, prefix: str, help: str, stats, labels: dict = None):
+        """
+        Publish the numeric values of stats() as `{prefix}_{key}` gauges,
+        read at scrape time. Several calls may share a prefix with other labels.
+        """
+        self._collectors.append((prefix, help, stats, dict(labels or {})))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        gauges = {}  # name -> (help, [lines])
+        for prefix, help, stats, labels in self._collectors:
+            try:
+                values = stats()
+            except Exception:  # a broken collector must not break the scrape
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                entry = gauges.setdefault(name, (help, []))
+                entry[1].append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        for name, (help, samples) in gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: one latency observation and one status count per HTTP request."""
+
+    def __init__(self, app, requests: Counter, latency: Histogram):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Set by the router once a route matched
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            self.latency.observe(time.perf_counter() - started, method, route)
+            self.requests.inc(method, route, str(status[0]))
+
+
+def payload_bytes(value) -> int:
+    """Size of a value as JSON, what the RTDB REST API sends or returns."""
+    if value is None:
+        return 0
+    return len(json.dumps(value, separators=(",", ":"), default=str))
+
+
+class InstrumentedDatabase:
+    """
+    Database wrapper counting every get/set/update/push/delete (and query get)
+    with its latency and, when measure_payload is set, the JSON bytes sent or
+    received. Sizing a large get costs a serialization, hence the switch.
+    """
+
+    def __init__(self, database, calls: Counter, latency: Histogram, payload: Counter,
+                 measure_payload: bool = True):
+        self.database = database
+        self.calls = calls
+        self.latency = latency
+        self.payload = payload
+        self.measure_payload = measure_payload
+
+    def reference(self, path: str = "/"):
+        return _InstrumentedReference(self, self.database.reference(path))
+
+    def _call(self, op: str, func, *args, sent=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.calls.inc(op, "error")
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started, op)
+        self.calls.inc(op, "ok")
+        if self.measure_payload:
+            if sent is not None:
+                self.payload.inc(op, "sent", amount=payload_bytes(sent))
+            elif op in ("get", "query"):
+                self.payload.inc(op, "received", amount=payload_bytes(result))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+
+class _InstrumentedReference:
+    def __init__(self, owner: InstrumentedDatabase, reference):
+        self._owner = owner
+        self._reference = reference
+
+    def get(self, *args, **kwargs):
+        return self._owner._call("get", self._reference.get, *args, **kwargs)
+
+    def set(self, value):
+        return self._owner._call("set", self._reference.set, value, sent=value)
+
+    def update(self, value):
+        return self._owner._call("update", self._reference.update, value, sent=value)
+
+    def push(self, value=""):
+        pushed = self._owner._call("push", self._reference.push, value, sent=value)
+        return _InstrumentedReference(self._owner, pushed)
+
+    def delete(self):
+        return self._owner._call("delete", self._reference.delete)
+
+    def child(self, path: str):
+        return _InstrumentedReference(self._owner, self._reference.child(path))
+
+    def order_by_key(self):
+        return _InstrumentedQuery(self._owner, self._reference.order_by_key())
+
+    def order_by_child(self, path: str):
+        return _InstrumentedQuery(self._owner, self._reference.order_by_child(path))
+
+    def order_by_value(self):
+        return _InstrumentedQuery(self._owner, self._reference.order_by_value())
+
+    def __getattr__(self, name):  # key, path, listen...
+        return getattr(self._reference, name)
+
+
+class _InstrumentedQuery:
+    def __init__(self, owner: InstrumentedDatabase, query):
+        self._owner = owner
+        self._query = query
+
+    def get(self):
+        return self._owner._call("query", self._query.get)
+
+    def __getattr__(self, name):
+        # start_at, end_at, limit_to_first... return a new query to wrap again
+        attribute = getattr(self._query, name)
+        if not callable(attribute):
+            return attribute
+
+        def chained(*args, **kwargs):
+            return _InstrumentedQuery(self._owner, attribute(*args, **kwargs))
+        return chained
@@ -0,0 +1,177 @@
+"""
+Rate limiting for the login and the fountain endpoints.
+
+A Limiter counts events per key (client IP) with a sliding-window counter:
+the count of the current fixed window plus the previous window's count
+weighted by how much of it still overlaps. That is O(1) work and a few numbers
+of state per key. Once `limit` events are counted the key is refused, either
+until the window slides (block_seconds=0) or for block_seconds.
+
+The state lives in a backend:
+- MemoryBackend: per process, expired keys are evicted, size is bounded
+- SQLiteBackend: one file shared by every uvicorn worker of the host, so
+  `--workers 4` does not give each worker its own allowance
+"""
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()  # key -> (expires_at, state), oldest touch first
+        self._lock = threading.Lock()
+
+    def transact(self, key: str, func, ttl: float, now: float):
+        """state = func(previous state or None) atomically, kept for ttl seconds."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            state = entry[1] if entry and entry[0] > now else None
+            new_state, result = func(state)
+            if new_state is not None:
+                self._data[key] = (now + ttl, new_state)
+            self._evict(now)
+            return result
+
+    def _evict(self, now: float):
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.max_keys:
+                break
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, sweep_every: int = 1000):
+        self.path = path
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._ops = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit ("
+                " key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def transact(self, key: str, func, ttl: float, now: float):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state, expires_at FROM rate_limit WHERE key = ?", (key,)
+            ).fetchone()
+            state = json.loads(row[0]) if row and row[1] > now else None
+            new_state, result = func(state)
+            if new_state is None:
+                conn.execute("DELETE FROM rate_limit WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit (key, state, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(new_state), now + ttl),
+                )
+            self._ops += 1
+            if self._ops % self.sweep_every == 0:
+                conn.execute("DELETE FROM rate_limit WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class Limiter:
+    def __init__(self, backend, limit: int, window: float, block_seconds: float = 0,
+                 namespace: str = ""):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+        self.block_seconds = block_seconds
+        self.namespace = namespace
+        self.ttl = 2 * window + block_seconds
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _roll(self, state, now):
+        """[window_start, previous_count, current_count, blocked_until] at `now`."""
+        start = math.floor(now / self.window) * self.window
+        if state is None:
+            return [start, 0, 0, 0]
+        old_start, previous, current, blocked_until = state
+        if start == old_start:
+            return state
+        if start - old_start == self.window:
+            return [start, current, 0, blocked_until]
+        return [start, 0, 0, blocked_until]
+
+    def _retry_after(self, state, now) -> float:
+        start, previous, current, blocked_until = state
+        if blocked_until > now:
+            return blocked_until - now
+        elapsed = now - start
+        if previous * (1 - elapsed / self.window) + current < self.limit:
+            return 0.0
+        if current >= self.limit or not previous:
+            return start + self.window - now
+        # The previous window's weight must fall enough to get under limit
+        wait = self.window * (1 - (self.limit - current) / previous) - elapsed
+        return max(wait, 0.001)
+
+    def check(self, key: str, now: float = None) -> float:
+        """Seconds before `key` may try again, 0 if it is not limited."""
+        now = time.time() if now is None else now
+
+        def func(state):
+            if state is None:
+                return None, 0.0
+            state = self._roll(state, now)
+            return state, self._retry_after(state, now)
+
+        return self.backend.transact(self._key(key), func, self.ttl, now)
+
+    def hit(self, key: str, now: float = None) -> float:
+        """Count one event for `key`. Returns the retry delay if it is now limited."""
+        now = time.time() if now is None else now
+
+        def func(state):
+            state = self._roll(state, now)
+            state[2] += 1
+            if self.block_seconds and self._retry_after(state, now) and state[3] <= now:
+                state[3] = now + self.block_seconds
+            return state, self._retry_after(state, now)
+
+        return self.backend.transact(self._key(key), func, self.ttl, now)
+
+    def allow(self, key: str, now: float = None) -> float:
+        """check + hit in one go, for endpoints: 0 when the request may proceed."""
+        now = time.time() if now is None else now
+
+        def func(state):
+            state = self._roll(state, now)
+            retry_after = self._retry_after(state, now)
+            if retry_after:
+                return state, retry_after
+            state[2] += 1
+            if self.block_seconds and self._retry_after(state, now):
+                state[3] = now + self.block_seconds
+            return state, 0.0
+
+        return self.backend.transact(self._key(key), func, self.ttl, now)
+
+    def reset(self, key: str):
+        self.backend.transact(self._key(key), lambda state: (None, None), self.ttl, time.time())
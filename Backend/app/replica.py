@@ -0,0 +1,138 @@
+"""
+Read replica of the date tree (REPLICA_MODE).
+
+The dashboard reads already go through the analytics store (timeseries.py),
+a columnar copy of /{date}/{org}/{machine}, but it is kept current by polling:
+every ANALYTICS_REFRESH_SECONDS a request re-reads the latest days, and
+stats_total and fountains still read the rollups from Firebase. In replica
+mode the store holds the whole history, loaded once at startup (or restored
+from ANALYTICS_DIR, then only the days after the snapshot are read), and the
+live feed listener (livefeed.py) is kept open on today's node: the writes of
+every worker reach the store as Firebase pushes them. stats_total, fountains,
+fountain_graph and the current day of read_item are then answered from
+memory; Firebase is used for the writes and the change feed.
+
+A background thread checks the listener every `interval` seconds and reopens
+it at midnight. Before (re)opening, the days from the previous listened day
+on are read once, so the writes made while no listener was open are not
+missed, and the listener's first event, the whole day node, lands after that
+read. The snapshot is saved every `save_interval` seconds (and at shutdown,
+like the analytics store always was).
+
+staleness() is the time since the replica was last known current: the last
+check that found the listener open on today's node, or the last event. Past
+`max_staleness` (listener that cannot be opened, stuck thread) fresh() is
+False and the endpoints go back to reading Firebase. Like the analytics
+store, past days are treated as final: a day edited by hand in Firebase
+needs a restart without the snapshot.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger("jemlo.replica")
+
+
+class Replica:
+    def __init__(
+        self,
+        store,
+        feed,
+        sync,
+        save=None,
+        interval: float = 5.0,
+        save_interval: float = 300.0,
+        max_staleness: float = 30.0,
+    ):
+        self.store = store  # timeseries.TimeSeriesStore, whole history
+        self.feed = feed  # livefeed.LiveFeed with keep_open
+        self._sync = sync  # sync(start): re-read the days from `start` (None: the latest one) on
+        self._save = save  # save(): write the store snapshot, optional
+        self.interval = interval
+        self.save_interval = save_interval
+        self.max_staleness = max_staleness
+
+        self._checked_at = None  # time.monotonic() of the last successful check
+        self._saved_at = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.syncs = 0
+        self.saves = 0
+        self.failures = 0
+
+    def check(self):
+        """
+        Make sure the listener is open on today's node, reading what it may
+        have missed first. Raises when Firebase cannot be reached.
+        """
+        previous = self.feed.listening_to
+        if previous != self.feed.today():
+            self._sync(previous)
+            self.syncs += 1
+            self.feed.ensure_listener()
+            if self.feed.listening_to != self.feed.today():
+                raise RuntimeError("replica listener not open")
+        self._checked_at = time.monotonic()
+
+    def staleness(self) -> Optional[float]:
+        """Seconds since the replica was last known current, None before the first check."""
+        known = [t for t in (self._checked_at, self.feed.last_event_at) if t is not None]
+        if self._checked_at is None or not known:
+            return None
+        return max(0.0, time.monotonic() - max(known))
+
+    def fresh(self) -> bool:
+        """Whether the reads can be answered from the store."""
+        staleness = self.staleness()
+        return staleness is not None and staleness <= self.max_staleness and self.store.covers(None)
+
+    def save(self):
+        if self._save is not None and self.store.loaded:
+            self._save()
+            self._saved_at = time.monotonic()
+            self.saves += 1
+
+    # ---------- background worker ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._saved_at = time.monotonic()  # just loaded: nothing new to save
+        self._thread = threading.Thread(target=self._run, name="replica", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+                if self._save is not None and time.monotonic() - self._saved_at >= self.save_interval:
+                    self.save()
+            except Exception:
+                self.failures += 1
+                logger.warning("Replica check failed, retrying", exc_info=True,
+                               extra={"staleness_seconds": self.staleness()})
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        staleness = self.staleness()
+        return {
+            "fresh": int(self.fresh()),
+            "staleness_seconds": round(staleness, 3) if staleness is not None else None,
+            "rows": self.store.size,
+            "days": len(self.store.dates),
+            "syncs": self.syncs,
+            "saves": self.saves,
+            "failures": self.failures,
+        }
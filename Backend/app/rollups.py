@@ -0,0 +1,369 @@
+"""
+Running totals for the fountain data, stored next to the raw date tree.
+
+The raw data lives under /{date}/{organisation}/{machine} and every node holds
+the cumulative counters of that machine for that day. Summing the whole tree on
+each dashboard request gets slower every day, so create_item also maintains:
+
+    /rollups/total                              -> whole database
+    /rollups/days/{date}                        -> one day, all organisations
+    /rollups/orgs/{org}/total                   -> one organisation
+    /rollups/orgs/{org}/days/{date}             -> one organisation, one day
+    /rollups/machines/{org}/{machine}           -> one machine (+ firstSeen, lastSeen, days)
+
+Totals are moved with Firebase server-side increments, so a write only sends
+the difference between the new and the previous value of the machine.
+Fountains in delta mode send that difference themselves (delta_updates): then
+the raw node is incremented too, and concurrent writers add up instead of
+overwriting each other.
+
+Each reading is also copied to an organisation-first index,
+
+    /by_org/{org}/{date}/{machine}
+
+so the fountains of one organisation are read without downloading the other
+tenants' days. `backfill-by-org` (cli.py) builds it for existing data.
+
+On a database that already has history, the first write creates
+/rollups/total with its increment alone, so the totals only become right once
+`rebuild-rollups` has recomputed them from the raw tree. Both commands are
+migrations, run once with the writers stopped, and each one ends by writing
+its marker, /migrations/{name}. Until the marker is there stats_total and the
+fountains list are computed from the raw date tree.
+"""
+from typing import Optional
+
+ROLLUP_ROOT = "rollups"
+# Bumped by every ingest batch, in the same update: the ETags (conditional.py)
+VERSION_PATH = f"{ROLLUP_ROOT}/version"
+BY_ORG_ROOT = "by_org"
+MIGRATIONS_ROOT = "migrations"
+ROLLUPS_MIGRATION = "rollups"  # set by rebuild-rollups
+BY_ORG_MIGRATION = "by_org"    # set by backfill-by-org
+FIELDS = ("bottleNumber", "waterLiters", "plasticRecycledGrams")
+
+
+def is_date_key(key) -> bool:
+    """Top-level keys of the date tree look like "2025-12-10"."""
+    return isinstance(key, str) and len(key) == 10 and key.startswith("20")
+
+
+def date_items(tree):
+    """
+    (date, node) pairs of a {date: node} dict in date order, or those of an
+    iterable (dataaccess.DayReader) as they come, so a whole history is folded
+    without being held in memory at once.
+    """
+    if tree is None:
+        return []
+    if isinstance(tree, dict):
+        return [(key, tree[key]) for key in sorted(tree)]
+    return tree
+
+
+def increment(value):
+    """Firebase RTDB server value that adds `value` to the stored number."""
+    return {".sv": {"increment": value}}
+
+
+def machine_values(node: Optional[dict]) -> dict:
+    """Read the counters of a machine node, missing values count as 0."""
+    node = node if isinstance(node, dict) else {}
+    values = {}
+    for field in FIELDS:
+        raw = node.get(field, 0) or 0
+        values[field] = int(raw) if field == "bottleNumber" else float(raw)
+    return values
+
+
+def scopes(date: str, org: str, machine: str) -> list:
+    """All the rollup nodes a (date, org, machine) value contributes to."""
+    return [
+        f"{ROLLUP_ROOT}/total",
+        f"{ROLLUP_ROOT}/days/{date}",
+        f"{ROLLUP_ROOT}/orgs/{org}/total",
+        f"{ROLLUP_ROOT}/orgs/{org}/days/{date}",
+        f"{ROLLUP_ROOT}/machines/{org}/{machine}",
+    ]
+
+
+def event_updates(
+    date: str,
+    org: str,
+    machine: str,
+    current: dict,
+    previous: Optional[dict] = None,
+    machine_known: bool = True,
+) -> dict:
+    """
+    Build the multi-path update for one machine reading.
+
+    `previous` is the raw node stored before this write (None on the first
+    reading of the day) and `machine_known` tells if the machine already has a
+    rollup entry, which is what active_fountains counts.
+    """
+    new_values = machine_values(current)
+    old_values = machine_values(previous)
+
+    updates = {
+        f"{date}/{org}/{machine}": new_values,
+        f"{BY_ORG_ROOT}/{org}/{date}/{machine}": new_values,
+    }
+
+    for field in FIELDS:
+        delta = new_values[field] - old_values[field]
+        if not delta:
+            continue
+        for scope in scopes(date, org, machine):
+            updates[f"{scope}/{field}"] = increment(delta)
+
+    updates.update(_machine_updates(date, org, machine, previous is None, machine_known))
+    return updates
+
+
+def delta_updates(
+    date: str,
+    org: str,
+    machine: str,
+    delta: dict,
+    first_of_day: bool = False,
+    machine_known: bool = True,
+) -> dict:
+    """
+    Build the multi-path update adding `delta` to the counters of a machine.
+    Every counter, the raw node included, is a server-side increment.
+    """
+    delta = machine_values(delta)
+    updates = {}
+    paths = [f"{date}/{org}/{machine}", f"{BY_ORG_ROOT}/{org}/{date}/{machine}"] + scopes(date, org, machine)
+    for field in FIELDS:
+        if not delta[field]:
+            continue
+        for path in paths:
+            updates[f"{path}/{field}"] = increment(delta[field])
+    if not updates:
+        return {}
+
+    updates.update(_machine_updates(date, org, machine, first_of_day, machine_known))
+    return updates
+
+
+def add_values(*nodes) -> dict:
+    """Field-wise sum of machine counters (None counts as 0)."""
+    total = _empty_totals()
+    for node in nodes:
+        _add(total, machine_values(node))
+    return total
+
+
+def _machine_updates(date: str, org: str, machine: str, first_of_day: bool, machine_known: bool) -> dict:
+    machine_path = f"{ROLLUP_ROOT}/machines/{org}/{machine}"
+    updates = {f"{machine_path}/lastSeen": date}
+    if first_of_day:
+        updates[f"{machine_path}/days"] = increment(1)
+    if not machine_known:
+        updates[f"{machine_path}/firstSeen"] = date
+        updates[f"{ROLLUP_ROOT}/total/fountains"] = increment(1)
+        updates[f"{ROLLUP_ROOT}/orgs/{org}/total/fountains"] = increment(1)
+    return updates
+
+
+def merge_updates(target: dict, updates: dict) -> dict:
+    """
+    Merge the updates of several readings into one multi-path update.
+    Increments on the same path are added together, other values overwrite.
+    """
+    for path, value in updates.items():
+        current = target.get(path)
+        if _is_increment(current) and _is_increment(value):
+            target[path] = increment(current[".sv"]["increment"] + value[".sv"]["increment"])
+        else:
+            target[path] = value
+    return target
+
+
+def _is_increment(value) -> bool:
+    return isinstance(value, dict) and "increment" in value.get(".sv", {})
+
+
+def _empty_totals() -> dict:
+    return {"bottleNumber": 0, "waterLiters": 0.0, "plasticRecycledGrams": 0.0}
+
+
+def _add(target: dict, values: dict):
+    for field in FIELDS:
+        target[field] = target.get(field, 0) + values[field]
+
+
+def build_rollups(tree) -> dict:
+    """
+    Recompute the whole /rollups subtree from the raw date tree (a dict, or
+    (date, node) pairs in date order, see date_items).
+    Used by the rebuild command and when the rollups do not exist yet.
+    """
+    total = dict(_empty_totals(), fountains=0)
+    days, orgs, machines = {}, {}, {}
+
+    for date_key, date_content in date_items(tree):
+        if not is_date_key(date_key) or not isinstance(date_content, dict):
+            continue
+
+        for org_key, org_content in date_content.items():
+            if not isinstance(org_content, dict):
+                continue
+
+            for machine_key, machine_data in org_content.items():
+                if not isinstance(machine_data, dict):
+                    continue
+                values = machine_values(machine_data)
+
+                org_rollup = orgs.setdefault(org_key, {
+                    "total": dict(_empty_totals(), fountains=0),
+                    "days": {},
+                })
+                org_machines = machines.setdefault(org_key, {})
+                if machine_key not in org_machines:
+                    org_machines[machine_key] = dict(
+                        _empty_totals(), firstSeen=date_key, lastSeen=date_key, days=0
+                    )
+                    total["fountains"] += 1
+                    org_rollup["total"]["fountains"] += 1
+
+                machine_rollup = org_machines[machine_key]
+                machine_rollup["lastSeen"] = date_key
+                machine_rollup["days"] += 1
+
+                _add(total, values)
+                _add(days.setdefault(date_key, _empty_totals()), values)
+                _add(org_rollup["total"], values)
+                _add(org_rollup["days"].setdefault(date_key, _empty_totals()), values)
+                _add(machine_rollup, values)
+
+    rollup = {"total": total}
+    if days:
+        rollup["days"] = days
+    if orgs:
+        rollup["orgs"] = orgs
+    if machines:
+        rollup["machines"] = machines
+    return rollup
+
+
+def by_org_updates(tree: Optional[dict]) -> dict:
+    """Multi-path update copying the machine nodes of a date tree to /by_org."""
+    updates = {}
+    for date_key, date_content in (tree or {}).items():
+        if not is_date_key(date_key) or not isinstance(date_content, dict):
+            continue
+        for org_key, org_content in date_content.items():
+            if not isinstance(org_content, dict):
+                continue
+            machines = {
+                machine_key: machine_values(machine_data)
+                for machine_key, machine_data in org_content.items()
+                if isinstance(machine_data, dict)
+            }
+            if machines:
+                updates[f"{BY_ORG_ROOT}/{org_key}/{date_key}"] = machines
+    return updates
+
+
+def fountain_machines(tree) -> list:
+    """
+    /api/admin/fountains entries from a {date: {org: {machine: values}}} tree
+    (or its (date, node) pairs, see date_items).
+    A machine id used by several organisations is listed once.
+    """
+    machines = {}
+    for date_key, date_content in date_items(tree):
+        if not is_date_key(date_key) or not isinstance(date_content, dict):
+            continue
+        for org_key, org_content in date_content.items():
+            if not isinstance(org_content, dict):
+                continue
+            for machine_id, machine_data in org_content.items():
+                if not isinstance(machine_data, dict):
+                    continue
+                values = machine_values(machine_data)
+                entry = machines.setdefault(machine_id, {
+                    "machine_id": machine_id,
+                    "water_liters": 0.0,
+                    "plastic_grams": 0.0,
+                    "dates_seen": [],
+                    "organisations": [],
+                })
+                entry["water_liters"] += values["waterLiters"]
+                entry["plastic_grams"] += values["plasticRecycledGrams"]
+                entry["dates_seen"].append(date_key)
+                if org_key not in entry["organisations"]:
+                    entry["organisations"].append(org_key)
+    for entry in machines.values():
+        entry["water_liters"] = round(entry["water_liters"], 2)
+        entry["plastic_grams"] = round(entry["plastic_grams"], 2)
+    return list(machines.values())
+
+
+def rollup_machines(machines_rollup: Optional[dict]) -> list:
+    """
+    /api/admin/fountains entries of every organisation from /rollups/machines.
+    A machine id used by several organisations is listed once, as before;
+    the rollups keep first/last day and a day count, not every date.
+    """
+    machines = {}
+    for org_key, org_machines_rollup in sorted((machines_rollup or {}).items()):
+        if not isinstance(org_machines_rollup, dict):
+            continue
+        for machine_id, rollup in org_machines_rollup.items():
+            if not isinstance(rollup, dict):
+                continue
+            values = machine_values(rollup)
+            entry = machines.setdefault(machine_id, {
+                "machine_id": machine_id,
+                "water_liters": 0.0,
+                "plastic_grams": 0.0,
+                "first_seen": rollup.get("firstSeen"),
+                "last_seen": rollup.get("lastSeen"),
+                "days_seen": 0,
+                "organisations": [],
+            })
+            entry["water_liters"] += values["waterLiters"]
+            entry["plastic_grams"] += values["plasticRecycledGrams"]
+            entry["days_seen"] += int(rollup.get("days", 0) or 0)
+            entry["organisations"].append(org_key)
+            for key, field, pick in (("first_seen", "firstSeen", min), ("last_seen", "lastSeen", max)):
+                seen = [d for d in (entry[key], rollup.get(field)) if d]
+                entry[key] = pick(seen) if seen else None
+    for entry in machines.values():
+        entry["water_liters"] = round(entry["water_liters"], 2)
+        entry["plastic_grams"] = round(entry["plastic_grams"], 2)
+    return list(machines.values())
+
+
+def compact_machines(entries: list) -> list:
+    """
+    fountain_machines entries with first_seen / last_seen / days_seen in
+    place of the dates_seen list, the shape of rollup_machines.
+    """
+    compact = []
+    for entry in entries:
+        dates = entry.get("dates_seen") or []
+        entry = {key: value for key, value in entry.items() if key != "dates_seen"}
+        entry.update(
+            first_seen=min(dates) if dates else None,
+            last_seen=max(dates) if dates else None,
+            days_seen=len(dates),
+        )
+        compact.append(entry)
+    return compact
+
+
+def dashboard_stats(total: Optional[dict]) -> dict:
+    """Shape /rollups/total like the /api/admin/stats_total response."""
+    total = total or {}
+    total_plastic = float(total.get("plasticRecycledGrams", 0) or 0)
+    return {
+        "active_fountains": int(total.get("fountains", 0) or 0),
+        "total_water": round(float(total.get("waterLiters", 0) or 0), 2),
+        "total_plastic": round(total_plastic, 2),
+        "bottles_saved": int(total_plastic / 42)
+    }
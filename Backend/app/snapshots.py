@@ -0,0 +1,132 @@
+"""
+Sealed snapshots of the past days for /api/read-item/{date}.
+
+read_item read /{date} from Firebase on every call, although a day stops
+changing once it is over. A day older than SEAL_AFTER_DAYS, with no reading
+for it left in the spool, is sealed: its node is written once as gzipped
+JSON to `{directory}/{date}.json.gz` (written to a temporary file, then
+renamed) and kept in a small LRU. Sealed days are then served from there,
+with `Cache-Control: immutable`, and the gzip bytes are sent as they are to
+the clients that accept gzip.
+
+Days are sealed on the first read_item after they become final, or by the
+`seal-days` command (cli.py). Like the analytics store, this treats past
+days as final: a day edited by hand in Firebase must have its file removed.
+Without a directory the snapshots only live in the LRU.
+"""
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date as Date
+from typing import Optional
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _checked(day: str) -> str:
+    """The date key, refused unless it is exactly YYYY-MM-DD (it becomes a file name)."""
+    if Date.fromisoformat(day).isoformat() != day:
+        raise ValueError(f"not a date key: {day!r}")
+    return day
+
+
+def is_day(key) -> bool:
+    """Whether key is a YYYY-MM-DD date key."""
+    try:
+        _checked(key)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class DaySnapshots:
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # date -> gzipped JSON
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.file_reads = 0
+        self.misses = 0
+        self.sealed = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{_checked(day)}.json.gz")
+
+    def _remember(self, day: str, body: bytes):
+        with self._lock:
+            self._entries[day] = body
+            self._entries.move_to_end(day)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, day: str) -> Optional[bytes]:
+        """Gzipped JSON of a sealed day, None if the day is not sealed."""
+        with self._lock:
+            body = self._entries.get(day)
+            if body is not None:
+                self._entries.move_to_end(day)
+                self.hits += 1
+                return body
+        if self.directory:
+            try:
+                with open(self._path(day), "rb") as f:
+                    body = f.read()
+            except (FileNotFoundError, ValueError):
+                body = None
+            if body is not None:
+                self._remember(day, body)
+                with self._lock:
+                    self.file_reads += 1
+                return body
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def is_sealed(self, day: str) -> bool:
+        with self._lock:
+            if day in self._entries:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(day))
+
+    def seal(self, day: str, value) -> bytes:
+        """Store the final content of a day. Returns its gzipped JSON."""
+        body = gzip.compress(json.dumps(value, separators=(",", ":")).encode(), mtime=0)
+        if self.directory:
+            path = self._path(day)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)  # another worker sealing the same day writes the same bytes
+        self._remember(_checked(day), body)
+        with self._lock:
+            self.sealed += 1
+        return body
+
+    def clear(self):
+        """Forget the LRU and the counters (tests); the files stay."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.file_reads = self.misses = self.sealed = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "file_reads": self.file_reads,
+                "misses": self.misses,
+                "sealed": self.sealed,
+            }
+
+
+def decode(body: bytes):
+    """The value of a snapshot, for the clients that do not accept gzip."""
+    return json.loads(gzip.decompress(body))
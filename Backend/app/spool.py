@@ -0,0 +1,364 @@
+"""
+Write-ahead spool for the fountain readings.
+
+create_item used to write to Firebase inside the request: when Firebase was
+slow the fountain waited for the whole timeout, and when it failed the
+exception was printed and the reading lost. The readings are now appended to
+a local SQLite table (WAL, committed before the request is answered) and a
+background SpoolReplayer drains it to Firebase through the ingest buffer, in
+batches, retrying with exponential backoff while Firebase is unreachable.
+A row is only deleted once the batch holding it has been written.
+
+A spooled reading is counted once, as long as:
+- a client retry carries the same Idempotency-Key within
+  `keep_keys_seconds`: it is then not appended again. A key is only unique
+  within its scope, the endpoint and client in main.py: another client
+  reusing the same key is not taken for a retry. Retries without a key, or
+  after the key expired, are appended as new readings
+- replays go through SpoolReplayer: the last seq of each batch is written to
+  /ingest_batches/spools/<spool id> in the same multi-path update as the raw
+  nodes and the rollups. A worker whose write failed, or that takes the
+  lease over from one, reads that checkpoint first and acks what it covers
+  instead of sending it again
+- the lease is renewed right before each write, so a worker that lost it
+  mid-flush (lease expired, another worker replaying) writes nothing
+
+Several workers may append to the same spool file; a lease row makes only
+one of them replay it at a time. Without a path the spool is in memory: the
+request is still answered without waiting for Firebase, but what is spooled
+does not survive a restart, so `cli.py serve` refuses to start without one.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from ingest import BATCH_ROOT
+
+READING = "reading"  # cumulative values of the day (WriteBuffer.add_many)
+DELTA = "delta"      # increments since the previous event (WriteBuffer.add_deltas)
+
+logger = logging.getLogger("jemlo.spool")
+
+
+class SpoolFullError(Exception):
+    """Raised when the spool already holds max_events readings."""
+
+
+class Spool:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_events: int = 1_000_000,
+        keep_keys_seconds: float = 24 * 3600,
+    ):
+        self.path = path or ":memory:"
+        self.max_events = max_events
+        self.keep_keys_seconds = keep_keys_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")  # an acknowledged reading is on disk
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, org TEXT NOT NULL,"
+            " machine TEXT NOT NULL, reading TEXT NOT NULL, created_at REAL NOT NULL,"
+            " kind TEXT NOT NULL DEFAULT 'reading')"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+        if "kind" not in columns:  # spool written before the delta mode
+            self._conn.execute("ALTER TABLE events ADD COLUMN kind TEXT NOT NULL DEFAULT 'reading'")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(idempotency_keys)")}
+        if columns and "scope" not in columns:  # spool written before the scopes
+            self._conn.execute("DROP TABLE idempotency_keys")  # keys of the last day at most
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            " scope TEXT NOT NULL, key TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (scope, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lease ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # Names this spool's checkpoint in Firebase, kept with the file
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS identity (id INTEGER PRIMARY KEY CHECK (id = 1), spool_id TEXT NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO identity (id, spool_id) VALUES (1, ?)", (uuid.uuid4().hex,))
+        self.id = self._conn.execute("SELECT spool_id FROM identity WHERE id = 1").fetchone()[0]
+
+        self.appended = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.acked = 0
+
+    def append_many(self, readings, key: Optional[str] = None, kind: str = READING, scope: str = "") -> int:
+        """
+        Append (date, org, machine, values) rows of one kind in one transaction.
+        Returns how many were appended: 0 when `key` was already seen in `scope`.
+        Raises SpoolFullError, and appends nothing, past max_events.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if key is not None:
+                    inserted = self._conn.execute(
+                        "INSERT OR IGNORE INTO idempotency_keys (scope, key, created_at) VALUES (?, ?, ?)",
+                        (scope, key, now),
+                    ).rowcount
+                    if not inserted:
+                        self._conn.execute("ROLLBACK")
+                        self.duplicates += 1
+                        return 0
+                pending = self._count()
+                if pending + len(readings) > self.max_events:
+                    self._conn.execute("ROLLBACK")
+                    self.rejected += len(readings)
+                    raise SpoolFullError(f"{pending} readings waiting for Firebase")
+                self._conn.executemany(
+                    "INSERT INTO events (date, org, machine, reading, created_at, kind) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(date, org, machine, json.dumps(values), now, kind) for date, org, machine, values in readings],
+                )
+                self._conn.execute("COMMIT")
+            except SpoolFullError:
+                raise
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.appended += len(readings)
+        return len(readings)
+
+    def peek(self, limit: int):
+        """
+        (last seq, rows) of the oldest `limit` rows, rows being
+        (kind, date, org, machine, values). (None, []) when empty.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, kind, date, org, machine, reading FROM events ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [row[1:5] + (json.loads(row[5]),) for row in rows]
+
+    def ack(self, last_seq: int):
+        """The rows up to last_seq are in Firebase: delete them, and the expired idempotency keys."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            deleted = self._conn.execute("DELETE FROM events WHERE seq <= ?", (last_seq,)).rowcount
+            self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < ?", (time.time() - self.keep_keys_seconds,)
+            )
+            self._conn.execute("COMMIT")
+            self.acked += deleted
+
+    def claim(self, owner: str, ttl: float) -> bool:
+        """Take or renew the replay lease. False while another owner holds it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT owner, expires_at FROM lease WHERE id = 1").fetchone()
+            if row and row[0] != owner and row[1] > now:
+                self._conn.execute("ROLLBACK")
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lease (id, owner, expires_at) VALUES (1, ?, ?)", (owner, now + ttl)
+            )
+            self._conn.execute("COMMIT")
+        return True
+
+    def release(self, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM lease WHERE id = 1 AND owner = ?", (owner,))
+
+    def _count(self) -> int:
+        # Rows are only deleted from the head (ack), so the seq range is the
+        # count, read from the primary key instead of scanning the table
+        low, high = self._conn.execute("SELECT MIN(seq), MAX(seq) FROM events").fetchone()
+        return high - low + 1 if low is not None else 0
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def oldest_age(self) -> float:
+        """Seconds since the oldest pending reading was appended (0 when empty)."""
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM events").fetchone()[0]
+        return max(0.0, time.time() - oldest) if oldest else 0.0
+
+    def oldest_date(self) -> Optional[str]:
+        """Earliest day with a reading still waiting for Firebase (None when empty)."""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(date) FROM events").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "oldest_age_seconds": round(self.oldest_age(), 3),
+            "max_events": self.max_events,
+            "appended": self.appended,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "acked": self.acked,
+        }
+
+
+class LeaseLostError(Exception):
+    """Raised before a write when another worker took the replay lease meanwhile."""
+
+
+class SpoolReplayer:
+    def __init__(
+        self,
+        spool: Spool,
+        buffer,
+        batch_size: int = 500,
+        interval: float = 0.5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.spool = spool
+        self.buffer = buffer  # ingest.WriteBuffer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.owner = uuid.uuid4().hex
+        # Longer than a backoff: a worker retrying keeps the lease. Renewed
+        # right before each write, so it must also outlast one Firebase call
+        self.lease_seconds = max(10.0, 3 * interval, 2 * max_backoff)
+        # Last spool seq in Firebase, set by the same update as the rows
+        self.checkpoint = f"/{BATCH_ROOT}/spools/{spool.id}"
+        # Rows up to _handed_seq are in the buffer, up to _acked_seq written;
+        # _written_seq is the checkpoint as this replayer last left it
+        self._handed_seq = 0
+        self._acked_seq = 0
+        self._handed_count = 0
+        self._written_seq = None
+
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.replayed = 0
+        self.batches = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+
+    def notify(self):
+        """New readings were appended: replay without waiting for the interval."""
+        self._wake.set()
+
+    def drain(self) -> int:
+        """
+        Replay until the spool is empty. Returns the number of readings
+        written; a write error is raised and leaves the rest in the spool.
+        """
+        total = 0
+        with self._flush_lock:
+            # Renewed before every batch: another worker takes over if this one stalls
+            while self.spool.claim(self.owner, self.lease_seconds):
+                written = self.buffer.read_marker(self.checkpoint)
+                if written is not None and written != self._written_seq:
+                    # Another worker replayed rows meanwhile, or a write that
+                    # failed here was applied after all: the rows up to the
+                    # checkpoint are in Firebase, and what this buffer holds
+                    # or remembers is stale
+                    self.buffer.reset()
+                    self.spool.ack(written)
+                    self._handed_seq = self._acked_seq = self._written_seq = written
+                if self._acked_seq == self._handed_seq:
+                    last_seq, rows = self.spool.peek(self.batch_size)
+                    if not rows:
+                        return total
+                    self._queue(rows)
+                    self._handed_seq, self._handed_count = last_seq, len(rows)
+                # else a failed flush left the rows in the buffer: queueing them
+                # again would add their deltas twice, flush them again instead
+                try:
+                    self.buffer.flush(checkpoint=(self.checkpoint, self._handed_seq), guard=self._renew)
+                except LeaseLostError:
+                    # Nothing sent: the rows stay in the spool for the new owner
+                    self.buffer.reset()
+                    self._handed_seq = self._acked_seq
+                    return total
+                self.spool.ack(self._handed_seq)
+                self._acked_seq = self._written_seq = self._handed_seq
+                self.batches += 1
+                self.replayed += self._handed_count
+                total += self._handed_count
+        return total
+
+    def _renew(self):
+        if not self.spool.claim(self.owner, self.lease_seconds):
+            raise LeaseLostError("replay lease taken by another worker")
+
+    def _queue(self, rows: list):
+        # Consecutive rows of the same kind go in together, in spool order
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end][0] != rows[start][0]:
+                run = [row[1:] for row in rows[start:end]]
+                if rows[start][0] == DELTA:
+                    self.buffer.add_deltas(run)
+                else:
+                    self.buffer.add_many(run)
+                start = end
+
+    # ---------- background worker ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker and try once more to write what is spooled."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.drain()
+        except Exception:
+            logger.warning("Readings left in the spool at shutdown", extra={"pending": self.spool.pending()})
+        self.spool.release(self.owner)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.drain()
+                self.consecutive_failures = 0
+            except Exception:
+                self.failures += 1
+                self.consecutive_failures += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (self.consecutive_failures - 1))
+                logger.warning(
+                    "Spool replay failed, retrying",
+                    exc_info=True,
+                    extra={"retry_in_seconds": delay, "pending": self.spool.pending()},
+                )
+                self._stop.wait(delay)
+
+    def stats(self) -> dict:
+        return {
+            "replayed": self.replayed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+        }
@@ -0,0 +1,426 @@
+"""
+Local stand-in for the Firebase Realtime Database.
+
+main.py only talks to the database through `db.reference(path)`, so anything
+with the same `reference()` API can replace the firebase_admin.db module.
+LocalDatabase is that second implementation: the tree lives in memory and,
+with a file path, is kept in SQLite, so the whole API can run on a laptop
+against years of generated data (STORAGE_BACKEND=sqlite, see main.py) and be
+benchmarked without a Firebase project.
+
+What is reproduced from the RTDB semantics:
+- get(shallow=...), set, update (multi-path, None deletes), push, delete
+- server values {".sv": {"increment": n}} and {".sv": "timestamp"}
+- empty objects are not stored, deleting the last child removes the parent
+- order_by_key / order_by_child / order_by_value with start_at, end_at,
+  equal_to, limit_to_first, limit_to_last, in the RTDB sort order
+- listen(): an initial "put" of the value, then a "put" per write below or
+  above the listened path, delivered from a background thread
+
+Not reproduced: security rules, .indexOn checks, transactions, auth.
+
+In SQLite the tree is stored as rows of `row_depth` levels (for example
+"2025-12-01/EPHEC01/M01" or "logs/-Nabc.../message"): a write only rewrites
+the rows under the path it touches, not the whole database.
+"""
+import bisect
+import copy
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import logstore
+
+
+def _segments(path: str) -> list:
+    return [segment for segment in (path or "").split("/") if segment]
+
+
+def _normalize(value):
+    """What Firebase would store: no None, no empty objects."""
+    if isinstance(value, dict):
+        cleaned = {}
+        for key, child in value.items():
+            child = _normalize(child)
+            if child is not None:
+                cleaned[str(key)] = child
+        return cleaned or None
+    if isinstance(value, (list, tuple)):
+        return _normalize({str(i): child for i, child in enumerate(value)})
+    return value
+
+
+def _key_order(key: str):
+    """RTDB key order: 32-bit integer keys first, numerically, then strings."""
+    try:
+        number = int(key)
+        if -2 ** 31 <= number < 2 ** 31 and str(number) == key:
+            return (0, number, "")
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+
+def _value_order(value):
+    """RTDB value order: null, false, true, numbers, strings, objects."""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+class Event:
+    def __init__(self, event_type: str, path: str, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, database, path: list, callback):
+        self._database = database
+        self.path = path
+        self._callback = callback
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="local-db-listener", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            self._callback(event)
+
+    def close(self):
+        self._database._remove_listener(self)
+        self._events.put(None)
+        self._thread.join()
+
+
+class Query:
+    def __init__(self, reference, order_by: str, child: Optional[str] = None):
+        self._reference = reference
+        self._order_by = order_by  # "key", "child" or "value"
+        self._child = _segments(child) if child else None
+        self._start = self._end = self._equal = None
+        self._has_start = self._has_end = self._has_equal = False
+        self._limit = None  # ("first" | "last", n)
+
+    def start_at(self, value):
+        self._start, self._has_start = value, True
+        return self
+
+    def end_at(self, value):
+        self._end, self._has_end = value, True
+        return self
+
+    def equal_to(self, value):
+        self._equal, self._has_equal = value, True
+        return self
+
+    def limit_to_first(self, n: int):
+        self._limit = ("first", n)
+        return self
+
+    def limit_to_last(self, n: int):
+        self._limit = ("last", n)
+        return self
+
+    def _sort_value(self, key, value):
+        if self._order_by == "key":
+            return _key_order(key)
+        if self._order_by == "child":
+            for segment in self._child:
+                value = value.get(segment) if isinstance(value, dict) else None
+        return _value_order(value)
+
+    def _bound(self, bound):
+        return _key_order(str(bound)) if self._order_by == "key" else _value_order(bound)
+
+    def get(self):
+        return self._reference._database._select(self._reference._segments, self._select)
+
+    def _select(self, data: dict, sorted_keys) -> list:
+        """Keys of `data` matched by the query, in order."""
+        if self._order_by == "key":
+            keys = sorted_keys()
+            low, high = 0, len(keys)
+            for has_bound, bound, side in ((self._has_start, self._start, "start"),
+                                           (self._has_end, self._end, "end"),
+                                           (self._has_equal, self._equal, "equal")):
+                if not has_bound:
+                    continue
+                if side in ("start", "equal"):
+                    low = max(low, bisect.bisect_left(keys, self._bound(bound), key=_key_order))
+                if side in ("end", "equal"):
+                    high = min(high, bisect.bisect_right(keys, self._bound(bound), key=_key_order))
+            keys = keys[low:max(low, high)]
+            if self._limit:
+                kind, n = self._limit
+                keys = keys[:n] if kind == "first" else keys[-n:] if n else []
+            return keys
+        items = sorted(
+            ((self._sort_value(key, value), _key_order(key), key, value) for key, value in data.items()),
+            key=lambda item: item[:2],
+        )
+        if self._has_equal:
+            items = [item for item in items if item[0] == self._bound(self._equal)]
+        if self._has_start:
+            items = [item for item in items if item[0] >= self._bound(self._start)]
+        if self._has_end:
+            items = [item for item in items if item[0] <= self._bound(self._end)]
+        if self._limit:
+            kind, n = self._limit
+            items = items[:n] if kind == "first" else items[-n:] if n else []
+        return [key for _, _, key, _ in items]
+
+
+class Reference:
+    def __init__(self, database, path: str = "/"):
+        self._database = database
+        self._segments = _segments(path)
+
+    @property
+    def key(self) -> Optional[str]:
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self) -> str:
+        return "/" + "/".join(self._segments)
+
+    def child(self, path: str) -> "Reference":
+        return Reference(self._database, "/".join(self._segments + _segments(path)))
+
+    def get(self, shallow: bool = False):
+        if shallow:
+            return self._database._select(self._segments, lambda node, _: list(node), shallow=True)
+        return self._database._get(self._segments, count=True)
+
+    def set(self, value):
+        self._database._write({tuple(self._segments): value})
+
+    def update(self, value: dict):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        writes = {}
+        for path, child in value.items():
+            segments = _segments(path)
+            if not segments:
+                raise ValueError("Invalid update path.")
+            writes[tuple(self._segments + segments)] = child
+        self._database._write(writes)
+
+    def push(self, value="") -> "Reference":
+        reference = self.child(logstore.push_id())
+        reference.set(value)
+        return reference
+
+    def delete(self):
+        self.set(None)
+
+    def order_by_key(self) -> Query:
+        return Query(self, "key")
+
+    def order_by_child(self, path: str) -> Query:
+        return Query(self, "child", path)
+
+    def order_by_value(self) -> Query:
+        return Query(self, "value")
+
+    def listen(self, callback) -> ListenerRegistration:
+        return self._database._add_listener(self._segments, callback)
+
+
+class LocalDatabase:
+    def __init__(self, path: Optional[str] = None, row_depth: int = 3):
+        self.path = path
+        self.row_depth = row_depth
+        self._tree = {}
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._key_index = {}  # path -> (writes when built, sorted keys)
+        self._conn = None
+        self.reads = 0
+        self.writes = 0
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            for row_path, row_value in self._conn.execute("SELECT path, value FROM nodes"):
+                self._set(_segments(row_path), json.loads(row_value))
+
+    def reference(self, path: str = "/") -> Reference:
+        """Same call as firebase_admin.db.reference."""
+        return Reference(self, path)
+
+    # ---------- tree ----------
+
+    def _get(self, segments: list, count: bool = False):
+        """Copy of the value at `segments`: callers cannot change the tree."""
+        with self._lock:
+            self.reads += count
+            node = self._get_raw(segments)
+            return copy.deepcopy(node) if node != {} else None
+
+    def _select(self, segments: list, select, shallow: bool = False):
+        """
+        Children of the node at `segments` whose keys select(node) returns,
+        copied (or True for objects when shallow). Only those are copied.
+        """
+        with self._lock:
+            self.reads += 1
+            node = self._get_raw(segments)
+            if not isinstance(node, dict) or not node:
+                return copy.deepcopy(node) if node != {} else None
+            result = OrderedDict()
+            for key in select(node, lambda: self._sorted_keys(segments, node)):
+                child = node[key]
+                result[key] = (True if isinstance(child, dict) else child) if shallow else copy.deepcopy(child)
+            return dict(result) if shallow else result
+
+    def _sorted_keys(self, segments: list, node: dict) -> list:
+        """Keys of `node` in key order, kept until the next write (Firebase indexes keys)."""
+        path = tuple(segments)
+        entry = self._key_index.get(path)
+        if entry is None or entry[0] != self.writes:
+            if len(self._key_index) >= 64:
+                self._key_index.clear()
+            entry = self._key_index[path] = (self.writes, sorted(node, key=_key_order))
+        return entry[1]
+
+    def _get_raw(self, segments: list):
+        node = self._tree
+        for segment in segments:
+            if not isinstance(node, dict) or segment not in node:
+                return None
+            node = node[segment]
+        return node
+
+    def _set(self, segments: list, value):
+        value = _normalize(value)
+        if not segments:
+            self._tree = value if isinstance(value, dict) else {}
+            return
+        parents = [self._tree]
+        for segment in segments[:-1]:
+            child = parents[-1].get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = parents[-1][segment] = {}
+            parents.append(child)
+        if value is None:
+            parents[-1].pop(segments[-1], None)
+            # Firebase does not keep empty parents
+            for depth in range(len(parents) - 1, 0, -1):
+                if parents[depth]:
+                    break
+                parents[depth - 1].pop(segments[depth - 1], None)
+        else:
+            parents[-1][segments[-1]] = value
+
+    def _resolve(self, segments: list, value):
+        """Replace the server values of `value` by what they evaluate to at `segments`."""
+        if isinstance(value, dict):
+            server_value = value.get(".sv")
+            if isinstance(server_value, dict) and "increment" in server_value:
+                current = self._get(segments)
+                if isinstance(current, bool) or not isinstance(current, (int, float)):
+                    current = 0
+                return current + server_value["increment"]
+            if server_value == "timestamp":
+                return int(time.time() * 1000)
+            return {key: self._resolve(segments + [key], child) for key, child in value.items()}
+        return value
+
+    def _write(self, writes: dict):
+        with self._lock:
+            self.writes += 1
+            resolved = []
+            for segments, value in writes.items():
+                segments = list(segments)
+                resolved.append((segments, self._resolve(segments, value)))
+            for segments, value in resolved:
+                self._set(segments, value)
+            if self._conn is not None:
+                self._persist([segments for segments, _ in resolved])
+            events = self._events(resolved)
+        for registration, event in events:
+            registration._events.put(event)
+
+    # ---------- SQLite ----------
+
+    def _rows(self, segments: list, value):
+        if isinstance(value, dict) and len(segments) < self.row_depth:
+            for key, child in value.items():
+                yield from self._rows(segments + [key], child)
+        elif value is not None:
+            yield "/".join(segments), json.dumps(value)
+
+    def _persist(self, written: list):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for segments in written:
+                row = segments[:self.row_depth]
+                prefix = "/".join(row)
+                if prefix:
+                    # the rows below `prefix` sort between "prefix/" and "prefix0"
+                    conn.execute("DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+                                 (prefix, prefix + "/", prefix + "0"))
+                else:
+                    conn.execute("DELETE FROM nodes")
+                # Rows above a deleted/overwritten primitive parent
+                for depth in range(1, len(row)):
+                    conn.execute("DELETE FROM nodes WHERE path = ?", ("/".join(row[:depth]),))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)",
+                    self._rows(row, self._get_raw(row)),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- listeners ----------
+
+    def _add_listener(self, segments: list, callback) -> ListenerRegistration:
+        with self._lock:
+            registration = ListenerRegistration(self, segments, callback)
+            self._listeners.append(registration)
+            registration._events.put(Event("put", "/", self._get(segments)))
+        return registration
+
+    def _remove_listener(self, registration):
+        with self._lock:
+            if registration in self._listeners:
+                self._listeners.remove(registration)
+
+    def _events(self, resolved: list) -> list:
+        events = []
+        for registration in self._listeners:
+            base = registration.path
+            for segments, value in resolved:
+                if segments[:len(base)] == base:
+                    relative = "/" + "/".join(segments[len(base):])
+                    events.append((registration, Event("put", relative, copy.deepcopy(_normalize(value)))))
+                elif base[:len(segments)] == segments:
+                    events.append((registration, Event("put", "/", self._get(base))))
+        return events
@@ -0,0 +1,332 @@
+"""
+Columnar copy of the /{date}/{org}/{machine} tree for the dashboard analytics.
+
+Instead of walking nested dicts with a float() per value on every request, each
+(date, organisation, machine) node becomes one row of a few NumPy columns:
+
+    date, org, machine  -> int32 codes into the dates / orgs / machines lists
+    bottles             -> int64
+    water, plastic      -> float64
+
+Group-bys are np.bincount over the codes, so a year of data for hundreds of
+machines aggregates in a few milliseconds. The store can be saved to a
+directory of .npy files and reopened memory-mapped, which makes restarts
+cheap: only the days after the snapshot have to be read from Firebase.
+
+Past days are treated as final. Reloading the latest day keeps today current,
+a full rebuild (load_tree) is needed if old days are edited by hand.
+
+The store may hold only the days from `since` on: a dashboard asking for the
+last 90 days does not make the process download the whole history, older
+days are read (by key range) the first time a query needs them.
+"""
+import json
+import os
+import shutil
+import threading
+from datetime import date as Date
+from typing import Optional
+
+import numpy as np
+
+import rollups
+
+COLUMNS = {
+    "date": np.int32,
+    "org": np.int32,
+    "machine": np.int32,
+    "bottles": np.int64,
+    "water": np.float64,
+    "plastic": np.float64,
+}
+
+
+class TimeSeriesStore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.dates, self.orgs, self.machines = [], [], []
+            self._codes = {"date": {}, "org": {}, "machine": {}}
+            self._rows = {}  # (date code, org code, machine code) -> row
+            self._cols = {name: np.zeros(0, dtype) for name, dtype in COLUMNS.items()}
+            self.size = 0
+            self.loaded = False
+            self.since = None  # first date key held, None: the whole history
+            self.refreshed_at = None
+            # Bumped on every change: answers computed from the store are cached under it
+            self.version = getattr(self, "version", 0) + 1
+
+    # ---------- writes ----------
+
+    def _code(self, kind: str, value: str) -> int:
+        codes = self._codes[kind]
+        code = codes.get(value)
+        if code is None:
+            values = {"date": self.dates, "org": self.orgs, "machine": self.machines}[kind]
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _grow(self):
+        capacity = len(self._cols["date"])
+        if self.size < capacity and all(c.flags.writeable for c in self._cols.values()):
+            return
+        new_capacity = max(64, capacity * 2) if self.size >= capacity else capacity
+        for name, column in self._cols.items():
+            grown = np.zeros(new_capacity, COLUMNS[name])
+            grown[:self.size] = column[:self.size]
+            self._cols[name] = grown
+
+    def upsert(self, date: str, org: str, machine: str, values: dict) -> Optional[dict]:
+        """
+        Set the counters of one (date, org, machine) node. Returns what changed
+        ({"bottles", "water", "plastic"} differences), None if nothing did.
+        """
+        with self._lock:
+            key = (self._code("date", date), self._code("org", org), self._code("machine", machine))
+            row = self._rows.get(key)
+            created = row is None
+            if created:
+                self._grow()
+                row = self._rows[key] = self.size
+                self.size += 1
+                self._cols["date"][row], self._cols["org"][row], self._cols["machine"][row] = key
+            elif not self._cols["water"].flags.writeable:
+                self._grow()
+            values = rollups.machine_values(values)
+            delta = {}
+            for name, field in (("bottles", "bottleNumber"), ("water", "waterLiters"),
+                                ("plastic", "plasticRecycledGrams")):
+                previous = self._cols[name][row].item()
+                if values[field] != previous:
+                    delta[name] = values[field] - previous
+                    self._cols[name][row] = values[field]
+            if delta or created:
+                self.version += 1
+            return delta or None
+
+    def merge_days(self, tree) -> list:
+        """
+        Upsert every machine node of a {date: {org: {machine: values}}} dict,
+        or of (date, node) pairs (rollups.date_items).
+        Returns the (date, org, machine, delta) of the nodes that changed.
+        """
+        changes = []
+        # Locked one day at a time: the pairs may come from Firebase reads
+        for date_key, date_content in rollups.date_items(tree):
+            if not rollups.is_date_key(date_key) or not isinstance(date_content, dict):
+                continue
+            with self._lock:
+                self._code("date", date_key)  # days without machine data still show
+                for org_key, org_content in date_content.items():
+                    if not isinstance(org_content, dict):
+                        continue
+                    for machine_key, machine_data in org_content.items():
+                        if not isinstance(machine_data, dict):
+                            continue
+                        delta = self.upsert(date_key, org_key, machine_key, machine_data)
+                        if delta:
+                            changes.append((date_key, org_key, machine_key, delta))
+        return changes
+
+    def load_tree(self, tree, since: Optional[str] = None):
+        """Replace the whole store with the content of the date tree (from `since` on)."""
+        self.clear()
+        self.merge_days(tree)
+        with self._lock:
+            self.loaded = True
+            self.since = since
+
+    def covers(self, start: Optional[str]) -> bool:
+        """Whether every day from `start` on (None: all of them) is in the store."""
+        return self.loaded and (self.since is None or (start is not None and start >= self.since))
+
+    @property
+    def latest_date(self) -> Optional[str]:
+        return max(self.dates) if self.dates else None
+
+    # ---------- queries ----------
+
+    def _col(self, name):
+        return self._cols[name][:self.size]
+
+    def _date_rank(self):
+        rank = np.empty(len(self.dates), np.int64)
+        rank[np.argsort(np.array(self.dates))] = np.arange(len(self.dates))
+        return rank
+
+    def daily_water(self, org: Optional[str] = None, start: Optional[str] = None,
+                    end: Optional[str] = None):
+        """(sorted dates, water per date) over every organisation, or one, in [start, end]."""
+        with self._lock:
+            if not self.dates:
+                return [], []
+            rows = slice(None)
+            if org is not None:
+                rows = self._col("org") == self._codes["org"].get(org, -1)
+            sums = np.bincount(self._col("date")[rows], weights=self._col("water")[rows],
+                               minlength=len(self.dates))
+            order = sorted(
+                (i for i, day in enumerate(self.dates)
+                 if (start is None or day >= start) and (end is None or day <= end)),
+                key=self.dates.__getitem__,
+            )
+            return [self.dates[i] for i in order], [round(float(sums[i]), 2) for i in order]
+
+    def totals(self) -> dict:
+        with self._lock:
+            pairs = self._col("org").astype(np.int64) * max(len(self.machines), 1) + self._col("machine")
+            fountains = len(np.unique(pairs))
+            return {
+                "bottleNumber": int(self._col("bottles").sum()),
+                "waterLiters": float(self._col("water").sum()),
+                "plasticRecycledGrams": float(self._col("plastic").sum()),
+                "fountains": fountains,
+            }
+
+    def machine_totals(self, org: Optional[str] = None, date: Optional[str] = None, compact: bool = False):
+        """
+        Per-machine totals like /api/admin/fountains: returns (machines, number
+        of dates). Rows are visited by date, so dates_seen is chronological.
+        compact gives first_seen / last_seen / days_seen instead of dates_seen
+        (rollups.compact_machines), computed on the columns without building
+        the lists.
+        """
+        with self._lock:
+            mask = np.ones(self.size, bool)
+            for kind, value in (("org", org), ("date", date)):
+                if value is not None:
+                    code = self._codes[kind].get(value)
+                    if code is None:
+                        return [], 0
+                    mask &= self._col(kind) == code
+            rows = np.nonzero(mask)[0]
+            if not len(rows):
+                return [], 0
+
+            date_col, org_col, machine_col = self._col("date"), self._col("org"), self._col("machine")
+            n_machines = len(self.machines)
+            water = np.bincount(machine_col[rows], weights=self._col("water")[rows], minlength=n_machines)
+            plastic = np.bincount(machine_col[rows], weights=self._col("plastic")[rows], minlength=n_machines)
+            total_dates = len(np.unique(date_col[rows]))
+
+            rank = self._date_rank()
+            if compact:
+                return self._compact_totals(rows, rank, water, plastic), total_dates
+            ordered = rows[np.lexsort((rows, rank[date_col[rows]]))]
+
+            seen = {}
+            for d, o, m in zip(date_col[ordered].tolist(), org_col[ordered].tolist(),
+                               machine_col[ordered].tolist()):
+                entry = seen.setdefault(m, ([], set()))
+                entry[0].append(self.dates[d])
+                entry[1].add(self.orgs[o])
+
+            machines = [{
+                "machine_id": self.machines[code],
+                "water_liters": round(float(water[code]), 2),
+                "plastic_grams": round(float(plastic[code]), 2),
+                "dates_seen": dates_seen,
+                "organisations": sorted(orgs),
+            } for code, (dates_seen, orgs) in seen.items()]
+            return machines, total_dates
+
+    def _compact_totals(self, rows, rank, water, plastic) -> list:
+        """
+        machine_totals(compact=True) entries, in the same machine order (first
+        row by date, then by row) without sorting the rows.
+        """
+        machine_col = self._col("machine")[rows]
+        ranks = rank[self._col("date")[rows]]
+        n_machines, n_orgs = len(self.machines), max(len(self.orgs), 1)
+        first = np.full(n_machines, len(self.dates), np.int64)
+        last = np.full(n_machines, -1, np.int64)
+        np.minimum.at(first, machine_col, ranks)
+        np.maximum.at(last, machine_col, ranks)
+        # rank * size + row: the smallest is the machine's first row in date order
+        position = np.full(n_machines, np.iinfo(np.int64).max, np.int64)
+        np.minimum.at(position, machine_col, ranks * max(self.size, 1) + rows)
+        days_seen = np.bincount(machine_col, minlength=n_machines)
+
+        orgs = {}
+        pairs = np.unique(machine_col.astype(np.int64) * n_orgs + self._col("org")[rows])
+        for m, o in zip((pairs // n_orgs).tolist(), (pairs % n_orgs).tolist()):
+            orgs.setdefault(m, []).append(self.orgs[o])
+
+        by_rank = sorted(self.dates)
+        codes = np.nonzero(days_seen)[0]
+        return [{
+            "machine_id": self.machines[code],
+            "water_liters": round(float(water[code]), 2),
+            "plastic_grams": round(float(plastic[code]), 2),
+            "organisations": sorted(orgs[code]),
+            "first_seen": by_rank[first[code]],
+            "last_seen": by_rank[last[code]],
+            "days_seen": int(days_seen[code]),
+        } for code in codes[np.argsort(position[codes])].tolist()]
+
+    # ---------- persistence ----------
+
+    def save(self, path: str):
+        """Write the store to `path` (a directory), replacing it atomically."""
+        with self._lock:
+            tmp = path + ".tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for name in COLUMNS:
+                np.save(os.path.join(tmp, f"{name}.npy"), self._col(name))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"dates": self.dates, "orgs": self.orgs, "machines": self.machines,
+                           "size": self.size, "since": self.since}, f)
+            old = path + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(path):
+                os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+
+    def load(self, path: str):
+        """Replace the store with a saved one, columns memory-mapped (copied on first write)."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with self._lock:
+            self.clear()
+            self.dates, self.orgs, self.machines = meta["dates"], meta["orgs"], meta["machines"]
+            for kind, values in (("date", self.dates), ("org", self.orgs), ("machine", self.machines)):
+                self._codes[kind] = {value: code for code, value in enumerate(values)}
+            self.size = meta["size"]
+            self.since = meta.get("since")
+            for name in COLUMNS:
+                # an empty file cannot be mapped
+                mode = "r" if self.size else None
+                self._cols[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+            keys = zip(self._col("date").tolist(), self._col("org").tolist(), self._col("machine").tolist())
+            self._rows = {key: row for row, key in enumerate(keys)}
+            self.version += 1
+            self.loaded = True
+
+
+def period_key(day: str, granularity: str) -> str:
+    """Bucket of a date key: the day itself, the Monday of its week, or "YYYY-MM"."""
+    if granularity == "month":
+        return day[:7]
+    if granularity == "week":
+        d = Date.fromisoformat(day)
+        return Date.fromordinal(d.toordinal() - d.weekday()).isoformat()
+    return day
+
+
+def bucket(days: list, values: list, granularity: str = "day"):
+    """Sum sorted per-day values into day / week / month buckets."""
+    keys, sums = [], []
+    for day, value in zip(days, values):
+        key = period_key(day, granularity)
+        if keys and keys[-1] == key:
+            sums[-1] += value
+        else:
+            keys.append(key)
+            sums.append(value)
+    return keys, [round(total, 2) for total in sums]
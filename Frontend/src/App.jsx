@@ -15,7 +15,7 @@ useEffect(() => {
   const API_URL = import.meta.env.VITE_API_URL ?? "https://jemlo.onrender.com";
   const today = new Date().toISOString().slice(0, 10); // "YYYY-MM-DD"
 
-  fetch(`${API_URL}/api/read-item/${today}`)
+  fetch(`${API_URL}/api/read-item/${today}?fields=waterLiters,plasticRecycledGrams`)
     .then((r) => r.json())
     .then((data) => {
       if (data) {
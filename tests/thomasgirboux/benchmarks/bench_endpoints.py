@@ -0,0 +1,244 @@
+"""
+Latency, memory and database-call benchmarks of the admin and fountain
+endpoints, on synthetic data (see datasets.py) held by the local database
+(storage.LocalDatabase) instead of Firebase.
+
+    cd tests/thomasgirboux
+    python benchmarks/bench_endpoints.py --scale small --scale medium --out bench.json
+    python benchmarks/bench_endpoints.py --scale medium --compare bench.json
+    python benchmarks/bench_endpoints.py --days 730 --orgs 5 --machines 4 --logs 5000
+
+Requests go through the ASGI app (httpx ASGITransport), so routing, auth,
+validation and serialization are measured too. Each read endpoint runs:
+- cold: the dashboard caches and the analytics store are emptied before
+  every request (first dashboard load, or after a write)
+- warm: caches kept (dashboard polling)
+
+Per endpoint and mode the results hold p50/p95/p99/mean latency in ms, the
+database reads and writes per request, and the peak Python memory allocated
+by one request (tracemalloc). --compare exits with status 1 when a p95 is
+more than --tolerance above the baseline file.
+
+create_item only appends the reading to the spool (spool.py), so its
+latency and database calls are those of the request; the spool is drained
+after the measure. The app lifespan is not run: the background writers are
+not needed and the shared thread pool must stay usable.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+if __name__ == "__main__":
+    # Before main is imported: no Firebase project needed
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+import datasets
+import main
+from storage import LocalDatabase
+
+READ_ENDPOINTS = [
+    # name, role, url
+    ("stats_total", "admin", "/api/admin/stats_total"),
+    ("fountain_graph_90d", "admin", "/api/admin/fountain_graph?from={from_90d}"),
+    ("fountain_graph_all", "admin", "/api/admin/fountain_graph"),
+    ("fountains_org", "admin", "/api/admin/fountains"),
+    ("fountains_all_orgs", "super_admin", "/api/admin/fountains"),
+    ("logs", "admin", "/api/admin/logs?limit=50"),
+    ("alerts", "admin", "/api/admin/alerts?limit=20"),
+]
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def reset_caches():
+    main.dashboard_cache.clear()
+    main.user_cache.clear()
+    main.analytics.clear()
+
+
+def client_for(role: str) -> httpx.AsyncClient:
+    payload = {"email": "admin0@jemlo.be", "role": role}
+    if role == "admin":
+        payload["uid"] = datasets.admin_uid(0)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    client.cookies.set("access_token", main.create_access_token(payload))
+    return client
+
+
+async def measure(database, send, requests: int, cold: bool) -> dict:
+    latencies = []
+    reads, writes = database.reads, database.writes
+    for _ in range(requests):
+        if cold:
+            reset_caches()
+        started = time.perf_counter()
+        response = await send()
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.url}: {response.status_code} {response.text}")
+    reads, writes = database.reads - reads, database.writes - writes
+
+    # One more request traced on its own: tracemalloc slows everything down
+    if cold:
+        reset_caches()
+    tracemalloc.start()
+    await send()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "requests": requests,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "db_reads_per_request": round(reads / requests, 2),
+        "db_writes_per_request": round(writes / requests, 2),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+async def run_scale(name: str, scale: dict, requests: int = 50) -> list:
+    """Benchmark every endpoint on one dataset. Returns one result per endpoint and mode."""
+    started = time.perf_counter()
+    database = LocalDatabase()
+    database.reference("/").set(datasets.generate(**scale))
+    load_seconds = time.perf_counter() - started
+    print(f"[{name}] {scale} loaded in {load_seconds:.1f}s", file=sys.stderr)
+
+    previous_db, main.db = main.db, database
+    limits = [(limiter, limiter.limit) for limiter in (main.read_limiter, main.write_limiter)]
+    for limiter, _ in limits:
+        limiter.limit = 0
+    clients = {role: client_for(role) for role in ("admin", "super_admin")}
+    params = {"from_90d": (date.today() - timedelta(days=90)).isoformat()}
+    results = []
+    try:
+        for endpoint, role, url in READ_ENDPOINTS:
+            client, url = clients[role], url.format(**params)
+            for mode in ("cold", "warm"):
+                reset_caches()
+                await client.get(url)  # warm-up, and the first fill in warm mode
+                stats = await measure(database, lambda: client.get(url), requests, mode == "cold")
+                results.append(dict(scale=name, **scale, endpoint=endpoint, mode=mode, **stats))
+
+        readings = {"bottleNumber": 0, "waterLiters": 0.0, "plasticRecycledGrams": 0.0}
+
+        def create_item():
+            readings["bottleNumber"] += 1
+            readings["waterLiters"] += 0.5
+            readings["plasticRecycledGrams"] += 42
+            return clients["admin"].post("/api/create-item/", json=dict(
+                readings, organisation=datasets.org_name(0), machine="M01"
+            ))
+
+        stats = await measure(database, create_item, requests, cold=False)
+        results.append(dict(scale=name, **scale, endpoint="create_item", mode="write", **stats))
+    finally:
+        for client in clients.values():
+            await client.aclose()
+        main.spool_replayer.drain()
+        main.db = previous_db
+        for limiter, limit in limits:
+            limiter.limit = limit
+        reset_caches()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results: list, baseline: dict = None):
+    header = f"{'scale':8} {'endpoint':20} {'mode':5} {'p50':>8} {'p95':>8} {'p99':>8} {'reads':>6} {'KiB':>9}"
+    print(header + ("  p95 vs base" if baseline is not None else ""))
+    for r in results:
+        line = (f"{r['scale']:8} {r['endpoint']:20} {r['mode']:5} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+                f"{r['p99_ms']:8.2f} {r['db_reads_per_request']:6} {r['peak_memory_kb']:9}")
+        base = (baseline or {}).get((r["scale"], r["endpoint"], r["mode"]))
+        if base:
+            line += f"  {r['p95_ms'] / base['p95_ms']:.2f}x" if base["p95_ms"] else "  -"
+        print(line)
+
+
+def regressions(results: list, baseline: dict, tolerance: float) -> list:
+    found = []
+    for r in results:
+        base = baseline.get((r["scale"], r["endpoint"], r["mode"]))
+        # below a millisecond the noise is larger than any regression
+        if base and r["p95_ms"] > max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + 1):
+            found.append(r)
+    return found
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Jemlo endpoint benchmarks")
+    parser.add_argument("--scale", action="append", choices=sorted(datasets.SCALES),
+                        help="Predefined dataset size, can be repeated (default: small)")
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--orgs", type=int, default=5)
+    parser.add_argument("--machines", type=int, default=5)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and mode")
+    parser.add_argument("--out", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON from a previous --out")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 increase (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    scales = {name: datasets.SCALES[name] for name in args.scale or []}
+    if args.days:
+        scales["custom"] = {"days": args.days, "orgs": args.orgs, "machines": args.machines, "logs": args.logs}
+    scales = scales or {"small": datasets.SCALES["small"]}
+
+    results = []
+    for name, scale in scales.items():
+        results += asyncio.run(run_scale(name, scale, args.requests))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["scale"], r["endpoint"], r["mode"]): r for r in json.load(f)["results"]}
+    print_table(results, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({
+                "meta": {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if baseline is not None:
+        slower = regressions(results, baseline, args.tolerance)
+        for r in slower:
+            print(f"REGRESSION {r['scale']} {r['endpoint']} {r['mode']}: p95 {r['p95_ms']} ms", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
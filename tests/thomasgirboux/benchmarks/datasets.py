@@ -0,0 +1,81 @@
+"""
+Synthetic fountain data for the benchmarks.
+
+generate() builds a database tree shaped like production: the raw
+/{date}/{org}/{machine} readings, the /rollups and /by_org nodes create_item
+maintains (and their /migrations markers), one admin profile per organisation in /users, and /logs with a
+share of failed logins copied to /alerts. Values are random but seeded, so
+two runs at the same scale measure the same data.
+"""
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+sys.path.append(os.path.join(ROOT, "Backend", "app"))
+
+import logstore
+import rollups
+
+SCALES = {
+    "small": {"days": 30, "orgs": 2, "machines": 3, "logs": 1000},
+    "medium": {"days": 365, "orgs": 10, "machines": 5, "logs": 20000},
+    "large": {"days": 3 * 365, "orgs": 25, "machines": 8, "logs": 100000},
+}
+
+
+def org_name(i: int) -> str:
+    return f"ORG{i:03d}"
+
+
+def admin_uid(i: int) -> str:
+    return f"bench-admin-{i:03d}"
+
+
+def generate(days: int, orgs: int, machines: int, logs: int = 0, seed: int = 42,
+             end: date = None) -> dict:
+    """Database tree with `days` days up to `end` (default: yesterday)."""
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+    tree = {}
+
+    for offset in range(days):
+        day = (end - timedelta(days=days - 1 - offset)).isoformat()
+        tree[day] = {}
+        for o in range(orgs):
+            org_machines = {}
+            for m in range(machines):
+                bottles = rng.randint(0, 200)
+                org_machines[f"M{m + 1:02d}"] = {
+                    "bottleNumber": bottles,
+                    "waterLiters": round(bottles * rng.uniform(0.3, 0.75), 2),
+                    "plasticRecycledGrams": bottles * 42,
+                }
+            tree[day][org_name(o)] = org_machines
+
+    tree[rollups.ROLLUP_ROOT] = rollups.build_rollups(tree)
+    tree[rollups.MIGRATIONS_ROOT] = {rollups.ROLLUPS_MIGRATION: 0, rollups.BY_ORG_MIGRATION: 0}
+    for path, machines_by_day in rollups.by_org_updates(tree).items():
+        _, org, day = path.split("/")
+        tree.setdefault(rollups.BY_ORG_ROOT, {}).setdefault(org, {})[day] = machines_by_day
+
+    tree["users"] = {
+        admin_uid(o): {"email": f"admin{o}@jemlo.be", "role": "admin", "organisation": org_name(o)}
+        for o in range(orgs)
+    }
+
+    started = datetime.combine(end, datetime.min.time()) - timedelta(days=days)
+    step = timedelta(days=days) / max(logs, 1)
+    for i in range(logs):
+        failed = rng.random() < 0.2
+        updates = logstore.log_updates(
+            f"Failed login attempt from 10.0.{i % 256}.{i // 256 % 256}" if failed else f"Admin login #{i}",
+            "failed_login" if failed else "login",
+            now=started + step * i,
+        )
+        for path, entry in updates.items():
+            root, key = path.split("/")
+            tree.setdefault(root, {})[key] = entry
+
+    return tree
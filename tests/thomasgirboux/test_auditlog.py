@@ -0,0 +1,73 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from auditlog import AuditLogger
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.writes = []
+        self.fail = False
+
+    def __call__(self, updates):
+        if self.fail:
+            raise ConnectionError("firebase unreachable")
+        self.writes.append(updates)
+
+
+class TestAuditLogger:
+    """Unit tests for the background audit log writer"""
+
+    def test_entries_are_written_in_one_batch(self):
+        writer = RecordingWriter()
+        logger = AuditLogger(writer)
+        logger.log("User login: a@jemlo.be", "login")
+        logger.log("Failed admin login: b@jemlo.be", "failed_login")
+
+        assert writer.writes == []  # nothing written inline
+        assert logger.flush() == 2
+        assert len(writer.writes) == 1
+        paths = list(writer.writes[0])
+        assert sum(p.startswith("logs/") for p in paths) == 2
+        assert sum(p.startswith("alerts/") for p in paths) == 1
+
+    def test_overload_samples_then_drops_and_reports(self):
+        writer = RecordingWriter()
+        logger = AuditLogger(writer, max_queue=10, batch_size=100, sample_above=0.5, sample_every=5)
+        kept = [logger.log(f"attempt {i}", "failed_login") for i in range(60)]
+
+        stats = logger.stats()
+        assert kept[:5] == [True] * 5
+        assert stats["queued_now"] == 10
+        assert stats["sampled_out"] > 0 and stats["dropped"] > 0
+
+        logger.flush()
+        messages = [v["message"] for k, v in writer.writes[0].items() if k.startswith("logs/")]
+        assert f"Audit log overloaded: {60 - 10} entries not recorded" in messages
+
+    def test_failed_write_keeps_entries(self):
+        writer = RecordingWriter()
+        logger = AuditLogger(writer)
+        logger.log("User login: a@jemlo.be", "login")
+
+        writer.fail = True
+        with pytest.raises(ConnectionError):
+            logger.flush()
+        writer.fail = False
+
+        assert logger.flush() == 1
+        assert logger.stats()["written"] == 1
+
+    def test_stop_flushes_remaining_entries(self):
+        writer = RecordingWriter()
+        logger = AuditLogger(writer, flush_interval=60)
+        logger.start()
+        logger.log("Super admin login", "login")
+        logger.stop()
+
+        assert len(writer.writes) == 1
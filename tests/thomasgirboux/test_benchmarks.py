@@ -0,0 +1,46 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(os.path.join(ROOT, "Backend", "app"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "benchmarks"))
+
+# Same Firebase mocks as test_main: the benchmarks swap main.db themselves
+sys.modules['firebase_admin'] = MagicMock()
+sys.modules['firebase_admin.credentials'] = MagicMock()
+sys.modules['firebase_admin.db'] = MagicMock()
+sys.modules['firebase_admin.auth'] = MagicMock()
+
+import bench_endpoints
+import datasets
+
+
+class TestBenchmarks:
+    """Keeps the benchmark suite runnable (tiny dataset, few requests)"""
+
+    def test_dataset_shape(self):
+        tree = datasets.generate(days=3, orgs=2, machines=2, logs=10)
+        day = sorted(k for k in tree if k[:2] == "20")[-1]
+        assert sorted(tree[day]) == ["ORG000", "ORG001"]
+        assert tree["rollups"]["total"]["fountains"] == 4
+        assert tree["by_org"]["ORG001"][day] == tree[day]["ORG001"]
+        assert len(tree["logs"]) == 10
+
+    @pytest.mark.asyncio
+    async def test_run_scale_reports_every_endpoint(self):
+        results = await bench_endpoints.run_scale(
+            "tiny", {"days": 5, "orgs": 2, "machines": 2, "logs": 20}, requests=2
+        )
+        endpoints = {(r["endpoint"], r["mode"]) for r in results}
+        assert ("fountains_org", "cold") in endpoints
+        assert ("create_item", "write") in endpoints
+        assert all(r["p50_ms"] <= r["p99_ms"] for r in results)
+
+    def test_regressions_against_baseline(self):
+        result = {"scale": "s", "endpoint": "logs", "mode": "warm", "p95_ms": 30.0}
+        baseline = {("s", "logs", "warm"): dict(result, p95_ms=20.0)}
+        assert bench_endpoints.regressions([result], baseline, tolerance=0.25) == [result]
+        assert bench_endpoints.regressions([result], baseline, tolerance=0.6) == []
@@ -0,0 +1,76 @@
+import os
+import sys
+from unittest.mock import patch
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from cache import TTLCache
+from conditional import ResponseVersions, etag_matches
+
+
+class TestTTLCache:
+    """Unit tests for the dashboard cache"""
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=4, ttl=30)
+        assert cache.get("a") is None
+        cache.set("a", {"x": 1})
+        assert cache.get("a") == {"x": 1}
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLCache(maxsize=4, ttl=5)
+        with patch("cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+        with patch("cache.time.monotonic", return_value=104.9):
+            assert cache.get("a") == 1
+        with patch("cache.time.monotonic", return_value=105.0):
+            assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=30)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate_with_predicate(self):
+        cache = TTLCache()
+        cache.set(("fountains", "EPHEC01", None), 1)
+        cache.set(("fountains", "UCL", None), 2)
+        cache.set(("stats_total",), 3)
+
+        removed = cache.invalidate(lambda key: key[0] != "fountains" or key[1] == "EPHEC01")
+
+        assert removed == 2
+        assert cache.get(("fountains", "UCL", None)) == 2
+
+
+class TestResponseVersions:
+    """Unit tests for the ETags of the cached responses"""
+
+    def test_version_kept_while_value_is_equal(self):
+        versions = ResponseVersions()
+        etag = versions.etag(("stats_total",), {"total_water": 1.0})
+
+        assert versions.etag(("stats_total",), {"total_water": 1.0}) == etag
+        assert versions.etag(("stats_total",), {"total_water": 2.0}) != etag
+        assert versions.etag(("fountains", None, None), {"total_water": 1.0}) != etag
+
+    def test_if_none_match_weak_comparison(self):
+        etag = 'W/"abc-1"'
+        assert etag_matches('W/"abc-1"', etag)
+        assert etag_matches('"abc-1"', etag)
+        assert etag_matches('W/"abc-0", W/"abc-1"', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('W/"abc-2"', etag)
+        assert not etag_matches("", etag)
@@ -0,0 +1,41 @@
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+import cli
+
+
+class TestServe:
+    """Configuration checked by `cli.py serve` before starting the workers"""
+
+    def test_refuses_to_start_without_a_spool_file(self):
+        with patch.dict(os.environ, {"INGEST_SPOOL_PATH": ""}), \
+                patch("dotenv.load_dotenv"), patch("uvicorn.run") as run:
+            with pytest.raises(SystemExit):
+                cli.main(["serve"])
+        run.assert_not_called()
+
+    def test_one_worker_without_shared_rate_limits(self, tmp_path):
+        env = {"INGEST_SPOOL_PATH": str(tmp_path / "spool.sqlite"), "RATE_LIMIT_SQLITE_PATH": "",
+               "WEB_CONCURRENCY": ""}
+        with patch.dict(os.environ, env), patch("dotenv.load_dotenv"), patch("uvicorn.run") as run:
+            cli.main(["serve"])
+            assert run.call_args.kwargs["workers"] == 1
+            with pytest.raises(SystemExit):
+                cli.main(["serve", "--workers", "4"])
+        assert run.call_count == 1
+
+    def test_several_workers_once_both_files_are_shared(self, tmp_path):
+        env = {"INGEST_SPOOL_PATH": str(tmp_path / "spool.sqlite"),
+               "RATE_LIMIT_SQLITE_PATH": str(tmp_path / "ratelimit.sqlite"), "WEB_CONCURRENCY": ""}
+        with patch.dict(os.environ, env), patch("dotenv.load_dotenv"), patch("uvicorn.run") as run:
+            cli.main(["serve"])
+            assert run.call_args.kwargs["workers"] == 2
+            cli.main(["serve", "--workers", "4"])
+        assert run.call_args.kwargs["workers"] == 4
@@ -0,0 +1,167 @@
+import os
+import sys
+import threading
+import time
+import asyncio
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from dataaccess import BlockingPool, BackendBusyError, BackendTimeoutError, DayReader
+from storage import LocalDatabase
+
+
+class TestBlockingPool:
+    """Unit tests for the thread pool running blocking Firebase calls"""
+
+    @pytest.mark.asyncio
+    async def test_call_runs_outside_event_loop(self):
+        """The function runs in a pool thread and its result is returned"""
+        pool = BlockingPool(max_workers=2)
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+
+        assert thread_name.startswith("firebase")
+        assert pool.stats()["calls"] == 1
+
+    @pytest.mark.asyncio
+    async def test_slow_calls_do_not_serialize(self):
+        """Blocking calls overlap instead of freezing the loop one after the other"""
+        pool = BlockingPool(max_workers=4)
+        start = time.monotonic()
+        await asyncio.gather(*(pool.run(time.sleep, 0.2) for _ in range(4)))
+
+        assert time.monotonic() - start < 0.6
+
+    @pytest.mark.asyncio
+    async def test_timeout_raises_504(self):
+        pool = BlockingPool(max_workers=1, timeout=0.05)
+        with pytest.raises(BackendTimeoutError) as exc:
+            await pool.run(time.sleep, 0.3)
+
+        assert exc.value.status_code == 504
+        assert pool.stats()["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_too_many_pending_calls_raise_503(self):
+        pool = BlockingPool(max_workers=1, max_pending=1)
+        first = asyncio.ensure_future(pool.run(time.sleep, 0.2))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(BackendBusyError) as exc:
+            await pool.run(time.sleep, 0)
+        await first
+
+        assert exc.value.status_code == 503
+        assert pool.stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_with_same_key_share_one_read(self):
+        """Single flight: one execution per key, its result handed to every waiter"""
+        pool = BlockingPool(max_workers=4)
+        reads = []
+
+        def read(path):
+            reads.append(path)
+            time.sleep(0.05)
+            return {"path": path}
+
+        results = await asyncio.gather(
+            *[pool.run(read, "/rollups/total", key=("stats_total",)) for _ in range(10)],
+            pool.run(read, "/rollups/machines", key=("fountains", None)),
+        )
+
+        assert reads.count("/rollups/total") == 1
+        assert results[0] is results[9]
+        assert results[10] == {"path": "/rollups/machines"}
+        assert pool.stats()["coalesced"] == 9
+        assert pool.stats()["in_flight_keys"] == 0
+
+        # Once landed, the next call reads again
+        await pool.run(read, "/rollups/total", key=("stats_total",))
+        assert reads.count("/rollups/total") == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_shared_and_cancelled_waiter_does_not_cancel_the_read(self):
+        pool = BlockingPool(max_workers=2)
+
+        def fail():
+            time.sleep(0.05)
+            raise ValueError("firebase down")
+
+        leader = asyncio.ensure_future(pool.run(fail, key="k"))
+        follower = asyncio.ensure_future(pool.run(fail, key="k"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        with pytest.raises(ValueError):
+            await follower
+        assert pool.stats()["coalesced"] == 1
+
+
+def day_reader(database, **options):
+    paths = []
+
+    def read_keys(path):
+        paths.append(path)
+        return database.reference(path).get(shallow=True)
+
+    def read_range(path, first, last):
+        paths.append((path, first, last))
+        return database.reference(path).order_by_key().start_at(first).end_at(last).get()
+
+    return DayReader(read_keys, read_range, **options), paths
+
+
+class TestDayReader:
+    """Unit tests for the day-by-day history reader"""
+
+    def _database(self, days=10):
+        database = LocalDatabase()
+        database.reference("/").set({
+            **{f"2025-12-{day:02d}": {"EPHEC01": {"M01": {"waterLiters": day}}} for day in range(1, days + 1)},
+            "users": {"uid-1": {"organisation": "EPHEC01"}},
+            "logs": {"-a": {"action": "login"}},
+        })
+        return database
+
+    def test_days_in_order_by_small_ranges(self):
+        reader, paths = day_reader(self._database(), max_workers=2, days_per_read=3)
+        days = list(reader.iter_days("/"))
+
+        assert [day for day, _ in days] == [f"2025-12-{day:02d}" for day in range(1, 11)]
+        assert days[4][1] == {"EPHEC01": {"M01": {"waterLiters": 5}}}
+        # One shallow listing, then 4 ranges of at most 3 days: /users and /logs never read
+        assert paths[0] == "/"
+        assert paths[1:] == [("/", "2025-12-01", "2025-12-03"), ("/", "2025-12-04", "2025-12-06"),
+                             ("/", "2025-12-07", "2025-12-09"), ("/", "2025-12-10", "2025-12-10")]
+        assert reader.stats()["days"] == 10
+
+    def test_window_and_sub_path(self):
+        database = self._database()
+        database.reference("/by_org/EPHEC01").set({"2025-12-02": {"M01": {"waterLiters": 1}},
+                                                  "2025-12-05": {"M01": {"waterLiters": 2}}})
+        reader, _ = day_reader(database)
+
+        assert [day for day, _ in reader.iter_days("/", "2025-12-09")] == ["2025-12-09", "2025-12-10"]
+        assert [day for day, _ in reader.iter_days("/by_org/EPHEC01")] == ["2025-12-02", "2025-12-05"]
+        assert list(reader.iter_days("/", "2026-01-01")) == []
+
+    def test_reads_in_flight_are_bounded(self):
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def read_range(path, first, last):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return {first: {}}
+
+        keys = {f"2025-12-{day:02d}": True for day in range(1, 21)}
+        reader = DayReader(lambda path: keys, read_range, max_workers=3, days_per_read=1)
+
+        assert len(list(reader.iter_days())) == 20
+        assert peak[0] <= 3
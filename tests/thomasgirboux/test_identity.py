@@ -0,0 +1,60 @@
+import os
+import sys
+import httpx
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from identity import IdentityToolkitClient
+
+
+def stub_transport(statuses, seen):
+    """Identity Toolkit stand-in answering the given status codes in order."""
+    statuses = list(statuses)
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(statuses.pop(0), json={})
+
+    return httpx.MockTransport(handler)
+
+
+class TestIdentityToolkitClient:
+    """Unit tests for the pooled Identity Toolkit client"""
+
+    @pytest.mark.asyncio
+    async def test_sign_in_request(self):
+        seen = []
+        client = IdentityToolkitClient("api-key", transport=stub_transport([200], seen))
+        response = await client.sign_in_with_password("a@jemlo.be", "secret")
+        await client.close()
+
+        assert response.status_code == 200
+        assert seen[0].url.path == "/v1/accounts:signInWithPassword"
+        assert seen[0].url.params["key"] == "api-key"
+
+    @pytest.mark.asyncio
+    async def test_transient_errors_are_retried(self):
+        seen = []
+        client = IdentityToolkitClient(
+            "api-key", backoff=0, transport=stub_transport([503, 429, 200], seen)
+        )
+        response = await client.sign_in_with_password("a@jemlo.be", "secret")
+        await client.close()
+
+        assert response.status_code == 200
+        assert len(seen) == 3
+
+    @pytest.mark.asyncio
+    async def test_bad_password_is_not_retried(self):
+        seen = []
+        client = IdentityToolkitClient(
+            "api-key", backoff=0, transport=stub_transport([400, 200], seen)
+        )
+        response = await client.sign_in_with_password("a@jemlo.be", "wrong")
+        await client.close()
+
+        assert response.status_code == 400
+        assert len(seen) == 1
@@ -0,0 +1,209 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from ingest import BATCH_ROOT, WriteBuffer, BufferFullError
+from rollups import increment
+
+
+class FakeFirebase:
+    """Records reads and multi-path updates, applied to an in-memory tree, instead of calling Firebase."""
+
+    def __init__(self, tree=None):
+        self.tree = tree or {}
+        self.reads = []
+        self.writes = []
+        self.fail = False
+
+    def read(self, path, shallow):
+        self.reads.append(path)
+        node = self.tree
+        for part in path.strip("/").split("/"):
+            node = node.get(part) if isinstance(node, dict) else None
+        if shallow and isinstance(node, dict):
+            return {k: True for k in node}
+        return node
+
+    def write(self, updates):
+        if self.fail:
+            raise ConnectionError("firebase unreachable")
+        self.writes.append(updates)
+        for path, value in updates.items():
+            *parents, key = path.strip("/").split("/")
+            node = self.tree
+            for part in parents:
+                node = node.setdefault(part, {})
+            if value is None:
+                node.pop(key, None)
+            elif isinstance(value, dict) and ".sv" in value:
+                sv = value[".sv"]
+                node[key] = node.get(key, 0) + sv["increment"] if isinstance(sv, dict) else 1
+            else:
+                node[key] = value
+
+
+def reading(bottles, water, plastic):
+    return {"bottleNumber": bottles, "waterLiters": water, "plasticRecycledGrams": plastic}
+
+
+class TestWriteBuffer:
+    """Unit tests for the ingest write buffer"""
+
+    def test_readings_coalesced_into_one_update(self):
+        """Several readings of the same machine end up as one write"""
+        fb = FakeFirebase()
+        buffer = WriteBuffer(fb.read, fb.write)
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(2, 2.0, 84))
+        buffer.add("2025-12-01", "EPHEC01", "M02", reading(1, 0.5, 0))
+
+        assert buffer.flush() == 2
+        assert len(fb.writes) == 1
+        updates = fb.writes[0]
+        assert updates["2025-12-01/EPHEC01/M01"]["waterLiters"] == 2.0
+        assert updates["rollups/total/waterLiters"] == increment(2.5)
+        assert updates["rollups/total/fountains"] == increment(2)
+        assert updates["rollups/version"] == increment(1)
+        assert buffer.stats()["coalesced"] == 1
+
+    def test_previous_values_come_from_memory(self):
+        """Only the first flush of the day reads the organisation node"""
+        fb = FakeFirebase({"2025-12-01": {"EPHEC01": {"M01": reading(1, 1.0, 42)}},
+                           "rollups": {"machines": {"EPHEC01": {"M01": {}}}}})
+        buffer = WriteBuffer(fb.read, fb.write)
+
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(2, 1.5, 84))
+        buffer.flush()
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(3, 3.0, 126))
+        buffer.flush()
+
+        assert fb.reads.count("/2025-12-01/EPHEC01") == 1
+        assert fb.writes[0]["rollups/days/2025-12-01/waterLiters"] == increment(0.5)
+        assert fb.writes[1]["rollups/days/2025-12-01/waterLiters"] == increment(1.5)
+        assert "rollups/total/fountains" not in fb.writes[0]
+
+    def test_two_buffers_writing_the_same_machine(self):
+        """A buffer finding another writer's batch id reads the stored values again"""
+        fb = FakeFirebase()
+        first, second = WriteBuffer(fb.read, fb.write), WriteBuffer(fb.read, fb.write)
+        for buffer, water in ((first, 10.0), (second, 20.0), (first, 25.0)):
+            buffer.add("2025-12-01", "EPHEC01", "M01", reading(int(water), water, 0))
+            buffer.flush()
+
+        assert fb.tree["2025-12-01"]["EPHEC01"]["M01"]["waterLiters"] == 25.0
+        assert fb.tree["rollups"]["total"]["waterLiters"] == 25.0
+        assert fb.tree["rollups"]["total"]["fountains"] == 1
+        assert fb.tree["rollups"]["machines"]["EPHEC01"]["M01"]["days"] == 1
+        # one update per flush, no other write
+        assert len(fb.writes) == 3
+
+    def test_full_buffer_rejects_whole_batch(self):
+        """Backpressure: nothing is queued when the batch does not fit"""
+        fb = FakeFirebase()
+        buffer = WriteBuffer(fb.read, fb.write, max_pending=2)
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+
+        with pytest.raises(BufferFullError):
+            buffer.add_many([
+                ("2025-12-01", "EPHEC01", "M02", reading(1, 1.0, 42)),
+                ("2025-12-01", "EPHEC01", "M03", reading(1, 1.0, 42)),
+            ])
+        # same key again is coalesced, it still fits
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(2, 2.0, 84))
+        assert buffer.stats()["pending"] == 1
+
+    def test_failed_flush_keeps_readings(self):
+        """Readings stay pending when Firebase cannot be reached"""
+        fb = FakeFirebase()
+        buffer = WriteBuffer(fb.read, fb.write)
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+
+        fb.fail = True
+        with pytest.raises(ConnectionError):
+            buffer.flush()
+        assert buffer.stats()["pending"] == 1
+
+        fb.fail = False
+        assert buffer.flush() == 1
+        assert fb.writes[0]["rollups/total/fountains"] == increment(1)
+
+    def test_write_applied_despite_an_error_is_not_sent_again(self):
+        """The batch marker tells the retry that Firebase applied the update"""
+        fb = FakeFirebase()
+        timeout = [False]
+
+        def write(updates):
+            fb.writes.append(updates)
+            if timeout[0]:
+                marker = next(path for path in updates if path.startswith(BATCH_ROOT))
+                _, day, batch_id = marker.split("/")
+                fb.tree.setdefault(BATCH_ROOT, {}).setdefault(day, {})[batch_id] = 1
+                raise TimeoutError("no answer")
+
+        written = []
+        buffer = WriteBuffer(fb.read, write, on_flush=written.append)
+        timeout[0] = True
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))])
+        with pytest.raises(TimeoutError):
+            buffer.flush()
+        assert buffer.stats()["pending"] == 1
+
+        timeout[0] = False
+        assert buffer.flush() == 1
+        assert len(fb.writes) == 1
+        assert written == [{("2025-12-01", "EPHEC01", "M01"): reading(1, 0.5, 42)}]
+
+    def test_write_not_applied_is_sent_again(self):
+        """Without its marker the same batch is re-sent, before newer rows"""
+        fb = FakeFirebase()
+        buffer = WriteBuffer(fb.read, fb.write)
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))])
+        fb.fail = True
+        with pytest.raises(ConnectionError):
+            buffer.flush()
+
+        fb.fail = False
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M01", reading(2, 1.0, 84))])
+        assert buffer.flush() == 2
+        assert fb.writes[0]["2025-12-01/EPHEC01/M01/waterLiters"] == increment(0.5)
+        assert fb.writes[1]["2025-12-01/EPHEC01/M01/waterLiters"] == increment(1.0)
+
+    def test_deltas_summed_into_increments(self):
+        """Many deltas of a machine become one increment per counter"""
+        fb = FakeFirebase({"2025-12-01": {"EPHEC01": {"M01": reading(10, 5.0, 420)}},
+                           "rollups": {"machines": {"EPHEC01": {"M01": {}}}}})
+        written = []
+        buffer = WriteBuffer(fb.read, fb.write, on_flush=written.append)
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))] * 3)
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M02", {"waterLiters": 0.25})])
+
+        assert buffer.flush() == 2
+        updates = fb.writes[0]
+        assert updates["2025-12-01/EPHEC01/M01/bottleNumber"] == increment(3)
+        assert updates["by_org/EPHEC01/2025-12-01/M01/waterLiters"] == increment(1.5)
+        assert updates["rollups/total/waterLiters"] == increment(1.75)
+        assert "2025-12-01/EPHEC01/M02/bottleNumber" not in updates
+        assert updates["rollups/total/fountains"] == increment(1)
+        assert "rollups/machines/EPHEC01/M01/days" not in updates
+        assert written[0][("2025-12-01", "EPHEC01", "M01")] == reading(13, 6.5, 546)
+        assert buffer.stats()["coalesced"] == 2
+
+    def test_delta_added_to_a_pending_reading(self):
+        fb = FakeFirebase()
+        buffer = WriteBuffer(fb.read, fb.write)
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+        buffer.add_deltas([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))])
+        buffer.flush()
+        assert fb.writes[0]["2025-12-01/EPHEC01/M01"] == reading(2, 1.5, 84)
+
+    def test_old_batch_markers_deleted_on_a_new_day(self):
+        fb = FakeFirebase({BATCH_ROOT: {"2025-11-29": {"a": 1}, "2025-11-30": {"b": 1}}})
+        buffer = WriteBuffer(fb.read, fb.write)
+        buffer.add("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+        buffer.flush()
+        assert fb.writes[0][f"{BATCH_ROOT}/2025-11-29"] is None
+        assert f"{BATCH_ROOT}/2025-11-30" not in fb.writes[0]
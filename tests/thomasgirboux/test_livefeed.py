@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from livefeed import LiveFeed, apply_event
+
+
+class FakeListener:
+    """Stands in for db.reference(path).listen(callback)"""
+
+    def __init__(self):
+        self.paths = []
+        self.callback = None
+        self.closed = 0
+
+    def listen(self, path, callback):
+        self.paths.append(path)
+        self.callback = callback
+        return SimpleNamespace(close=self.close)
+
+    def close(self):
+        self.closed += 1
+
+    def send(self, event_type, path, data):
+        self.callback(SimpleNamespace(event_type=event_type, path=path, data=data))
+
+
+class TestApplyEvent:
+    """Unit tests for the Firebase event to machine mapping"""
+
+    def test_initial_put_touches_every_machine(self):
+        tree = {}
+        touched = apply_event(tree, "put", "/", {"EPHEC01": {"M01": {"waterLiters": 1}, "M02": {}}})
+        assert touched == {("EPHEC01", "M01"), ("EPHEC01", "M02")}
+
+    def test_patch_with_nested_keys(self):
+        tree = {"EPHEC01": {"M01": {"waterLiters": 1}}}
+        touched = apply_event(tree, "patch", "/EPHEC01", {"M01/waterLiters": 2, "M02": {"waterLiters": 3}})
+        assert touched == {("EPHEC01", "M01"), ("EPHEC01", "M02")}
+        assert tree["EPHEC01"]["M01"] == {"waterLiters": 2}
+
+    def test_deleting_an_org_touches_its_machines(self):
+        tree = {"EPHEC01": {"M01": {"waterLiters": 1}}, "EPHEC02": {"M01": {}}}
+        assert apply_event(tree, "put", "/EPHEC01", None) == {("EPHEC01", "M01")}
+        assert "EPHEC01" not in tree
+
+
+class TestLiveFeed:
+    """Unit tests for the shared listener and the subscribers fan-out"""
+
+    def make_feed(self, changes):
+        listener = FakeListener()
+        feed = LiveFeed(listener.listen, changes.extend, today=lambda: "2025-12-01", max_queue=2)
+        return feed, listener
+
+    @pytest.mark.asyncio
+    async def test_one_listener_for_all_subscribers(self):
+        changes = []
+        feed, listener = self.make_feed(changes)
+        loop = asyncio.get_running_loop()
+
+        first, snapshot = feed.subscribe("EPHEC01", loop, lambda: {"days": []})
+        second, _ = feed.subscribe(None, loop, lambda: {})
+        assert snapshot == {"days": []}
+        assert listener.paths == ["/2025-12-01"]
+
+        listener.send("put", "/EPHEC01/M01", {"waterLiters": 1.5})
+        assert changes == [("2025-12-01", "EPHEC01", "M01", {"waterLiters": 1.5})]
+
+        feed.unsubscribe(first)
+        assert listener.closed == 0
+        feed.unsubscribe(second)
+        await asyncio.sleep(0.05)
+        assert listener.closed == 1
+
+    @pytest.mark.asyncio
+    async def test_publish_filters_by_organisation(self):
+        feed, _ = self.make_feed([])
+        loop = asyncio.get_running_loop()
+        org_admin, _ = feed.subscribe("EPHEC01", loop, dict)
+        super_admin, _ = feed.subscribe(None, loop, dict)
+
+        feed.publish([("2025-12-01", "EPHEC02", "M01", {"water": 1.0})])
+        await asyncio.sleep(0)
+
+        assert org_admin.queue.empty()
+        seq, items = super_admin.queue.get_nowait()
+        assert seq > super_admin.seen
+        assert items == [{"date": "2025-12-01", "org": "EPHEC02", "machine": "M01", "water": 1.0}]
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_is_resynced(self):
+        feed, _ = self.make_feed([])
+        loop = asyncio.get_running_loop()
+        subscription, _ = feed.subscribe(None, loop, lambda: {"days": ["2025-12-01"]})
+
+        for _ in range(3):
+            feed.publish([("2025-12-01", "EPHEC01", "M01", {"water": 1.0})])
+        await asyncio.sleep(0)
+
+        assert subscription.overflowed
+        assert feed.resync(subscription) == {"days": ["2025-12-01"]}
+        assert subscription.seen == 3
+        assert feed.stats()["overflows"] == 1
@@ -0,0 +1,65 @@
+import os
+import sys
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from logstore import push_id, key_prefix, log_updates, page, archive_updates
+
+
+class TestPushIds:
+    """Unit tests for the time-ordered log keys"""
+
+    def test_ids_sort_by_creation_time(self):
+        ids = [push_id(1700000000000), push_id(1700000000000), push_id(1700000000001)]
+
+        assert len(ids[0]) == 20
+        assert ids == sorted(ids)
+        assert len(set(ids)) == 3
+
+    def test_key_prefix_splits_older_entries(self):
+        when = datetime(2025, 12, 1, 12, 0)
+        older = push_id(int(when.timestamp() * 1000) - 1)
+        newer = push_id(int(when.timestamp() * 1000))
+
+        assert older < key_prefix(when) <= newer
+
+
+class TestLogEntries:
+    """Unit tests for log writes, pages and archival"""
+
+    def test_failed_login_also_goes_to_alerts(self):
+        now = datetime(2025, 12, 1, 8, 30)
+        login = log_updates("User login: a@jemlo.be", "login", key="k1", now=now)
+        failed = log_updates("Failed admin login", "failed_login", key="k2", now=now)
+
+        assert list(login) == ["logs/k1"]
+        assert set(failed) == {"logs/k2", "alerts/k2"}
+        assert failed["alerts/k2"]["timestamp"] == "2025-12-01T08:30:00"
+
+    def test_page_is_newest_first_without_cursor(self):
+        data = {"a": {"message": "1"}, "b": {"message": "2"}, "c": {"message": "3"}}
+
+        assert [e["id"] for e in page(data, 2)] == ["c", "b"]
+        assert [e["id"] for e in page(data, 5, cursor="c")] == ["b", "a"]
+
+    def test_page_after_a_deleted_cursor_starts_next_to_it(self):
+        """The cursor m1 is gone: the page after it starts at m2, the newest extra entry is dropped"""
+        newer = {key: {"message": key} for key in ("m2", "m3", "m4")}
+
+        assert [e["id"] for e in page(newer, 2, cursor="m1", newer=True)] == ["m3", "m2"]
+        assert [e["id"] for e in page(dict(newer, m1={}), 2, cursor="m1", newer=True)] == ["m3", "m2"]
+
+    def test_archive_moves_entries_to_month_bucket(self):
+        updates = archive_updates({
+            "k1": {"timestamp": "2025-11-30T23:59:00", "type": "login"},
+            "k2": {"timestamp": "2025-12-01T00:01:00", "type": "failed_login"},
+        })
+
+        assert updates["logs_archive/2025-11/k1"]["type"] == "login"
+        assert updates["logs_archive/2025-12/k2"]["type"] == "failed_login"
+        assert updates["logs/k1"] is None and updates["logs/k2"] is None
+        assert updates["alerts/k2"] is None
+        assert "alerts/k1" not in updates
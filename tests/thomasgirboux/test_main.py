@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 from unittest.mock import MagicMock, patch
 import pytest
 import jwt
@@ -32,7 +33,41 @@ from main import (
     JWT_AUDIENCE,
     JWT_ISSUER,
     get_graph_stat,
+    get_fountains_for_org,
+    get_dashboard_stats,
+    dashboard_cache,
+    invalidate_dashboard_cache,
+    app,
+    get_logs,
+    get_alerts,
+    verify_token,
+    get_admin_organisation,
+    token_cache,
+    user_cache,
+    analytics,
+    day_snapshots,
+    migrations_done,
+    raw_totals_cache,
+    replica_cache,
+    live_snapshot,
 )
+from fastapi.testclient import TestClient
+from storage import LocalDatabase
+from spool import Spool, SpoolFullError
+from snapshots import DaySnapshots
+from replica import Replica
+from ingest import WriteBuffer
+from conditional import ResponseVersions
+
+
+@pytest.fixture(autouse=True)
+def clear_dashboard_cache():
+    """Each test starts with empty caches."""
+    for cache in (dashboard_cache, token_cache, user_cache, analytics, day_snapshots, migrations_done, raw_totals_cache, replica_cache):
+        cache.clear()
+    yield
+    for cache in (dashboard_cache, token_cache, user_cache):
+        cache.clear()
 
 def mock_credentials(token):
     return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
@@ -132,6 +167,17 @@ class TestCreateAccessToken:
         decoded = self._decode(token)
         assert decoded["role"] == "client"
 
+def date_range(mock_db):
+    """The /{date} key-range query: db.reference('/').order_by_key().start_at().end_at()"""
+    return mock_db.reference.return_value.order_by_key.return_value.start_at.return_value.end_at.return_value
+
+
+def date_tree(mock_db, tree):
+    """Serve `tree` to the day reader: shallow key listing, then key-range reads"""
+    mock_db.reference.return_value.get.return_value = {key: True for key in tree or {}}
+    date_range(mock_db).get.return_value = tree
+
+
 class TestFountainGraphEndpoint:
     """Unit tests for the fountain_graph endpoint"""
 
@@ -141,7 +187,7 @@ class TestFountainGraphEndpoint:
     async def test_get_graph_stat_no_data(self, mock_db, mock_org):
         """Test empty database returns empty arrays"""
         mock_org.return_value = "EPHEC01"  # Mock returns org name
-        mock_db.reference.return_value.get.return_value = None
+        date_tree(mock_db, None)
 
         admin_payload = {"email": "admin@jemlo.be", "uid": "test-uid"}
         result = await get_graph_stat(admin=admin_payload)
@@ -163,7 +209,7 @@ class TestFountainGraphEndpoint:
             },
             "users": {}
         }
-        mock_db.reference.return_value.get.return_value = sample_data
+        date_tree(mock_db, sample_data)
 
         admin_payload = {"email": "admin@jemlo.be", "uid": "test-uid"}
         result = await get_graph_stat(admin=admin_payload)
@@ -184,10 +230,850 @@ class TestFountainGraphEndpoint:
             "2025-12-03": {"EPHEC01": {"M01": {"waterLiters": 1.0}}},
             "users": {}
         }
-        mock_db.reference.return_value.get.return_value = sample_data
+        date_tree(mock_db, sample_data)
 
         admin_payload = {"email": "admin@jemlo.be", "uid": "test-uid"}
         result = await get_graph_stat(admin=admin_payload)
 
         assert result["dates"] == ["1 Dec", "2 Dec", "3 Dec"]
-        assert result["water_consumed"] == [2.0, 3.0, 1.0]
\ No newline at end of file
+        assert result["water_consumed"] == [2.0, 3.0, 1.0]
+
+    @patch('main.get_admin_organisation', return_value="EPHEC01")
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_get_graph_stat_cached_until_write(self, mock_db, mock_org):
+        """Polling reuses the cached graph; after a write it is recomputed locally"""
+        date_tree(mock_db, {
+            "2025-12-01": {"EPHEC01": {"M01": {"waterLiters": 2.0}}},
+        })
+        admin_payload = {"email": "admin@jemlo.be", "uid": "test-uid"}
+
+        first = await get_graph_stat(admin=admin_payload)
+        second = await get_graph_stat(admin=admin_payload)
+        assert first == second
+        assert date_range(mock_db).get.call_count == 1
+
+        invalidate_dashboard_cache("2025-12-01", "EPHEC01")
+        await get_graph_stat(admin=admin_payload)
+        assert date_range(mock_db).get.call_count == 1
+        assert dashboard_cache.stats()["hits"] == 1
+
+    @patch('main.get_admin_organisation', return_value="EPHEC01")
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_get_graph_stat_window_and_granularity(self, mock_db, mock_org):
+        """Only the requested window is read, then summed per week / month"""
+        date_tree(mock_db, {
+            "2025-11-30": {"EPHEC01": {"M01": {"waterLiters": 1.0}}},
+            "2025-12-01": {"EPHEC01": {"M01": {"waterLiters": 2.0}}},
+            "2025-12-07": {"EPHEC01": {"M01": {"waterLiters": 3.0}}},
+            "2025-12-08": {"EPHEC01": {"M01": {"waterLiters": 4.0}}},
+        })
+        admin_payload = {"email": "admin@jemlo.be", "uid": "test-uid"}
+
+        weekly = await get_graph_stat(date_from="2025-11-30", granularity="week", admin=admin_payload)
+        mock_db.reference.return_value.order_by_key.return_value.start_at.assert_called_with("2025-11-30")
+        assert weekly == {"dates": ["24 Nov", "1 Dec", "8 Dec"], "water_consumed": [1.0, 5.0, 4.0]}
+
+        monthly = await get_graph_stat(date_from="2025-12-01", date_to="2025-12-07",
+                                       granularity="month", admin=admin_payload)
+        assert monthly == {"dates": ["Dec 2025"], "water_consumed": [5.0]}
+        assert date_range(mock_db).get.call_count == 1
+
+    @patch('main.get_admin_organisation', return_value="EPHEC01")
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_get_graph_stat_filtered_on_the_admin_organisation(self, mock_db, mock_org):
+        """Same series as the live snapshot: the admin's organisation, every one for a super admin"""
+        date_tree(mock_db, {
+            "2025-12-01": {"EPHEC01": {"M01": {"waterLiters": 2.0}}, "OTHER": {"M01": {"waterLiters": 5.0}}},
+        })
+
+        own = await get_graph_stat(admin={"email": "admin@jemlo.be", "uid": "test-uid", "role": "admin"})
+        every = await get_graph_stat(admin={"email": "root@jemlo.be", "role": "super_admin"})
+
+        assert own["water_consumed"] == [2.0]
+        assert own["water_consumed"] == live_snapshot("EPHEC01")["water_consumed"]
+        assert every["water_consumed"] == [7.0]
+
+    @pytest.mark.asyncio
+    async def test_get_graph_stat_rejects_bad_dates(self):
+        with pytest.raises(HTTPException) as exc:
+            await get_graph_stat(date_from="01/12/2025", admin={"uid": "test-uid"})
+        assert exc.value.status_code == 422
+
+
+class TestFountainsEndpoint:
+    """Unit tests for the fountains endpoint"""
+
+    @patch('main.get_admin_organisation', return_value="ephec01")
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_org_admin_reads_only_its_index(self, mock_db, mock_org):
+        """An organisation's list comes from /by_org/{org}, not from the root"""
+        date_tree(mock_db, {
+            "2025-12-01": {"M01": {"waterLiters": 1.5, "plasticRecycledGrams": 42}},
+            "2025-12-02": {"M01": {"waterLiters": 2.0}},
+        })
+        result = await get_fountains_for_org(admin={"uid": "test-uid", "role": "admin"})
+
+        paths = [call.args[0] for call in mock_db.reference.call_args_list]
+        assert "/by_org/EPHEC01" in paths and "/" not in paths
+        assert result["total_dates"] == 2
+        assert result["machines"] == [{
+            "machine_id": "M01", "water_liters": 3.5, "plastic_grams": 42.0,
+            "dates_seen": ["2025-12-01", "2025-12-02"], "organisations": ["EPHEC01"],
+        }]
+
+    @patch('main.get_admin_organisation', return_value="ephec01")
+    @pytest.mark.asyncio
+    async def test_compact_org_list_read_from_rollups(self, mock_org):
+        """compact=true: first/last day and a count, without reading the days"""
+        database = LocalDatabase()
+        database.reference("/").update({
+            "rollups/machines/EPHEC01/M01": {"waterLiters": 3.5, "plasticRecycledGrams": 42,
+                                             "firstSeen": "2025-01-01", "lastSeen": "2025-12-31", "days": 365},
+            "rollups/orgs/EPHEC01/days": {"2025-01-01": {"waterLiters": 1.0}, "2025-12-31": {"waterLiters": 2.5}},
+            "by_org/EPHEC01/2025-01-01/M01": {"waterLiters": 1.0},
+            "migrations/rollups": 1,
+        })
+        with patch('main.db', database):
+            result = await get_fountains_for_org(compact=True, admin={"uid": "test-uid", "role": "admin"})
+
+        assert result["total_dates"] == 2
+        assert result["machines"] == [{
+            "machine_id": "M01", "water_liters": 3.5, "plastic_grams": 42.0, "first_seen": "2025-01-01",
+            "last_seen": "2025-12-31", "days_seen": 365, "organisations": ["EPHEC01"],
+        }]
+
+    @patch('main.get_admin_organisation', return_value="ephec01")
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_fields_projection(self, mock_db, mock_org):
+        date_tree(mock_db, {"2025-12-01": {"M01": {"waterLiters": 1.5, "plasticRecycledGrams": 42}}})
+        admin = {"uid": "test-uid", "role": "admin"}
+
+        result = await get_fountains_for_org(fields="machine_id,water_liters", admin=admin)
+        assert result["machines"] == [{"machine_id": "M01", "water_liters": 1.5}]
+        # the cached entry keeps every field
+        full = await get_fountains_for_org(admin=admin)
+        assert full["machines"][0]["dates_seen"] == ["2025-12-01"]
+
+        with pytest.raises(HTTPException) as exc:
+            await get_fountains_for_org(fields="machine_id,password", admin=admin)
+        assert exc.value.status_code == 422
+
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_super_admin_reads_machine_rollups(self, mock_db):
+        refs = {
+            "/rollups/machines": {"EPHEC01": {"M01": {"waterLiters": 3.0, "firstSeen": "2025-12-01",
+                                                      "lastSeen": "2025-12-02", "days": 2}}},
+            "/rollups/days": {"2025-12-01": True, "2025-12-02": True},
+            "/migrations/rollups": 0,
+            "/rollups/version": 7,
+        }
+        mock_db.reference.side_effect = lambda path: MagicMock(get=MagicMock(return_value=refs[path]))
+
+        result = await get_fountains_for_org(compact=True, admin={"uid": "test-uid", "role": "super_admin"})
+
+        assert result["total_dates"] == 2
+        assert result["machines"][0]["water_liters"] == 3.0
+        assert result["machines"][0]["days_seen"] == 2
+
+    @pytest.mark.asyncio
+    async def test_super_admin_full_list_read_from_the_date_tree(self):
+        """compact=false: every date of every machine, which the rollups do not keep"""
+        database = LocalDatabase()
+        database.reference("/").update({
+            "2025-12-01/EPHEC01/M01": {"waterLiters": 1.5},
+            "2025-12-02/EPHEC02/M01": {"waterLiters": 2.0},
+            "rollups/machines/EPHEC01/M01": {"waterLiters": 1.5},
+            "migrations/rollups": 1,
+        })
+        with patch('main.db', database):
+            result = await get_fountains_for_org(compact=False, admin={"role": "super_admin"})
+
+        assert result["total_dates"] == 2
+        assert result["machines"] == [{
+            "machine_id": "M01", "water_liters": 3.5, "plastic_grams": 0.0,
+            "dates_seen": ["2025-12-01", "2025-12-02"], "organisations": ["EPHEC01", "EPHEC02"],
+        }]
+
+    @patch('main.get_admin_organisation', return_value="ephec01")
+    @pytest.mark.asyncio
+    async def test_date_tree_read_until_the_indexes_are_migrated(self, mock_org):
+        """/by_org and /rollups only hold the new writes until backfill-by-org and rebuild-rollups"""
+        import main
+        database = LocalDatabase()
+        database.reference("/").update({
+            "2025-12-01/EPHEC01/M01": {"waterLiters": 1.5},
+            "2025-12-01/OTHER/M09": {"waterLiters": 9.0},
+            "2025-12-02/EPHEC01/M01": {"waterLiters": 2.0},
+            "by_org/EPHEC01/2025-12-02/M01": {"waterLiters": 2.0},
+        })
+        admin = {"uid": "test-uid", "role": "admin"}
+        with patch('main.db', database):
+            before = await get_fountains_for_org(admin=admin)
+            every = await get_fountains_for_org(compact=True, admin={"role": "super_admin"})
+            main.backfill_by_org()
+            after = await get_fountains_for_org(admin=admin)
+
+        assert before == after
+        assert before["total_dates"] == 2 and before["machines"][0]["water_liters"] == 3.5
+        assert every["total_dates"] == 2
+        assert {machine["machine_id"]: machine["days_seen"] for machine in every["machines"]} == {"M01": 2, "M09": 1}
+        assert database.reference("/migrations/by_org").get() is not None
+
+
+class TestDashboardStatsEndpoint:
+    """Unit tests for the stats_total endpoint"""
+
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_stats_read_from_rollup_total(self, mock_db):
+        """Stats come from /rollups/total without reading the root"""
+        mock_db.reference.return_value.get.return_value = {
+            "bottleNumber": 10,
+            "waterLiters": 12.345,
+            "plasticRecycledGrams": 420,
+            "fountains": 4,
+        }
+
+        result = await get_dashboard_stats(admin={"email": "admin@jemlo.be"})
+
+        paths = [call.args[0] for call in mock_db.reference.call_args_list]
+        assert paths == ["/rollups/version", "/migrations/rollups", "/rollups/total", "/rollups/version"]
+        assert result == {
+            "active_fountains": 4,
+            "total_water": 12.35,
+            "total_plastic": 420.0,
+            "bottles_saved": 10,
+        }
+
+
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_read_once(self, mock_db):
+        """Dashboards opened together: one /rollups/total read for all of them"""
+        def slow_total():
+            time.sleep(0.05)
+            return {"waterLiters": 1.0, "fountains": 1}
+        mock_db.reference.return_value.get.side_effect = slow_total
+
+        results = await asyncio.gather(*[get_dashboard_stats(admin={"email": "admin@jemlo.be"}) for _ in range(5)])
+
+        # The version, the migration marker, the total, the version again
+        assert mock_db.reference.return_value.get.call_count == 4
+        assert all(result["total_water"] == 1.0 for result in results)
+
+    @pytest.mark.asyncio
+    async def test_raw_tree_totals_until_the_rollups_are_rebuilt(self):
+        """Existing history: the first write's increments alone are not the total"""
+        import main
+        today = datetime.today().strftime("%Y-%m-%d")
+        database = LocalDatabase()
+        database.reference("/").update({"2020-01-06/EPHEC01/M01": {"waterLiters": 100.0}})
+        buffer = WriteBuffer(
+            read=lambda path, shallow: database.reference(path).get(shallow=shallow),
+            write=lambda updates: database.reference('/').update(updates),
+        )
+        buffer.add(today, "EPHEC01", "M01", {"waterLiters": 1.0})
+        buffer.flush()
+        admin = {"email": "admin@jemlo.be"}
+
+        with patch('main.db', database):
+            stats = await get_dashboard_stats(admin=admin)
+            assert stats["total_water"] == 101.0
+            assert database.reference("/rollups/total/waterLiters").get() == 1.0
+
+            # Computed once, not on every request
+            dashboard_cache.clear()
+            with patch.object(main.day_reader, "iter_days", side_effect=AssertionError):
+                assert (await get_dashboard_stats(admin=admin))["total_water"] == 101.0
+
+            main.rebuild_rollups()
+            stats = await get_dashboard_stats(admin=admin)
+
+        assert stats["total_water"] == 101.0
+        assert database.reference("/migrations/rollups").get() is not None
+
+
+class TestLocalStorage:
+    """The API running on the local database instead of Firebase"""
+
+    @patch('main.get_admin_organisation', return_value="EPHEC01")
+    @pytest.mark.asyncio
+    async def test_readings_reach_fountains_and_stats(self, mock_org):
+        import main
+        with patch('main.db', LocalDatabase()):
+            main.rebuild_rollups()  # migration of a new database
+            client = TestClient(app)
+            for water in (1.0, 2.5):
+                response = client.post("/api/create-item/", json={
+                    "bottleNumber": 1, "waterLiters": water, "plasticRecycledGrams": 42,
+                    "organisation": "ephec01", "machine": "M01",
+                })
+                assert response.status_code == 200
+            main.spool_replayer.drain()
+
+            admin = {"uid": "test-uid", "role": "admin"}
+            fountains = await get_fountains_for_org(admin=admin)
+            stats = await get_dashboard_stats(admin=admin)
+
+        assert fountains["machines"][0]["water_liters"] == 2.5
+        assert stats["total_water"] == 2.5
+        assert stats["active_fountains"] == 1
+
+
+class TestCreateItemsEndpoint:
+    """Unit tests for the bulk ingestion endpoint"""
+
+    def _event(self, **extra):
+        return dict({"bottleNumber": 1, "waterLiters": 1.0, "plasticRecycledGrams": 42}, **extra)
+
+    @patch('main.spool')
+    def test_create_items_queues_readings(self, mock_spool):
+        """Readings are spooled with the organisation upper-cased"""
+        client = TestClient(app)
+        response = client.post("/api/create-items", json=[
+            self._event(organisation="ephec01", machine="M01"),
+            self._event(organisation="ephec01", machine="M02"),
+        ], headers={"Idempotency-Key": "batch-1"})
+
+        assert response.status_code == 202
+        assert response.json()["accepted"] == 2
+        readings, key, _, scope = mock_spool.append_many.call_args[0]
+        assert [(org, machine) for _, org, machine, _ in readings] == [("EPHEC01", "M01"), ("EPHEC01", "M02")]
+        assert key == "batch-1"
+        assert scope == "/api/create-items testclient"
+
+    @patch('main.spool')
+    def test_create_items_full_spool_returns_503(self, mock_spool):
+        """A full spool answers 503 with Retry-After"""
+        mock_spool.append_many.side_effect = SpoolFullError("full")
+        client = TestClient(app)
+        response = client.post("/api/create-items", json=[self._event(organisation="EPHEC01", machine="M01")])
+
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+    @patch('main.spool')
+    def test_create_items_requires_machine(self, mock_spool):
+        """Readings without organisation/machine cannot be coalesced"""
+        client = TestClient(app)
+        response = client.post("/api/create-items", json=[self._event()])
+
+        assert response.status_code == 422
+        mock_spool.append_many.assert_not_called()
+
+    def test_create_item_is_accepted_while_firebase_is_down(self):
+        """The reading waits in the spool and is written once Firebase answers again"""
+        import main
+        database = LocalDatabase()
+        buffer = WriteBuffer(
+            read=lambda path, shallow: database.reference(path).get(shallow=shallow),
+            write=lambda updates: database.reference('/').update(updates),
+        )
+        with patch.object(main.spool_replayer, "buffer", buffer), \
+                patch.object(type(database.reference("/")), "update", side_effect=ConnectionError("down")):
+            client = TestClient(app)
+            response = client.post("/api/create-item/", json=self._event(organisation="ephec01", machine="M01"))
+            assert response.status_code == 200
+            with pytest.raises(ConnectionError):
+                main.spool_replayer.drain()
+            assert main.spool.pending() == 1
+
+        with patch.object(main.spool_replayer, "buffer", buffer):
+            assert main.spool_replayer.drain() == 1
+        assert main.spool.pending() == 0
+        assert database.reference("/rollups/total/waterLiters").get() == 1.0
+
+
+
+
+class TestCreateDeltasEndpoint:
+    """Delta-mode ingestion: increments summed and added server-side"""
+
+    def test_deltas_of_concurrent_fountains_add_up(self):
+        import main
+        database = LocalDatabase()
+        database.reference("/").update({f"{datetime.today():%Y-%m-%d}/EPHEC01/M01": {"waterLiters": 10.0}})
+        buffer = WriteBuffer(
+            read=lambda path, shallow: database.reference(path).get(shallow=shallow),
+            write=lambda updates: database.reference('/').update(updates),
+        )
+        client = TestClient(app)
+        with patch.object(main.spool_replayer, "buffer", buffer):
+            for _ in range(3):
+                response = client.post("/api/create-deltas", json=[
+                    {"organisation": "ephec01", "machine": "M01", "bottleNumber": 1, "waterLiters": 0.5},
+                ])
+                assert response.status_code == 202
+            assert main.spool_replayer.drain() == 3
+
+        node = database.reference(f"/{datetime.today():%Y-%m-%d}/EPHEC01/M01").get()
+        assert node == {"waterLiters": 11.5, "bottleNumber": 3}
+        assert database.reference("/rollups/total/waterLiters").get() == 1.5
+
+    @patch('main.spool')
+    def test_negative_delta_rejected(self, mock_spool):
+        client = TestClient(app)
+        response = client.post("/api/create-deltas", json=[
+            {"organisation": "EPHEC01", "machine": "M01", "waterLiters": -1},
+        ])
+        assert response.status_code == 422
+        mock_spool.append_many.assert_not_called()
+
+class TestLogsEndpoints:
+    """Unit tests for the logs and alerts endpoints"""
+
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_get_logs_reads_only_last_entries(self, mock_db):
+        """The latest logs are a limit_to_last query, not a full /logs read"""
+        query = mock_db.reference.return_value.order_by_key.return_value
+        query.limit_to_last.return_value.get.return_value = {
+            "-Nk1": {"timestamp": "2025-12-01T08:00:00", "message": "a", "type": "login"},
+            "-Nk2": {"timestamp": "2025-12-01T09:00:00", "message": "b", "type": "login"},
+        }
+
+        result = await get_logs(admin={"role": "admin"}, limit=2)
+
+        mock_db.reference.assert_called_with("/logs")
+        query.limit_to_last.assert_called_once_with(2)
+        assert [log["id"] for log in result] == ["-Nk2", "-Nk1"]
+
+    @patch('main.db')
+    @pytest.mark.asyncio
+    async def test_get_alerts_before_cursor(self, mock_db):
+        """Older alerts are read from the /alerts index, ending at the cursor"""
+        query = mock_db.reference.return_value.order_by_key.return_value
+        query.end_at.return_value.limit_to_last.return_value.get.return_value = {
+            "-Nk1": {"message": "old", "type": "failed_login"},
+            "-Nk2": {"message": "cursor", "type": "failed_login"},
+        }
+
+        result = await get_alerts(admin={"role": "admin"}, limit=20, before="-Nk2")
+
+        mock_db.reference.assert_called_with("/alerts")
+        query.end_at.assert_called_once_with("-Nk2")
+        assert [log["message"] for log in result] == ["old"]
+
+    def test_page_after_a_deleted_cursor(self):
+        """No entry is skipped when the `after` cursor was deleted meanwhile"""
+        import main
+        database = LocalDatabase()
+        database.reference("/logs").set({f"m{i}": {"message": str(i)} for i in range(6)})
+        database.reference("/logs/m1").delete()
+        with patch('main.db', database):
+            page = main.read_log_page("logs", 2, after="m1")
+
+        assert [log["id"] for log in page] == ["m3", "m2"]
+
+    def test_rebuild_alerts_index_reads_logs_in_pages(self):
+        import main
+        logs = {f"k{i:02d}": {"type": "failed_login" if i % 3 == 0 else "login"} for i in range(10)}
+        database = LocalDatabase()
+        database.reference("/").update({"logs": logs, "alerts": {"stale": {"type": "failed_login"}}})
+        with patch('main.db', database):
+            assert main.rebuild_alerts_index(batch_size=3) == 4
+
+        assert sorted(database.reference("/alerts").get()) == ["k00", "k03", "k06", "k09"]
+        assert database.reference("/migrations/alerts").get() is not None
+
+    @pytest.mark.asyncio
+    async def test_alerts_filtered_from_logs_until_the_index_is_rebuilt(self):
+        """An existing database has its failed logins in /logs only"""
+        import main
+        logs = {f"k{i:02d}": {"type": "failed_login" if i % 3 == 0 else "login"} for i in range(10)}
+        database = LocalDatabase()
+        database.reference("/").update({"logs": logs, "alerts": {"k09": logs["k09"]}})
+        admin = {"role": "admin"}
+        with patch('main.db', database), patch.object(main, "ALERTS_FALLBACK_SCAN", 6):
+            before = await get_alerts(admin=admin, limit=20)
+            older = await get_alerts(admin=admin, limit=20, before="k04")
+            main.rebuild_alerts_index()
+            after = await get_alerts(admin=admin, limit=20)
+
+        assert [alert["id"] for alert in before] == ["k09", "k06"]
+        assert [alert["id"] for alert in older] == ["k03", "k00"]
+        assert [alert["id"] for alert in after] == ["k09", "k06", "k03", "k00"]
+
+
+class TestFountainRateLimit:
+    """The fountain endpoints answer 429 once the client IP is over its limit"""
+
+    def test_read_item_rate_limited(self):
+        import main
+        client = TestClient(app)
+        with patch.object(main.read_limiter, "limit", 300), \
+                patch.object(main.read_limiter, "allow", return_value=12.5):
+            response = client.get("/api/read-item/2025-12-01")
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "13"
+
+    def test_forwarded_for_only_from_trusted_proxies(self):
+        import main
+        request = MagicMock()
+        request.client.host = "10.0.0.2"
+        request.headers = {"X-Forwarded-For": "6.6.6.6, 203.0.113.7, 10.0.0.1"}
+
+        assert main.get_client_ip(request) == "10.0.0.2"
+        with patch('main.TRUSTED_PROXIES', {"10.0.0.1", "10.0.0.2"}):
+            # the spoofed first address is not the one the proxy saw
+            assert main.get_client_ip(request) == "203.0.113.7"
+
+    @pytest.mark.asyncio
+    async def test_login_limiter_runs_off_the_event_loop(self):
+        """The limiter may be SQLite: checked in the threadpool, not on the loop"""
+        import threading
+        import main
+        from fastapi import Response
+        threads = []
+        with patch('main.check_block', side_effect=lambda *args: threads.append(threading.get_ident())), \
+                patch('main.ADMIN_EMAIL', "root@jemlo.be"), patch('main.ADMIN_PASSWORD', "secret"):
+            await main.admin_login(
+                main.AdminLogin(email="root@jemlo.be", password="secret"), Response(), MagicMock()
+            )
+
+        assert threads and threads[0] != threading.get_ident()
+
+
+class TestReadItem:
+    """Past days served from sealed snapshots, the current day from a short cache"""
+
+    def _database(self, today):
+        database = LocalDatabase()
+        database.reference("/").update({
+            "2020-01-06/EPHEC01/M01": {"waterLiters": 4.0},
+            f"{today}/EPHEC01/M01": {"waterLiters": 1.0},
+        })
+        return database
+
+    def test_past_day_sealed_then_served_without_firebase(self, tmp_path):
+        database = self._database(datetime.today().strftime("%Y-%m-%d"))
+        with patch('main.db', database), patch('main.day_snapshots', DaySnapshots(str(tmp_path))):
+            client = TestClient(app)
+            first = client.get("/api/read-item/2020-01-06")
+            reads = database.reads
+            second = client.get("/api/read-item/2020-01-06", headers={"Accept-Encoding": "gzip"})
+            plain = client.get("/api/read-item/2020-01-06", headers={"Accept-Encoding": "identity"})
+
+        assert first.json() == second.json() == plain.json() == {"EPHEC01": {"M01": {"waterLiters": 4.0}}}
+        assert second.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+        assert second.headers["Content-Encoding"] == "gzip"
+        assert "Content-Encoding" not in plain.headers
+        assert database.reads == reads
+        assert (tmp_path / "2020-01-06.json.gz").exists()
+
+    def test_today_cached_until_written(self):
+        today = datetime.today().strftime("%Y-%m-%d")
+        database = self._database(today)
+        with patch('main.db', database):
+            client = TestClient(app)
+            assert client.get(f"/api/read-item/{today}").json()["EPHEC01"]["M01"]["waterLiters"] == 1.0
+            reads = database.reads
+            response = client.get(f"/api/read-item/{today}")
+            assert database.reads == reads
+
+            database.reference(f"/{today}/EPHEC01/M01").update({"waterLiters": 2.0})
+            invalidate_dashboard_cache(today, "EPHEC01")
+            updated = client.get(f"/api/read-item/{today}")
+
+        assert "immutable" not in response.headers.get("Cache-Control", "")
+        assert updated.json()["EPHEC01"]["M01"]["waterLiters"] == 2.0
+
+    def test_fields_keep_only_the_requested_values(self, tmp_path):
+        database = self._database(datetime.today().strftime("%Y-%m-%d"))
+        database.reference("/2020-01-06/EPHEC01/M01").update({"bottleNumber": 8})
+        with patch('main.db', database), patch('main.day_snapshots', DaySnapshots(str(tmp_path))):
+            client = TestClient(app)
+            response = client.get("/api/read-item/2020-01-06?fields=bottleNumber")
+            sealed = client.get("/api/read-item/2020-01-06?fields=bottleNumber")
+
+        assert response.json() == sealed.json() == {"EPHEC01": {"M01": {"bottleNumber": 8}}}
+        assert sealed.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    def test_day_with_spooled_readings_not_sealed(self):
+        import main
+        spool = Spool()
+        spool.append_many([("2020-01-06", "EPHEC01", "M01", {"waterLiters": 5.0})])
+        with patch('main.spool', spool):
+            assert not main.is_final("2020-01-06")
+            assert main.is_final("2020-01-05")
+        assert not main.is_final(datetime.today().strftime("%Y-%m-%d"))
+
+
+class TestAuthCaches:
+    """Unit tests for the verified-token and user profile caches"""
+
+    def _request(self, token):
+        request = MagicMock()
+        request.cookies = {"access_token": token}
+        return request
+
+    def test_verify_token_decodes_once(self):
+        """A token seen before is not decoded/HMAC-verified again"""
+        token = create_access_token({"sub": "a@jemlo.be", "role": "admin"})
+
+        with patch("main.jwt.decode", wraps=jwt.decode) as decode:
+            first = verify_token(self._request(token))
+            second = verify_token(self._request(token))
+
+        assert first == second
+        assert first["role"] == "admin"
+        assert decode.call_count == 1
+
+    def test_verify_token_rejects_expired_token(self):
+        """Tokens are cached only until their exp"""
+        with freeze_time("2024-01-15 10:00:00"):
+            token = create_access_token({"sub": "a@jemlo.be", "role": "admin"})
+            verify_token(self._request(token))
+
+        with freeze_time("2024-01-15 11:00:00"):
+            token_cache.clear()
+            with pytest.raises(HTTPException) as exc:
+                verify_token(self._request(token))
+        assert exc.value.detail == "Token expired"
+
+    @patch('main.db')
+    def test_organisation_read_once_per_uid(self, mock_db):
+        """Dashboard polling does not read /users on every request"""
+        mock_db.reference.return_value.get.return_value = {"organisation": "EPHEC01"}
+        admin = {"uid": "uid-1", "role": "admin"}
+
+        assert get_admin_organisation(admin=admin) == "EPHEC01"
+        assert get_admin_organisation(admin=admin) == "EPHEC01"
+        assert mock_db.reference.return_value.get.call_count == 1
+
+        user_cache.delete("uid-1")  # what create_user / login do
+        get_admin_organisation(admin=admin)
+        assert mock_db.reference.return_value.get.call_count == 2
+
+
+class TestMetricsEndpoint:
+    """/metrics in the Prometheus text format"""
+
+    def test_requests_are_counted_by_route_template(self):
+        client = TestClient(app)
+        assert client.get("/").status_code == 200
+        client.get("/does-not-exist")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'jemlo_http_requests_total{method="GET",route="/",status="200"}' in response.text
+        assert 'route="unmatched",status="404"' in response.text
+        assert 'jemlo_cache_hits{cache="dashboard"}' in response.text
+
+    def test_token_required_when_configured(self):
+        with patch('main.METRICS_TOKEN', "secret"):
+            client = TestClient(app)
+            assert client.get("/metrics").status_code == 401
+            response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
+
+    def test_closed_without_token_in_serve_mode(self):
+        with patch('main.METRICS_REQUIRE_TOKEN', True):
+            assert TestClient(app).get("/metrics").status_code == 404
+            with patch('main.METRICS_TOKEN', "secret"):
+                response = TestClient(app).get("/metrics", headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
+
+
+class TestAnalyticsRefresh:
+    """Writes of the other workers picked up by refresh_analytics"""
+
+    def test_days_replayed_after_midnight_are_read_again(self):
+        import main
+        database = LocalDatabase()
+        database.reference("/").update({
+            "2025-11-28/EPHEC01/M01": {"waterLiters": 1.0},
+            "2025-11-30/EPHEC01/M01": {"waterLiters": 1.0},
+            "2025-12-01/EPHEC01/M01": {"waterLiters": 1.0},
+        })
+        spool = Spool()
+        spool.append_many([("2025-11-28", "EPHEC01", "M01", {"waterLiters": 4.0})])
+        with patch('main.db', database), patch('main.spool', spool), patch('main.spooled_since', None):
+            main.refresh_analytics()
+            # Replayed by another worker, after today's first reading
+            database.reference("/").update({
+                "2025-11-28/EPHEC01/M01": {"waterLiters": 4.0},
+                "2025-11-30/EPHEC01/M01": {"waterLiters": 2.0},
+            })
+            analytics.refreshed_at = None
+            main.refresh_analytics()
+            # Acked meanwhile: the next refresh still reads it once
+            spool.ack(spool.peek(1)[0])
+            database.reference("/2025-11-28/EPHEC01/M01").update({"waterLiters": 5.0})
+            analytics.refreshed_at = None
+            main.refresh_analytics()
+
+        assert analytics.daily_water() == (["2025-11-28", "2025-11-30", "2025-12-01"], [5.0, 2.0, 1.0])
+
+class TestReplicaMode:
+    """Dashboard reads answered from the listener-fed replica (replica.py)"""
+
+    def _wait(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert condition()
+
+    @pytest.mark.asyncio
+    async def test_reads_from_memory_and_kept_current_by_the_listener(self):
+        import main
+        today = datetime.today().strftime("%Y-%m-%d")
+        database = LocalDatabase()
+        database.reference("/").update({
+            "2020-01-06/EPHEC01/M01": {"waterLiters": 4.0, "plasticRecycledGrams": 42},
+            f"{today}/EPHEC02/M02": {"waterLiters": 1.0},
+        })
+        replica = Replica(analytics, main.live_feed, main.sync_replica)
+        with patch('main.db', database), patch('main.replica', replica), \
+                patch.object(main.live_feed, 'keep_open', True):
+            try:
+                replica.check()
+                self._wait(lambda: main.live_feed.day_node(today) is not None)
+                reads = database.reads
+
+                admin = {"email": "a@jemlo.be", "role": "super_admin"}
+                stats = await get_dashboard_stats(admin=admin)
+                fountains = await get_fountains_for_org(compact=True, admin=admin)
+                item = TestClient(app).get(f"/api/read-item/{today}").json()
+                assert database.reads == reads
+
+                assert stats == {"active_fountains": 2, "total_water": 5.0,
+                                 "total_plastic": 42.0, "bottles_saved": 1}
+                assert fountains["total_dates"] == 2
+                assert {m["machine_id"]: m["days_seen"] for m in fountains["machines"]} == {"M01": 1, "M02": 1}
+                assert item == {"EPHEC02": {"M02": {"waterLiters": 1.0}}}
+
+                # Nothing changed: the aggregations are not run again
+                with patch.object(analytics, "machine_totals", side_effect=AssertionError):
+                    assert await get_fountains_for_org(compact=True, admin=admin) == fountains
+
+                # Written by another worker: pushed by the listener, not polled
+                database.reference(f"/{today}/EPHEC02/M02").update({"waterLiters": 3.0})
+                self._wait(lambda: analytics.totals()["waterLiters"] == 7.0)
+                stats = await get_dashboard_stats(admin=admin)
+                assert stats["total_water"] == 7.0
+                assert main.replica.stats()["fresh"] == 1
+            finally:
+                main.live_feed.close()
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_firebase_when_not_fresh(self):
+        import main
+        database = LocalDatabase()
+        database.reference("/").update({"rollups/total": {"waterLiters": 3.0, "fountains": 1}, "migrations/rollups": 1})
+        with patch('main.db', database), patch('main.replica', Replica(analytics, main.live_feed, main.sync_replica)):
+            stats = await get_dashboard_stats(admin={"email": "a@jemlo.be"})
+
+        assert stats["total_water"] == 3.0
+
+
+class TestConditionalGet:
+    """ETag / 304 and gzip on the polled dashboard endpoints"""
+
+    def _client(self):
+        client = TestClient(app)
+        client.cookies.set("access_token", create_access_token({"sub": "a@jemlo.be", "role": "super_admin"}))
+        return client
+
+    def _database(self, water=2.0):
+        database = LocalDatabase()
+        database.reference("/").update({
+            "rollups/total": {"waterLiters": water, "fountains": 1},
+            "rollups/version": 1,
+            "migrations/rollups": 1,
+        })
+        return database
+
+    def test_unchanged_stats_answered_304_without_firebase(self):
+        database = self._database()
+        with patch('main.db', database):
+            client = self._client()
+            first = client.get("/api/admin/stats_total")
+            reads = database.reads
+            etag = first.headers["ETag"]
+            second = client.get("/api/admin/stats_total", headers={"If-None-Match": etag})
+
+        assert first.status_code == 200
+        assert first.headers["Cache-Control"] == "private, no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+        assert database.reads == reads  # first request only
+
+    def test_write_changes_the_etag(self):
+        database = self._database()
+        with patch('main.db', database):
+            client = self._client()
+            etag = client.get("/api/admin/stats_total").headers["ETag"]
+
+            # Same data read again after the entry was dropped: still valid
+            invalidate_dashboard_cache("2025-12-01", "EPHEC01")
+            assert client.get("/api/admin/stats_total", headers={"If-None-Match": etag}).status_code == 304
+
+            database.reference("/").update({"rollups/total/waterLiters": 3.0, "rollups/version": 2})
+            invalidate_dashboard_cache("2025-12-01", "EPHEC01")
+            response = client.get("/api/admin/stats_total", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["total_water"] == 3.0
+
+    def test_another_worker_answers_304(self):
+        """The ETag is the shared /rollups/version, not a per-process counter"""
+        import main
+        database = self._database()
+        with patch('main.db', database):
+            etag = self._client().get("/api/admin/stats_total").headers["ETag"]
+            dashboard_cache.clear()
+            with patch.object(main, "response_versions", ResponseVersions()):
+                response = self._client().get("/api/admin/stats_total", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+
+    def test_large_responses_are_gzipped(self):
+        database = LocalDatabase()
+        database.reference("/").update({
+            f"2025-{month:02d}-{day:02d}/EPHEC01/M01": {"waterLiters": 1.0}
+            for month in range(1, 13) for day in range(1, 29)
+        })
+        with patch('main.db', database):
+            response = self._client().get("/api/admin/fountain_graph", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert len(response.json()["dates"]) == 12 * 28
+
+
+class TestProductionMode:
+    """App factory, lazy Firebase initialisation and warm-up"""
+
+    def test_ready_only_after_warm_up(self):
+        import main
+        database = LocalDatabase()
+        database.reference("/").update({"rollups/total": {"waterLiters": 3.0, "fountains": 1}, "migrations/rollups": 1})
+        client = TestClient(main.create_app())
+        with patch.dict(main.startup, ready=False), patch('main.db', database):
+            assert client.get("/ready").status_code == 503
+            main.warm_up(time.perf_counter())
+            response = client.get("/ready")
+
+        assert response.status_code == 200
+        assert response.json()["startup_seconds"] >= 0
+        assert dashboard_cache.get(("stats_total",))["total_water"] == 3.0
+
+    def test_firebase_initialised_once_on_first_access(self):
+        import main
+        with patch('main.firebase_initialized', False), patch('main.firebase_admin') as mock_admin:
+            database = main.FirebaseDatabase()
+            mock_admin.initialize_app.assert_not_called()
+            database.reference("/a")
+            database.reference("/b")
+        mock_admin.initialize_app.assert_called_once()
@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from metrics import InstrumentedDatabase, Registry, payload_bytes
+from storage import LocalDatabase
+from applog import JsonFormatter, RateSampler
+
+
+def make_db(measure_payload=True):
+    registry = Registry()
+    calls = registry.counter("db_calls_total", "calls", ("op", "outcome"))
+    latency = registry.histogram("db_call_seconds", "latency", ("op",))
+    payload = registry.counter("db_payload_bytes_total", "bytes", ("op", "direction"))
+    return registry, InstrumentedDatabase(LocalDatabase(), calls, latency, payload, measure_payload)
+
+
+def record(msg, level=logging.INFO, **extra):
+    entry = logging.LogRecord("jemlo.test", level, __file__, 1, msg, (), None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+class TestRegistry:
+    """Unit tests for the Prometheus text output"""
+
+    def test_counter_and_histogram_render(self):
+        registry = Registry()
+        requests = registry.counter("http_requests_total", "Requests", ("route", "status"))
+        latency = registry.histogram("http_request_seconds", "Latency", ("route",), buckets=(0.1, 1))
+        requests.inc("/api/x", "200")
+        requests.inc("/api/x", "200")
+        latency.observe(0.05, "/api/x")
+        latency.observe(0.5, "/api/x")
+
+        lines = registry.render().splitlines()
+        assert "# TYPE http_requests_total counter" in lines
+        assert 'http_requests_total{route="/api/x",status="200"} 2' in lines
+        assert 'http_request_seconds_bucket{route="/api/x",le="0.1"} 1' in lines
+        assert 'http_request_seconds_bucket{route="/api/x",le="1"} 2' in lines
+        assert 'http_request_seconds_bucket{route="/api/x",le="+Inf"} 2' in lines
+        assert 'http_request_seconds_count{route="/api/x"} 2' in lines
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.counter("c", "help", ("v",)).inc('a"b\\c\n')
+        assert 'c{v="a\\"b\\\\c\\n"} 1' in registry.render()
+
+    def test_stats_become_gauges_and_a_broken_collector_is_skipped(self):
+        registry = Registry()
+        registry.gauges("cache", "Caches", lambda: {"hits": 3, "name": "x", "enabled": True}, {"cache": "a"})
+        registry.gauges("cache", "Caches", lambda: {"hits": 5}, {"cache": "b"})
+        registry.gauges("broken", "Broken", lambda: 1 / 0)
+
+        text = registry.render()
+        assert text.count("# TYPE cache_hits gauge") == 1
+        assert 'cache_hits{cache="a"} 3' in text and 'cache_hits{cache="b"} 5' in text
+        assert "cache_name" not in text and "cache_enabled" not in text and "broken" not in text
+
+
+class TestInstrumentedDatabase:
+    """Unit tests for the database call metrics"""
+
+    def test_calls_latency_and_payload_are_recorded(self):
+        registry, db = make_db()
+        value = {"waterLiters": 1.5}
+        db.reference("/2025-12-01/EPHEC01").child("M01").set(value)
+        db.reference("/").update({"rollups/total/waterLiters": 1.5})
+        assert db.reference("/2025-12-01/EPHEC01/M01").get() == value
+        days = db.reference("/").order_by_key().start_at("2025-01-01").end_at("2025-12-31").get()
+        pushed = db.reference("/logs").push({"message": "x"})
+
+        assert list(days) == ["2025-12-01"]
+        assert pushed.key and db.reference(f"/logs/{pushed.key}/message").get() == "x"
+        assert db.calls.value("set", "ok") == 1
+        assert db.calls.value("query", "ok") == 1
+        assert db.calls.value("get", "ok") == 2
+        assert db.latency.count("update") == 1
+        assert db.payload.value("set", "sent") == payload_bytes(value)
+        assert db.payload.value("get", "received") == payload_bytes(value) + payload_bytes("x")
+        assert 'db_calls_total{op="push",outcome="ok"} 1' in registry.render()
+
+    def test_errors_are_counted_and_raised(self):
+        _, db = make_db()
+        try:
+            db.reference("/a").update("not a dict")
+        except Exception:
+            pass
+        else:
+            raise AssertionError("update should fail")
+        assert db.calls.value("update", "error") == 1
+        assert db.latency.count("update") == 1
+
+    def test_payload_measure_can_be_disabled(self):
+        _, db = make_db(measure_payload=False)
+        db.reference("/a").set({"b": 1})
+        assert db.reference("/a").get() == {"b": 1}
+        assert db.payload.value("set", "sent") == 0
+        assert db.payload.value("get", "received") == 0
+
+
+class TestStructuredLogging:
+    """Unit tests for the JSON formatter and the rate sampler"""
+
+    def test_json_line_with_extra_fields(self):
+        line = JsonFormatter().format(record("Login attempt", email="a@jemlo.be"))
+        entry = json.loads(line)
+        assert entry["level"] == "INFO"
+        assert entry["msg"] == "Login attempt"
+        assert entry["email"] == "a@jemlo.be"
+
+    def test_sampler_drops_repeats_but_never_warnings(self):
+        sampler = RateSampler(per_second=2)
+        kept = [sampler.filter(record("read_item")) for _ in range(5)]
+        assert kept.count(True) == 2
+        assert sampler.filter(record("other message"))
+        assert sampler.filter(record("read_item failed", level=logging.ERROR))
+        assert sampler.dropped == 3
@@ -0,0 +1,62 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from ratelimit import Limiter, MemoryBackend, SQLiteBackend
+
+
+class TestLimiter:
+    """Unit tests for the sliding-window rate limiter"""
+
+    def test_allow_up_to_limit_then_refuse(self):
+        limiter = Limiter(MemoryBackend(), limit=3, window=60)
+        results = [limiter.allow("1.2.3.4", now=1000 + i) for i in range(4)]
+
+        assert results[:3] == [0.0, 0.0, 0.0]
+        assert results[3] > 0
+        assert limiter.allow("5.6.7.8", now=1004) == 0.0
+
+    def test_previous_window_weight_slides_out(self):
+        limiter = Limiter(MemoryBackend(), limit=4, window=60)
+        for i in range(4):
+            limiter.allow("ip", now=60 + i)
+
+        # start of the next window: the 4 previous hits still weigh ~4
+        assert limiter.allow("ip", now=121) == 0.0
+        assert limiter.allow("ip", now=122) > 0
+        # half-way: they weigh 2, room for 2 more
+        assert limiter.allow("ip", now=150) == 0.0
+        assert limiter.allow("ip", now=151) == 0.0
+        assert limiter.allow("ip", now=152) > 0
+
+    def test_failed_logins_block_for_block_seconds(self):
+        limiter = Limiter(MemoryBackend(), limit=5, window=7200, block_seconds=7200)
+        hits = [limiter.hit("ip", now=100 + i) for i in range(5)]
+
+        assert hits[:4] == [0.0] * 4
+        assert hits[4] == 7200
+        assert limiter.check("ip", now=3700) == 3600 + 4
+        assert limiter.check("other", now=3700) == 0.0
+
+    def test_memory_backend_evicts_expired_and_bounds_size(self):
+        backend = MemoryBackend(max_keys=2)
+        limiter = Limiter(backend, limit=10, window=60)
+        limiter.allow("a", now=0)
+        limiter.allow("b", now=1)
+        limiter.allow("c", now=2)
+        assert len(backend) == 2
+
+        limiter.allow("d", now=1000)
+        assert len(backend) == 1
+
+    def test_sqlite_backend_is_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / "ratelimit.db")
+        worker_1 = Limiter(SQLiteBackend(path), limit=2, window=60, namespace="write")
+        worker_2 = Limiter(SQLiteBackend(path), limit=2, window=60, namespace="write")
+
+        assert worker_1.allow("ip", now=10) == 0.0
+        assert worker_2.allow("ip", now=11) == 0.0
+        assert worker_1.allow("ip", now=12) > 0
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from livefeed import LiveFeed
+from replica import Replica
+from timeseries import TimeSeriesStore
+
+
+class FakeListener:
+    """Stands in for db.reference(path).listen(callback)"""
+
+    def __init__(self, fail=False):
+        self.paths = []
+        self.callbacks = []
+        self.closed = 0
+        self.fail = fail
+
+    def listen(self, path, callback):
+        if self.fail:
+            raise ConnectionError("firebase unreachable")
+        self.paths.append(path)
+        self.callbacks.append(callback)
+        return SimpleNamespace(close=self.close)
+
+    def close(self):
+        self.closed += 1
+
+    def send(self, event_type, path, data):
+        self.callbacks[-1](SimpleNamespace(event_type=event_type, path=path, data=data))
+
+
+class TestReplica:
+    """Unit tests for the listener-fed replica of the date tree"""
+
+    def _replica(self, listener, today, **options):
+        store = TimeSeriesStore()
+        store.load_tree({"2025-12-01": {"EPHEC01": {"M01": {"waterLiters": 1.0}}}})
+        feed = LiveFeed(listener.listen, lambda rows: [store.upsert(*row) for row in rows],
+                        today=lambda: today[0], keep_open=True)
+        synced = []
+        return Replica(store, feed, synced.append, **options), synced
+
+    def test_sync_then_listen_and_reopen_at_midnight(self):
+        listener, today = FakeListener(), ["2025-12-02"]
+        replica, synced = self._replica(listener, today)
+        assert not replica.fresh()
+
+        replica.check()
+        replica.check()
+        assert synced == [None]
+        assert listener.paths == ["/2025-12-02"]
+        assert replica.fresh()
+
+        listener.send("put", "/", {"EPHEC01": {"M01": {"waterLiters": 2.5}}})
+        assert replica.store.totals()["waterLiters"] == 3.5
+        assert replica.feed.day_node("2025-12-02") == {"EPHEC01": {"M01": {"waterLiters": 2.5}}}
+
+        # Next day: the day listened to is read again before switching
+        today[0] = "2025-12-03"
+        replica.check()
+        assert synced == [None, "2025-12-02"]
+        assert listener.paths[-1] == "/2025-12-03"
+        assert listener.closed == 1
+        assert replica.feed.day_node("2025-12-03") is None  # nothing received yet
+
+    def test_stale_when_the_listener_cannot_be_opened(self):
+        replica, _ = self._replica(FakeListener(fail=True), ["2025-12-02"])
+        with pytest.raises(ConnectionError):
+            replica.check()
+        assert replica.staleness() is None
+        assert not replica.fresh()
+
+        listener = FakeListener()
+        replica, _ = self._replica(listener, ["2025-12-02"], max_staleness=0.05)
+        replica.check()
+        assert replica.fresh()
+        time.sleep(0.1)
+        assert not replica.fresh()
+        assert replica.stats()["staleness_seconds"] >= 0.05
+
+        listener.send("put", "/EPHEC01/M02", {"waterLiters": 1.0})
+        assert replica.fresh()
+
+    def test_partial_store_is_not_a_replica(self):
+        replica, _ = self._replica(FakeListener(), ["2025-12-02"])
+        replica.store.since = "2025-11-01"
+        replica.check()
+        assert not replica.fresh()
+
+    def test_periodic_save(self):
+        saves = []
+        replica, _ = self._replica(FakeListener(), ["2025-12-02"], save=lambda: saves.append(1),
+                                   interval=0.01, save_interval=0.02)
+        replica.start()
+        time.sleep(0.1)
+        replica.stop()
+
+        assert saves
+        assert replica.stats()["failures"] == 0
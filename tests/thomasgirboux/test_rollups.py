@@ -0,0 +1,127 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from rollups import (
+    build_rollups, event_updates, dashboard_stats, increment,
+    by_org_updates, fountain_machines, rollup_machines, compact_machines,
+)
+
+
+SAMPLE_TREE = {
+    "2025-12-01": {
+        "EPHEC01": {
+            "M01": {"bottleNumber": 2, "waterLiters": 2.0, "plasticRecycledGrams": 84},
+            "M02": {"bottleNumber": 1, "waterLiters": 1.0, "plasticRecycledGrams": 42},
+        }
+    },
+    "2025-12-02": {
+        "EPHEC01": {"M01": {"bottleNumber": 3, "waterLiters": 3.5, "plasticRecycledGrams": 126}},
+        "UCL": {"M01": {"bottleNumber": 1, "waterLiters": 0.5, "plasticRecycledGrams": 0}},
+    },
+    "users": {"uid-1": {"email": "a@jemlo.be"}},
+    "logs": {"-abc": {"message": "hello"}},
+}
+
+
+class TestBuildRollups:
+    """Unit tests for the full rollup rebuild"""
+
+    def test_empty_tree(self):
+        """An empty database still produces a total node"""
+        rollup = build_rollups({})
+        assert rollup == {"total": {
+            "bottleNumber": 0, "waterLiters": 0.0, "plasticRecycledGrams": 0.0, "fountains": 0
+        }}
+
+    def test_totals_match_full_scan(self):
+        """Totals per day, organisation and machine, non-date keys ignored"""
+        rollup = build_rollups(SAMPLE_TREE)
+
+        assert rollup["total"]["waterLiters"] == 7.0
+        assert rollup["total"]["plasticRecycledGrams"] == 252
+        assert rollup["total"]["fountains"] == 3
+        assert rollup["days"]["2025-12-02"]["waterLiters"] == 4.0
+        assert rollup["orgs"]["EPHEC01"]["total"]["fountains"] == 2
+        assert rollup["orgs"]["UCL"]["days"]["2025-12-02"]["bottleNumber"] == 1
+
+        m01 = rollup["machines"]["EPHEC01"]["M01"]
+        assert m01["waterLiters"] == 5.5
+        assert (m01["firstSeen"], m01["lastSeen"], m01["days"]) == ("2025-12-01", "2025-12-02", 2)
+
+    def test_dashboard_stats_shape(self):
+        """The stats endpoint response is computed from the total node only"""
+        stats = dashboard_stats(build_rollups(SAMPLE_TREE)["total"])
+        assert stats == {
+            "active_fountains": 3,
+            "total_water": 7.0,
+            "total_plastic": 252.0,
+            "bottles_saved": 6,
+        }
+
+
+class TestEventUpdates:
+    """Unit tests for the per-write rollup update"""
+
+    def test_first_reading_of_new_machine(self):
+        """A brand new machine bumps the fountain counters and its day count"""
+        updates = event_updates(
+            "2025-12-03", "EPHEC01", "M03",
+            {"bottleNumber": 1, "waterLiters": 1.0, "plasticRecycledGrams": 42},
+            previous=None, machine_known=False,
+        )
+
+        assert updates["2025-12-03/EPHEC01/M03"]["waterLiters"] == 1.0
+        assert updates["by_org/EPHEC01/2025-12-03/M03"] == updates["2025-12-03/EPHEC01/M03"]
+        assert updates["rollups/total/waterLiters"] == increment(1.0)
+        assert updates["rollups/orgs/EPHEC01/days/2025-12-03/bottleNumber"] == increment(1)
+        assert updates["rollups/total/fountains"] == increment(1)
+        assert updates["rollups/machines/EPHEC01/M03/days"] == increment(1)
+        assert updates["rollups/machines/EPHEC01/M03/firstSeen"] == "2025-12-03"
+
+    def test_cumulative_reading_sends_difference(self):
+        """Readings are cumulative per day, only the difference is added"""
+        updates = event_updates(
+            "2025-12-03", "EPHEC01", "M01",
+            {"bottleNumber": 3, "waterLiters": 3.5, "plasticRecycledGrams": 126},
+            previous={"bottleNumber": 2, "waterLiters": 2.0, "plasticRecycledGrams": 126},
+        )
+
+        assert updates["rollups/days/2025-12-03/waterLiters"] == increment(1.5)
+        assert updates["rollups/machines/EPHEC01/M01/bottleNumber"] == increment(1)
+        # unchanged field and already known machine: nothing to add
+        assert "rollups/total/plasticRecycledGrams" not in updates
+        assert "rollups/total/fountains" not in updates
+        assert "rollups/machines/EPHEC01/M01/days" not in updates
+
+
+class TestByOrgIndex:
+    """Unit tests for the /by_org index and the fountains listing"""
+
+    def test_backfill_updates_copy_each_org_day(self):
+        updates = by_org_updates(SAMPLE_TREE)
+        assert sorted(updates) == [
+            "by_org/EPHEC01/2025-12-01", "by_org/EPHEC01/2025-12-02", "by_org/UCL/2025-12-02",
+        ]
+        assert updates["by_org/UCL/2025-12-02"]["M01"]["waterLiters"] == 0.5
+
+    def test_fountain_machines_merges_ids_across_orgs(self):
+        machines = {m["machine_id"]: m for m in fountain_machines(SAMPLE_TREE)}
+        assert machines["M01"]["water_liters"] == 6.0
+        assert machines["M01"]["dates_seen"] == ["2025-12-01", "2025-12-02", "2025-12-02"]
+        assert machines["M01"]["organisations"] == ["EPHEC01", "UCL"]
+
+    def test_rollup_machines_from_the_machine_rollups(self):
+        machines = rollup_machines(build_rollups(SAMPLE_TREE)["machines"])
+        m01 = next(m for m in machines if m["machine_id"] == "M01")
+        assert m01["water_liters"] == 6.0
+        assert (m01["first_seen"], m01["last_seen"], m01["days_seen"]) == ("2025-12-01", "2025-12-02", 3)
+        assert m01["organisations"] == ["EPHEC01", "UCL"]
+
+    def test_compact_machines_has_the_rollup_shape(self):
+        compact = {m["machine_id"]: m for m in compact_machines(fountain_machines(SAMPLE_TREE))}
+        rollup = {m["machine_id"]: m for m in rollup_machines(build_rollups(SAMPLE_TREE)["machines"])}
+        assert compact == rollup
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from snapshots import DaySnapshots, decode, is_day
+
+
+class TestDaySnapshots:
+    """Unit tests for the sealed days of read_item"""
+
+    def test_sealed_day_survives_a_restart(self, tmp_path):
+        day = {"EPHEC01": {"M01": {"waterLiters": 1.5}}}
+        DaySnapshots(str(tmp_path)).seal("2025-12-01", day)
+
+        reopened = DaySnapshots(str(tmp_path))
+        assert reopened.is_sealed("2025-12-01")
+        assert decode(reopened.get("2025-12-01")) == day
+        assert decode(reopened.get("2025-12-01")) == day
+        assert (reopened.stats()["file_reads"], reopened.stats()["hits"]) == (1, 1)
+        assert reopened.get("2025-12-02") is None
+
+    def test_lru_bounded_without_directory(self):
+        snapshots = DaySnapshots(max_entries=2)
+        for day in ("2025-12-01", "2025-12-02", "2025-12-03"):
+            snapshots.seal(day, {"day": day})
+
+        assert snapshots.get("2025-12-01") is None
+        assert decode(snapshots.get("2025-12-03")) == {"day": "2025-12-03"}
+
+    def test_only_date_keys_become_files(self, tmp_path):
+        assert is_day("2025-12-01")
+        assert not is_day("20../../etc")
+        assert not is_day("20251201")
+        with pytest.raises(ValueError):
+            DaySnapshots(str(tmp_path)).seal("20../../ab", {})
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,211 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from ingest import LATEST_BATCH, WriteBuffer
+from spool import DELTA, READING, Spool, SpoolFullError, SpoolReplayer
+from rollups import increment
+from test_ingest import FakeFirebase, reading
+
+
+class TestSpool:
+    """Unit tests for the readings write-ahead spool"""
+
+    def test_append_peek_ack_in_order(self):
+        spool = Spool()
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))])
+        spool.append_many([("2025-12-01", "EPHEC01", "M02", reading(2, 2.0, 84)),
+                           ("2025-12-01", "EPHEC01", "M01", reading(3, 3.0, 126))])
+
+        last_seq, rows = spool.peek(2)
+        assert [machine for _, _, _, machine, _ in rows] == ["M01", "M02"]
+        assert rows[0] == (READING, "2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))
+        spool.ack(last_seq)
+        assert spool.pending() == 1
+        assert spool.peek(10)[1][0][4] == reading(3, 3.0, 126)
+
+    def test_same_idempotency_key_is_appended_once(self):
+        spool = Spool()
+        rows = [("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))]
+        assert spool.append_many(rows, key="req-1") == 1
+        assert spool.append_many(rows, key="req-1") == 0
+        assert spool.append_many(rows) == 1
+        assert spool.pending() == 2
+        assert spool.stats()["duplicates"] == 1
+
+    def test_idempotency_keys_are_scoped(self):
+        """Another client (or endpoint) reusing a key is not a retry"""
+        spool = Spool()
+        rows = [("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))]
+        assert spool.append_many(rows, key="1", scope="/api/create-items 10.0.0.1") == 1
+        assert spool.append_many(rows, key="1", scope="/api/create-items 10.0.0.2") == 1
+        assert spool.append_many(rows, key="1", scope="/api/create-deltas 10.0.0.1", kind=DELTA) == 1
+        assert spool.append_many(rows, key="1", scope="/api/create-items 10.0.0.1") == 0
+
+    def test_full_spool_rejects_whole_batch(self):
+        spool = Spool(max_events=2)
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))])
+        with pytest.raises(SpoolFullError):
+            spool.append_many([("2025-12-01", "EPHEC01", f"M0{i}", reading(1, 1.0, 42)) for i in (2, 3)],
+                              key="req-2")
+        assert spool.pending() == 1
+        # the key of the rejected request can be used again
+        assert spool.append_many([("2025-12-01", "EPHEC01", "M02", reading(1, 1.0, 42))], key="req-2") == 1
+
+    def test_spool_file_before_kinds_and_scopes_is_migrated(self, tmp_path):
+        import sqlite3
+        path = str(tmp_path / "spool.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE events (seq INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,"
+                     " org TEXT NOT NULL, machine TEXT NOT NULL, reading TEXT NOT NULL, created_at REAL NOT NULL)")
+        conn.execute("INSERT INTO events (date, org, machine, reading, created_at)"
+                     " VALUES ('2025-12-01', 'EPHEC01', 'M01', '{}', 0)")
+        conn.execute("CREATE TABLE idempotency_keys (key TEXT PRIMARY KEY, created_at REAL NOT NULL)")
+        conn.commit()
+        conn.close()
+
+        spool = Spool(path)
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))], key="req-1", kind=DELTA)
+        assert [row[0] for row in spool.peek(10)[1]] == [READING, DELTA]
+
+    def test_file_spool_survives_a_restart(self, tmp_path):
+        path = str(tmp_path / "spool.sqlite")
+        spool = Spool(path)
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))], key="req-1")
+        spool.close()
+
+        reopened = Spool(path)
+        assert reopened.pending() == 1
+        assert reopened.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))], key="req-1") == 0
+
+    def test_lease_lets_one_worker_replay(self, tmp_path):
+        path = str(tmp_path / "spool.sqlite")
+        first, second = Spool(path), Spool(path)
+        assert first.claim("worker-1", ttl=10)
+        assert not second.claim("worker-2", ttl=10)
+        first.release("worker-1")
+        assert second.claim("worker-2", ttl=10)
+
+
+class TestSpoolReplayer:
+    """Unit tests for the spool replay to Firebase"""
+
+    def test_drain_writes_and_acks(self):
+        fb = FakeFirebase()
+        spool = Spool()
+        replayer = SpoolReplayer(spool, WriteBuffer(fb.read, fb.write), batch_size=2)
+        spool.append_many([("2025-12-01", "EPHEC01", f"M0{i}", reading(1, 1.0, 42)) for i in (1, 2, 3)])
+
+        assert replayer.drain() == 3
+        assert len(fb.writes) == 2
+        assert spool.pending() == 0
+
+    def test_failed_replay_keeps_readings_in_the_spool(self):
+        fb = FakeFirebase()
+        spool = Spool()
+        replayer = SpoolReplayer(spool, WriteBuffer(fb.read, fb.write))
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))])
+
+        fb.fail = True
+        with pytest.raises(ConnectionError):
+            replayer.drain()
+        assert spool.pending() == 1
+
+        fb.fail = False
+        assert replayer.drain() == 1
+        assert spool.pending() == 0
+        assert fb.writes[0]["rollups/total/waterLiters"] == increment(1.0)
+
+    def test_stop_drains_what_is_left(self):
+        fb = FakeFirebase()
+        spool = Spool()
+        replayer = SpoolReplayer(spool, WriteBuffer(fb.read, fb.write), interval=60)
+        replayer.start()
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 1.0, 42))])
+        replayer.stop()
+
+        assert spool.pending() == 0
+        assert len(fb.writes) == 1
+
+    def test_deltas_and_readings_replayed_in_order(self):
+        fb = FakeFirebase()
+        spool = Spool()
+        replayer = SpoolReplayer(spool, WriteBuffer(fb.read, fb.write))
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))] * 2, kind=DELTA)
+        spool.append_many([("2025-12-01", "EPHEC01", "M02", reading(5, 2.0, 210))])
+
+        assert replayer.drain() == 3
+        updates = fb.writes[0]
+        assert updates["2025-12-01/EPHEC01/M01/waterLiters"] == increment(1.0)
+        assert updates["2025-12-01/EPHEC01/M02"] == reading(5, 2.0, 210)
+
+    def test_rows_of_a_failed_flush_are_not_queued_twice(self):
+        """A retry flushes what the buffer holds instead of adding the deltas again"""
+        fb = FakeFirebase()
+        spool = Spool()
+        replayer = SpoolReplayer(spool, WriteBuffer(fb.read, fb.write))
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))], kind=DELTA)
+
+        fb.fail = True
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                replayer.drain()
+        fb.fail = False
+        spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 0.5, 42))], kind=DELTA)
+
+        assert replayer.drain() == 2
+        increments = [u["2025-12-01/EPHEC01/M01/waterLiters"] for u in fb.writes]
+        assert increments == [increment(0.5), increment(0.5)]
+        assert spool.pending() == 0
+
+    def test_lost_lease_stops_the_write(self, tmp_path):
+        """A worker whose lease changed hands mid-flush sends nothing"""
+        path = str(tmp_path / "spool.sqlite")
+        fb = FakeFirebase()
+        first_spool, second_spool = Spool(path), Spool(path)
+        first_spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 5.0, 42))], kind=DELTA)
+        second = SpoolReplayer(second_spool, WriteBuffer(fb.read, fb.write))
+
+        def read(path, shallow):
+            if path == f"/{LATEST_BATCH}":
+                second_spool.claim(second.owner, 60)
+            return fb.read(path, shallow)
+
+        first = SpoolReplayer(first_spool, WriteBuffer(read, fb.write))
+        first.lease_seconds = 0
+        assert first.drain() == 0
+        assert fb.writes == []
+        assert second_spool.pending() == 1
+
+        assert second.drain() == 1
+        assert fb.tree["2025-12-01"]["EPHEC01"]["M01"]["waterLiters"] == 5.0
+        assert fb.tree["rollups"]["total"]["waterLiters"] == 5.0
+
+    @pytest.mark.parametrize("applied", [True, False])
+    def test_replay_after_a_failed_flush_with_the_lease_handed_over(self, tmp_path, applied):
+        """The new owner acks what the failed write applied and re-sends only the rest"""
+        path = str(tmp_path / "spool.sqlite")
+        fb = FakeFirebase()
+        first_spool, second_spool = Spool(path), Spool(path)
+        first_spool.append_many([("2025-12-01", "EPHEC01", "M01", reading(1, 5.0, 42))], kind=DELTA)
+
+        def lost_answer(updates):
+            if applied:
+                fb.write(updates)
+            raise ConnectionError("timeout")
+
+        first = SpoolReplayer(first_spool, WriteBuffer(fb.read, lost_answer))
+        with pytest.raises(ConnectionError):
+            first.drain()
+        first_spool.release(first.owner)
+
+        second = SpoolReplayer(second_spool, WriteBuffer(fb.read, fb.write))
+        second.drain()
+        assert second_spool.pending() == 0
+        assert len(fb.writes) == 1
+        assert fb.tree["2025-12-01"]["EPHEC01"]["M01"]["waterLiters"] == 5.0
+        assert fb.tree["rollups"]["total"]["waterLiters"] == 5.0
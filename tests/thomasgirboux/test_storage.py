@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+from storage import LocalDatabase
+from rollups import increment
+
+
+class TestLocalDatabase:
+    """Unit tests for the local Firebase RTDB stand-in"""
+
+    def test_multi_path_update_and_increments(self):
+        db = LocalDatabase()
+        db.reference("/").update({
+            "2025-12-01/EPHEC01/M01": {"waterLiters": 1.5},
+            "rollups/total/waterLiters": increment(1.5),
+        })
+        db.reference("/").update({"rollups/total/waterLiters": increment(2)})
+
+        assert db.reference("/2025-12-01/EPHEC01/M01/waterLiters").get() == 1.5
+        assert db.reference("rollups/total").get() == {"waterLiters": 3.5}
+
+    def test_deleting_the_last_child_removes_empty_parents(self):
+        db = LocalDatabase()
+        db.reference("/logs/a").set({"message": "x"})
+        db.reference("/").update({"logs/a": None, "users/u1": {}})
+
+        assert db.reference("/").get() is None
+        assert db.reference("/logs").get(shallow=True) is None
+
+    def test_ordered_queries_follow_firebase(self):
+        db = LocalDatabase()
+        keys = [db.reference("/logs").push({"n": i}).key for i in range(5)]
+        db.reference("/").update({"2025-12-01/X": 1, "2025-12-03/X": 3, "users/u1/x": 1, "10": 1, "9": 1})
+
+        assert list(db.reference("/logs").order_by_key().limit_to_last(2).get()) == keys[-2:]
+        days = db.reference("/").order_by_key().start_at("2000-01-01").end_at("2999-12-31").get()
+        assert list(days) == ["2025-12-01", "2025-12-03"]
+        # integer keys sort first, numerically
+        assert list(db.reference("/").order_by_key().limit_to_first(2).get()) == ["9", "10"]
+        by_child = db.reference("/logs").order_by_child("n").start_at(3).get()
+        assert [value["n"] for value in by_child.values()] == [3, 4]
+
+    def test_shallow_get(self):
+        db = LocalDatabase()
+        db.reference("/").update({"2025-12-01/X": 1, "count": 2})
+        assert db.reference("/").get(shallow=True) == {"2025-12-01": True, "count": 2}
+
+    def test_returned_values_are_copies(self):
+        db = LocalDatabase()
+        db.reference("/a").set({"b": 1})
+        db.reference("/a").get()["b"] = 2
+        assert db.reference("/a/b").get() == 1
+
+    def test_listen_sends_initial_value_then_writes(self):
+        db = LocalDatabase()
+        db.reference("/2025-12-01/EPHEC01/M01").set({"waterLiters": 1})
+        events = []
+        registration = db.reference("/2025-12-01").listen(events.append)
+        db.reference("/").update({"2025-12-01/EPHEC01/M02": {"waterLiters": 2}, "2025-12-02/X": 1})
+
+        deadline = time.time() + 2
+        while len(events) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        registration.close()
+
+        assert (events[0].event_type, events[0].path) == ("put", "/")
+        assert events[0].data == {"EPHEC01": {"M01": {"waterLiters": 1}}}
+        assert [(e.path, e.data) for e in events[1:]] == [("/EPHEC01/M02", {"waterLiters": 2})]
+
+    def test_sqlite_file_survives_a_restart(self, tmp_path):
+        path = str(tmp_path / "jemlo.sqlite")
+        db = LocalDatabase(path)
+        db.reference("/").update({
+            "2025-12-01/EPHEC01/M01": {"waterLiters": 1.5, "bottleNumber": 1},
+            "rollups/total/waterLiters": increment(1.5),
+            "by_org/EPHEC01/2025-12-01/M01": {"waterLiters": 1.5},
+        })
+        db.reference("/2025-12-01/EPHEC01/M01/bottleNumber").set(2)
+        db.reference("/by_org").delete()
+        db.close()
+
+        reopened = LocalDatabase(path)
+        assert reopened.reference("/").get() == {
+            "2025-12-01": {"EPHEC01": {"M01": {"waterLiters": 1.5, "bottleNumber": 2}}},
+            "rollups": {"total": {"waterLiters": 1.5}},
+        }
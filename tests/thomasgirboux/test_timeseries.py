@@ -0,0 +1,110 @@
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_PATH = os.path.join(ROOT, "Backend", "app")
+sys.path.append(APP_PATH)
+
+import rollups
+from timeseries import TimeSeriesStore, bucket
+
+TREE = {
+    "2025-12-02": {
+        "EPHEC01": {"M01": {"bottleNumber": 3, "waterLiters": 1.5, "plasticRecycledGrams": 60}},
+        "EPHEC02": {"M01": {"bottleNumber": 1, "waterLiters": 0.5, "plasticRecycledGrams": 20}},
+    },
+    "2025-12-01": {
+        "EPHEC01": {
+            "M01": {"bottleNumber": 2, "waterLiters": 1.0, "plasticRecycledGrams": 40},
+            "M02": {"bottleNumber": 4, "waterLiters": 2.25, "plasticRecycledGrams": 80},
+        },
+    },
+    "users": {"uid": {"email": "admin@jemlo.be"}},
+}
+
+
+class TestTimeSeriesStore:
+    """Unit tests for the columnar analytics store"""
+
+    def test_daily_water_sorted_by_date(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        assert store.daily_water() == (["2025-12-01", "2025-12-02"], [3.25, 2.0])
+        assert store.latest_date == "2025-12-02"
+
+    def test_machines_filtered_by_org_and_date(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+
+        machines, dates = store.machine_totals("EPHEC01")
+        assert dates == 2
+        by_id = {m["machine_id"]: m for m in machines}
+        assert by_id["M01"]["water_liters"] == 2.5
+        assert by_id["M01"]["dates_seen"] == ["2025-12-01", "2025-12-02"]
+        assert by_id["M02"]["plastic_grams"] == 80
+
+        machines, dates = store.machine_totals(date="2025-12-02")
+        assert dates == 1
+        assert machines[0]["organisations"] == ["EPHEC01", "EPHEC02"]
+        assert store.machine_totals("UNKNOWN") == ([], 0)
+
+    def test_compact_machine_totals(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        for org, date in ((None, None), ("EPHEC01", None), (None, "2025-12-02")):
+            machines, dates = store.machine_totals(org, date)
+            assert store.machine_totals(org, date, compact=True) == (rollups.compact_machines(machines), dates)
+
+    def test_version_changes_with_the_data(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        version = store.version
+        store.upsert("2025-12-01", "EPHEC01", "M01", {"bottleNumber": 2, "waterLiters": 1.0,
+                                                      "plasticRecycledGrams": 40})
+        assert store.version == version
+        store.upsert("2025-12-03", "EPHEC01", "M03", {})
+        assert store.version > version
+
+    def test_upsert_replaces_the_node_values(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        store.upsert("2025-12-02", "EPHEC01", "M01", {"waterLiters": 4.0})
+        store.upsert("2025-12-03", "EPHEC01", "M03", {"waterLiters": 1.0})
+
+        assert store.daily_water() == (["2025-12-01", "2025-12-02", "2025-12-03"], [3.25, 4.5, 1.0])
+        assert store.totals()["fountains"] == 4
+
+    def test_save_and_load_memory_mapped(self, tmp_path):
+        path = str(tmp_path / "analytics")
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        store.save(path)
+
+        restored = TimeSeriesStore()
+        restored.load(path)
+        assert isinstance(restored._cols["water"], np.memmap)
+        assert restored.daily_water() == store.daily_water()
+        assert restored.machine_totals("EPHEC01") == store.machine_totals("EPHEC01")
+
+        # Writing after a load copies the mapped columns first
+        restored.upsert("2025-12-01", "EPHEC01", "M01", {"waterLiters": 5.0})
+        assert restored.daily_water()[1] == [7.25, 2.0]
+
+    def test_upsert_returns_the_delta(self):
+        store = TimeSeriesStore()
+        store.load_tree(TREE)
+        delta = store.upsert("2025-12-01", "EPHEC01", "M01", {"bottleNumber": 3, "waterLiters": 1.5,
+                                                              "plasticRecycledGrams": 40})
+        assert delta == {"bottles": 1, "water": 0.5}
+        assert store.upsert("2025-12-01", "EPHEC01", "M01", {"bottleNumber": 3, "waterLiters": 1.5,
+                                                             "plasticRecycledGrams": 40}) is None
+        assert store.daily_water("EPHEC02") == (["2025-12-01", "2025-12-02"], [0.0, 0.5])
+
+    def test_bucket_by_week_and_month(self):
+        days = ["2025-11-30", "2025-12-01", "2025-12-07", "2025-12-08"]
+        assert bucket(days, [1.0, 2.0, 3.0, 4.0], "week") == (
+            ["2025-11-24", "2025-12-01", "2025-12-08"], [1.0, 5.0, 4.0]
+        )
+        assert bucket(days, [1.0, 2.0, 3.0, 4.0], "month") == (["2025-11", "2025-12"], [1.0, 9.0])